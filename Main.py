@@ -1,16 +1,187 @@
-import os
-import csv
-import json
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
+import os
 import threading
-import requests
-import re
-from pathlib import Path
+import bisect
+import queue
+from contextlib import nullcontext
 from datetime import datetime
-import hashlib
+
+from echonote import VaultEngine, format_file_size, format_timestamp, load_config, save_config
+from echonote.engine import validate_vault_name
+from echonote.gemini import CancelToken, RequestCancelled
+from echonote.markdown import MarkdownTokenizer, markdown_runs, merge_runs
+from echonote.scheduler import HIGH, NORMAL, QUEUED, RUNNING, RequestScheduler
+from echonote.tracing import describe_timings, format_duration
+from echonote.vectors import NUMPY_AVAILABLE
+
+
+def vault_label(name):
+    """Nome do cofre como aparece na interface ('' é o cofre principal)"""
+    return name or "principal"
+
+
+class MarkdownStreamRenderer:
+    """Renderiza Markdown no Text do chat à medida que os pedaços da resposta chegam"""
+
+    PENDING_MARK = 'markdown_pending'
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.tokenizer = MarkdownTokenizer()
+        self.buffer = ''
+        self.has_pending = False
+
+    def feed(self, chunk):
+        """Renderiza as linhas completas e mostra o resto da linha atual como texto provisório"""
+        self.clear_pending()
+        self.buffer += chunk
+        
+        *lines, self.buffer = self.buffer.split('\n')
+        runs = []
+        for line in lines:
+            runs.extend(self.tokenizer.line_runs(line))
+        self.insert_runs(runs)
+        
+        if self.buffer:
+            self.widget.mark_set(self.PENDING_MARK, 'end-1c')
+            self.widget.mark_gravity(self.PENDING_MARK, tk.LEFT)
+            self.widget.insert(tk.END, self.buffer, self.tokenizer.pending_tags())
+            self.has_pending = True
+
+    def close(self):
+        """Renderiza a última linha e fecha um bloco de código que ficou aberto"""
+        self.clear_pending()
+        if self.buffer:
+            self.insert_runs(self.tokenizer.line_runs(self.buffer))
+            self.buffer = ''
+        self.tokenizer.close()
+
+    def clear_pending(self):
+        if self.has_pending:
+            self.widget.delete(self.PENDING_MARK, 'end-1c')
+            self.has_pending = False
+
+    def insert_runs(self, runs):
+        """Insere todos os trechos com uma única chamada ao Tk"""
+        if runs:
+            self.widget.insert(tk.END, *merge_runs(runs))
+
+
+class NotesTableModel:
+    """Notas ordenadas e filtradas para a lista virtual da aba de notas
+
+    As chaves de ordenação de cada coluna são calculadas uma vez por nota; a ordem é
+    mantida com busca binária quando um escaneamento altera poucas notas, e o
+    total em bytes é atualizado pela diferença.
+    """
+
+    COLUMNS = ('título', 'caminho', 'tamanho', 'modificação')
+    # Acima desta fração de notas alteradas, reordenar tudo sai mais barato que inserir uma a uma
+    RESORT_RATIO = 0.25
+
+    def __init__(self):
+        self.notes = {}
+        self.sort_keys = {}
+        self.filter_keys = {}
+        self.ordered = []
+        self.rows = []
+        self.sort_column = 'caminho'
+        self.reverse = False
+        self.filter_text = ''
+        self.total_bytes = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def row(self, position):
+        return self.notes[self.rows[position]]
+
+    def reset(self, notes):
+        """Substitui todas as notas da lista"""
+        self.notes = {}
+        self.sort_keys = {}
+        self.filter_keys = {}
+        self.total_bytes = 0
+        for note in notes:
+            self.add(note)
+        self.resort()
+
+    def apply_changes(self, upserts, removed):
+        """Aplica o resultado de um escaneamento incremental sem refazer a lista inteira"""
+        column = self.COLUMNS.index(self.sort_column)
+        resort = len(upserts) + len(removed) > max(64, len(self.notes) * self.RESORT_RATIO)
+
+        for path in removed:
+            if path in self.notes:
+                self.discard(path, column, resort)
+        for note in upserts:
+            if note.path in self.notes:
+                self.discard(note.path, column, resort)
+            self.add(note)
+            if not resort:
+                bisect.insort(self.ordered, (self.sort_keys[note.path][column], note.path))
+
+        if resort:
+            self.resort()
+        else:
+            self.refilter()
+
+    def add(self, note):
+        path = note.path
+        self.notes[path] = note
+        self.sort_keys[path] = (note.title.casefold(), path.casefold(), note.size, note.mtime or 0)
+        self.filter_keys[path] = f"{note.title}\n{path}".casefold()
+        self.total_bytes += note.size
+
+    def discard(self, path, column, resort):
+        if not resort:
+            key = (self.sort_keys[path][column], path)
+            del self.ordered[bisect.bisect_left(self.ordered, key)]
+        self.total_bytes -= self.notes.pop(path).size
+        del self.sort_keys[path]
+        del self.filter_keys[path]
+
+    def sort(self, column):
+        """Ordena pela coluna; clicar de novo na mesma coluna inverte a ordem"""
+        if column == self.sort_column:
+            self.reverse = not self.reverse
+            self.rows.reverse()
+            return
+        self.sort_column = column
+        self.reverse = False
+        self.resort()
+
+    def resort(self):
+        column = self.COLUMNS.index(self.sort_column)
+        self.ordered = sorted((keys[column], path) for path, keys in self.sort_keys.items())
+        self.refilter()
+
+    def set_filter(self, text):
+        """Filtra por trecho do título ou do caminho, sem diferenciar maiúsculas"""
+        needle = text.strip().casefold()
+        previous, self.filter_text = self.filter_text, needle
+        # Digitando mais letras: basta filtrar de novo as linhas que já passaram
+        if previous and needle.startswith(previous):
+            self.rows = [path for path in self.rows if needle in self.filter_keys[path]]
+        else:
+            self.refilter()
+
+    def refilter(self):
+        needle = self.filter_text
+        if needle:
+            filter_keys = self.filter_keys
+            self.rows = [path for _, path in self.ordered if needle in filter_keys[path]]
+        else:
+            self.rows = [path for _, path in self.ordered]
+        if self.reverse:
+            self.rows.reverse()
+
 
 class ObsidianAIManager:
+    # Intervalo em que a thread do Tk lê os eventos da fila de perguntas
+    UI_EVENTS_INTERVAL_MS = 15
+    
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Obsidian AI Manager - Sistema de Anotações Inteligente")
@@ -33,15 +204,31 @@ class ObsidianAIManager:
         # Variáveis
         self.api_key = tk.StringVar()
         self.status_var = tk.StringVar(value="Pronto para usar")
-        self.notes_data = []
         self.config_file = "obsidian_config.json"
-        self.csv_file = "obsidian_notes.csv"
-        self.obsidian_path = r"C:"
+        self.ui_events = queue.Queue()
+        self.stream_renderers = {}
         
         # Carregar configurações
-        self.load_config()
+        self.config = load_config(self.config_file)
+        self.api_key.set(self.config['api_key'])
+        self.obsidian_path = self.config['obsidian_path']
+        
+        # Núcleo sem interface: notas, índices, cache e cliente da API
+        self.engine = VaultEngine(self.config)
+        self.engine.on_status = lambda message: self.root.after(0, self.update_status, message)
+        self.engine.on_progress = lambda percent: self.root.after(0, self.set_progress, percent)
+        
+        # Fila de perguntas: executa em paralelo, mas entrega as respostas na ordem de envio
+        self.scheduler = RequestScheduler(self.answer_question, self.config['max_parallel_requests'])
+        self.scheduler.post = self.post_to_ui
+        self.scheduler.on_chunk = self.show_answer_chunk
+        self.scheduler.on_result = self.show_answer
+        self.scheduler.on_error = self.show_answer_error
+        self.scheduler.on_cancelled = self.show_answer_cancelled
+        self.scheduler.on_queue_changed = self.update_request_queue
         
         # Criar interface
+        self.create_variables()
         self.create_interface()
         
         # Verificar se há notas para carregar
@@ -74,15 +261,52 @@ class ObsidianAIManager:
         # Aba principal - Chat com IA
         self.create_chat_tab()
         
-        # Aba de configurações
-        self.create_config_tab()
-        
-        # Aba de gerenciamento de notas
-        self.create_notes_tab()
+        # Abas de configurações e de notas: montadas na primeira vez que são abertas
+        self.tab_builders = {}
+        self.add_lazy_tab("⚙️ Configurações", self.create_config_tab)
+        self.add_lazy_tab("📝 Notas", self.create_notes_tab)
+        self.notebook.bind('<<NotebookTabChanged>>', self.build_selected_tab)
         
         # Barra de status
         self.create_status_bar(main_frame)
     
+    def create_variables(self):
+        """Cria as variáveis dos campos das abas, lidas pelo resto da interface mesmo antes de elas serem montadas"""
+        self.dir_var = tk.StringVar(value=self.obsidian_path)
+        self.ignore_var = tk.StringVar(value=', '.join(self.config['ignore_patterns']))
+        self.budget_var = tk.IntVar(value=self.config['context_token_budget'])
+        self.max_note_size_var = tk.IntVar(value=self.config['max_note_size_mb'])
+        self.stream_var = tk.BooleanVar(value=self.config['stream_responses'])
+        self.semantic_var = tk.BooleanVar(value=self.config['semantic_search'] and NUMPY_AVAILABLE)
+        self.link_boost_var = tk.BooleanVar(value=self.config['link_boost'])
+        self.collapse_duplicates_var = tk.BooleanVar(value=self.config['collapse_duplicates'])
+        self.broad_questions_var = tk.BooleanVar(value=self.config['broad_questions'])
+        self.scrollback_var = tk.IntVar(value=self.config['chat_scrollback_lines'])
+        
+        self.notes_model = NotesTableModel()
+        self.notes_filter_var = tk.StringVar()
+        self.notes_filter_var.trace_add('write', lambda *args: self.filter_notes())
+        self.notes_tree = None
+        self.scan_report = []
+        self.scan_report_tree = None
+        self.summary_token = None   # trabalho de resumos em andamento
+        self.summarize_btn = None
+        self.notes_offset = 0
+        self.notes_page_size = 15
+        self.selected_note_path = None
+    
+    def add_lazy_tab(self, text, builder):
+        """Adiciona uma aba vazia; `builder(frame)` preenche quando ela é aberta pela primeira vez"""
+        frame = ttk.Frame(self.notebook, style='Custom.TFrame')
+        self.notebook.add(frame, text=text)
+        self.tab_builders[str(frame)] = (builder, frame)
+    
+    def build_selected_tab(self, event=None):
+        """Monta a aba aberta, se ainda não foi montada"""
+        builder, frame = self.tab_builders.pop(self.notebook.select(), (None, None))
+        if builder is not None:
+            builder(frame)
+    
     def create_chat_tab(self):
         """Cria a aba principal do chat com IA"""
         chat_frame = ttk.Frame(self.notebook, style='Custom.TFrame')
@@ -119,9 +343,28 @@ class ObsidianAIManager:
         self.chat_history.tag_configure("quote", font=('Consolas', 10, 'italic'), foreground="#b0b0b0", lmargin1=20)
         self.chat_history.tag_configure("link", foreground="#66d9ff", underline=True)
         
+        # Fila de perguntas (só aparece quando há perguntas aguardando resposta)
+        self.queue_frame = ttk.LabelFrame(chat_frame, text="Fila de perguntas", style='Custom.TFrame')
+        self.queue_list = tk.Listbox(
+            self.queue_frame,
+            height=3,
+            bg=self.colors['secondary'],
+            fg=self.colors['fg'],
+            font=('Consolas', 9),
+            activestyle='none'
+        )
+        self.queue_list.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5, pady=5)
+        self.queue_list.bind('<Delete>', self.cancel_selected_request)
+        self.queue_list.bind('<Double-Button-1>', self.cancel_selected_request)
+        self.queue_progress = ttk.Progressbar(self.queue_frame, mode='indeterminate', length=80)
+        self.queue_progress.pack(side=tk.RIGHT, padx=5)
+        self.queue_tickets = []
+        
         # Frame inferior - entrada de mensagem
         input_frame = ttk.LabelFrame(chat_frame, text="Sua mensagem", style='Custom.TFrame')
         input_frame.pack(fill=tk.X, padx=5, pady=5)
+        self.input_frame = input_frame
+        
         
         # Campo de entrada de texto
         self.message_entry = tk.Text(
@@ -135,8 +378,20 @@ class ObsidianAIManager:
         )
         self.message_entry.pack(fill=tk.X, padx=5, pady=5)
         
+        # Cofres consultados nesta conversa (só aparece com mais de um cofre configurado)
+        self.vaults_frame = ttk.Frame(input_frame, style='Custom.TFrame')
+        self.conversation_vaults = {}
+        self.refresh_conversation_vaults()
+        
+        ttk.Label(
+            input_frame,
+            text="Filtros: tag:projeto  path:Pasta  after:7d  before:2024-01-01  campo:valor  (-tag:x exclui)",
+            style='Custom.TLabel'
+        ).pack(anchor=tk.W, padx=5)
+        
         # Binds para teclas
         self.message_entry.bind('<Return>', self.handle_enter)
+        self.message_entry.bind('<Shift-Return>', self.handle_priority_enter)
         self.message_entry.bind('<Control-Return>', self.insert_newline)
         
         # Frame para botões
@@ -152,6 +407,15 @@ class ObsidianAIManager:
         )
         send_btn.pack(side=tk.LEFT, padx=(0, 10))
         
+        # Botão parar
+        stop_btn = ttk.Button(
+            button_frame,
+            text="⏹️ Parar",
+            command=self.stop_requests,
+            style='Custom.TButton'
+        )
+        stop_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
         # Botão limpar chat
         clear_btn = ttk.Button(
             button_frame,
@@ -164,17 +428,15 @@ class ObsidianAIManager:
         # Label com instruções
         instruction_label = ttk.Label(
             button_frame,
-            text="💡 Dica: Use Ctrl+Enter para nova linha, Enter para enviar",
+            text="💡 Dica: Enter envia, Shift+Enter fura a fila, Ctrl+Enter nova linha",
             style='Custom.TLabel',
             font=('Arial', 9)
         )
         instruction_label.pack(side=tk.RIGHT)
     
-    def create_config_tab(self):
+    def create_config_tab(self, config_frame):
         """Cria a aba de configurações"""
-        config_frame = ttk.Frame(self.notebook, style='Custom.TFrame')
-        self.notebook.add(config_frame, text="⚙️ Configurações")
-        
+        self.vaults_list = None
         # Frame da API
         api_frame = ttk.LabelFrame(config_frame, text="Configuração da API Gemini", style='Custom.TFrame')
         api_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -208,7 +470,6 @@ class ObsidianAIManager:
         dir_entry_frame = ttk.Frame(dir_frame, style='Custom.TFrame')
         dir_entry_frame.pack(fill=tk.X, padx=5, pady=5)
         
-        self.dir_var = tk.StringVar(value=self.obsidian_path)
         dir_entry = ttk.Entry(
             dir_entry_frame,
             textvariable=self.dir_var,
@@ -225,6 +486,178 @@ class ObsidianAIManager:
         )
         browse_btn.pack(side=tk.RIGHT, padx=(5, 0))
         
+        ttk.Label(
+            dir_frame,
+            text="Ignorar (padrões glob separados por vírgula, além de .obsidian, .trash e .git):",
+            style='Custom.TLabel'
+        ).pack(anchor=tk.W, padx=5, pady=(5, 0))
+        
+        ignore_entry = ttk.Entry(
+            dir_frame,
+            textvariable=self.ignore_var,
+            style='Custom.TEntry',
+            font=('Consolas', 10)
+        )
+        ignore_entry.pack(fill=tk.X, padx=5, pady=5)
+        
+        size_frame = ttk.Frame(dir_frame, style='Custom.TFrame')
+        size_frame.pack(fill=tk.X)
+        
+        ttk.Label(
+            size_frame,
+            text="Ignorar notas maiores que (MB, 0 = sem limite):",
+            style='Custom.TLabel'
+        ).pack(side=tk.LEFT, padx=5, pady=(0, 5))
+        
+        max_size_spinbox = ttk.Spinbox(
+            size_frame,
+            from_=0,
+            to=4096,
+            increment=10,
+            textvariable=self.max_note_size_var,
+            width=6,
+            command=self.update_max_note_size
+        )
+        max_size_spinbox.bind('<FocusOut>', lambda event: self.update_max_note_size())
+        max_size_spinbox.pack(side=tk.LEFT, padx=5, pady=(0, 5))
+        
+        # Frame dos cofres adicionais: cada um com banco e índices próprios
+        vaults_frame = ttk.LabelFrame(config_frame, text="Cofres adicionais", style='Custom.TFrame')
+        vaults_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        self.vaults_list = tk.Listbox(
+            vaults_frame,
+            height=3,
+            bg=self.colors['secondary'],
+            fg=self.colors['fg'],
+            font=('Consolas', 9),
+            activestyle='none'
+        )
+        self.vaults_list.pack(fill=tk.X, padx=5, pady=5)
+        self.update_vaults_list()
+        
+        vault_entry_frame = ttk.Frame(vaults_frame, style='Custom.TFrame')
+        vault_entry_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
+        
+        ttk.Label(vault_entry_frame, text="Nome:", style='Custom.TLabel').pack(side=tk.LEFT)
+        self.vault_name_var = tk.StringVar()
+        ttk.Entry(
+            vault_entry_frame,
+            textvariable=self.vault_name_var,
+            style='Custom.TEntry',
+            font=('Consolas', 10),
+            width=15
+        ).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(vault_entry_frame, text="Diretório:", style='Custom.TLabel').pack(side=tk.LEFT)
+        self.vault_path_var = tk.StringVar()
+        ttk.Entry(
+            vault_entry_frame,
+            textvariable=self.vault_path_var,
+            style='Custom.TEntry',
+            font=('Consolas', 10)
+        ).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        
+        ttk.Button(
+            vault_entry_frame,
+            text="📂",
+            command=self.browse_vault_directory,
+            style='Custom.TButton',
+            width=3
+        ).pack(side=tk.LEFT)
+        ttk.Button(
+            vault_entry_frame,
+            text="➕ Adicionar",
+            command=self.add_vault,
+            style='Custom.TButton'
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(
+            vault_entry_frame,
+            text="➖ Remover",
+            command=self.remove_vault,
+            style='Custom.TButton'
+        ).pack(side=tk.LEFT, padx=(5, 0))
+        
+        # Frame do contexto enviado à IA
+        context_frame = ttk.LabelFrame(config_frame, text="Contexto enviado à IA", style='Custom.TFrame')
+        context_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        ttk.Label(
+            context_frame,
+            text="Orçamento de tokens para trechos das notas:",
+            style='Custom.TLabel'
+        ).pack(side=tk.LEFT, padx=5, pady=5)
+        
+        budget_spinbox = ttk.Spinbox(
+            context_frame,
+            from_=250,
+            to=32000,
+            increment=250,
+            textvariable=self.budget_var,
+            width=8,
+            command=self.update_context_budget
+        )
+        budget_spinbox.bind('<FocusOut>', lambda event: self.update_context_budget())
+        budget_spinbox.pack(side=tk.LEFT, padx=5, pady=5)
+        
+        stream_check = ttk.Checkbutton(
+            context_frame,
+            text="Mostrar resposta enquanto é gerada (streaming)",
+            variable=self.stream_var
+        )
+        stream_check.pack(side=tk.LEFT, padx=(20, 5), pady=5)
+        
+        semantic_check = ttk.Checkbutton(
+            context_frame,
+            text="Busca semântica local (TF-IDF/LSA)" if NUMPY_AVAILABLE else "Busca semântica (requer NumPy)",
+            variable=self.semantic_var,
+            state=tk.NORMAL if NUMPY_AVAILABLE else tk.DISABLED
+        )
+        semantic_check.pack(side=tk.LEFT, padx=(20, 5), pady=5)
+        
+        link_boost_check = ttk.Checkbutton(
+            context_frame,
+            text="Incluir notas ligadas por [[links]]",
+            variable=self.link_boost_var
+        )
+        link_boost_check.pack(side=tk.LEFT, padx=(20, 5), pady=5)
+        
+        collapse_duplicates_check = ttk.Checkbutton(
+            context_frame,
+            text="Omitir trechos quase iguais",
+            variable=self.collapse_duplicates_var
+        )
+        collapse_duplicates_check.pack(side=tk.LEFT, padx=(20, 5), pady=5)
+        
+        broad_questions_check = ttk.Checkbutton(
+            context_frame,
+            text="Perguntas amplas (\"resuma...\") usam resumos das notas",
+            variable=self.broad_questions_var
+        )
+        broad_questions_check.pack(side=tk.LEFT, padx=(20, 5), pady=5)
+        
+        # Frame do chat
+        chat_config_frame = ttk.LabelFrame(config_frame, text="Chat", style='Custom.TFrame')
+        chat_config_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        ttk.Label(
+            chat_config_frame,
+            text="Linhas mantidas no histórico (0 = sem limite):",
+            style='Custom.TLabel'
+        ).pack(side=tk.LEFT, padx=5, pady=5)
+        
+        scrollback_spinbox = ttk.Spinbox(
+            chat_config_frame,
+            from_=0,
+            to=100000,
+            increment=1000,
+            textvariable=self.scrollback_var,
+            width=8,
+            command=self.update_scrollback_limit
+        )
+        scrollback_spinbox.bind('<FocusOut>', lambda event: self.update_scrollback_limit())
+        scrollback_spinbox.pack(side=tk.LEFT, padx=5, pady=5)
+        
         # Frame de ações
         actions_frame = ttk.LabelFrame(config_frame, text="Ações", style='Custom.TFrame')
         actions_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -246,13 +679,18 @@ class ObsidianAIManager:
             command=self.test_api_connection,
             style='Custom.TButton'
         )
-        test_api_btn.pack(side=tk.LEFT)
+        test_api_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        clear_cache_btn = ttk.Button(
+            actions_button_frame,
+            text="🧹 Limpar Cache de Respostas",
+            command=self.clear_response_cache,
+            style='Custom.TButton'
+        )
+        clear_cache_btn.pack(side=tk.LEFT)
     
-    def create_notes_tab(self):
+    def create_notes_tab(self, notes_frame):
         """Cria a aba de gerenciamento de notas"""
-        notes_frame = ttk.Frame(self.notebook, style='Custom.TFrame')
-        self.notebook.add(notes_frame, text="📝 Notas")
-        
         # Frame de informações
         info_frame = ttk.LabelFrame(notes_frame, text="Informações das Notas", style='Custom.TFrame')
         info_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -265,31 +703,113 @@ class ObsidianAIManager:
         )
         self.notes_info_label.pack(padx=5, pady=5)
         
+        # Filtro da lista
+        filter_frame = ttk.Frame(info_frame, style='Custom.TFrame')
+        filter_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
+        
+        ttk.Label(filter_frame, text="🔎 Filtrar por título ou caminho:", style='Custom.TLabel').pack(side=tk.LEFT)
+        
+        filter_entry = ttk.Entry(
+            filter_frame,
+            textvariable=self.notes_filter_var,
+            style='Custom.TEntry',
+            font=('Consolas', 10)
+        )
+        filter_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        
+        duplicates_btn = ttk.Button(
+            filter_frame,
+            text="🔁 Trechos repetidos",
+            command=self.find_duplicates_threaded,
+            style='Custom.TButton'
+        )
+        duplicates_btn.pack(side=tk.LEFT, padx=(10, 0))
+        
+        self.summarize_btn = ttk.Button(
+            filter_frame,
+            text="📝 Resumir notas" if self.summary_token is None else "⏹️ Parar resumos",
+            command=self.summarize_notes_threaded,
+            style='Custom.TButton'
+        )
+        self.summarize_btn.pack(side=tk.LEFT, padx=(10, 0))
+        
         # Lista de notas
         list_frame = ttk.LabelFrame(notes_frame, text="Lista de Notas", style='Custom.TFrame')
         list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.notes_list_frame = list_frame
         
-        # Treeview para mostrar as notas
-        columns = ('título', 'caminho', 'tamanho', 'modificação')
+        # Relatório do último escaneamento: só aparece se algum arquivo ficou de fora ou foi lido com outra codificação
+        self.scan_report_frame = ttk.LabelFrame(
+            notes_frame, text="Arquivos com problemas no último escaneamento", style='Custom.TFrame'
+        )
+        self.scan_report_tree = ttk.Treeview(
+            self.scan_report_frame, columns=('arquivo', 'situação'), show='headings', height=4
+        )
+        self.scan_report_tree.heading('arquivo', text='Arquivo')
+        self.scan_report_tree.heading('situação', text='Situação')
+        self.scan_report_tree.column('arquivo', width=400)
+        self.scan_report_tree.column('situação', width=350)
+        report_scrollbar = ttk.Scrollbar(self.scan_report_frame, orient=tk.VERTICAL,
+                                         command=self.scan_report_tree.yview)
+        self.scan_report_tree.configure(yscrollcommand=report_scrollbar.set)
+        self.scan_report_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        report_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # Grupos de trechos quase iguais: só aparece depois de pedir o relatório
+        self.duplicates_frame = ttk.LabelFrame(
+            notes_frame, text="Trechos quase iguais (modelos, cópias)", style='Custom.TFrame'
+        )
+        self.duplicates_tree = ttk.Treeview(
+            self.duplicates_frame, columns=('cópias',), show='tree headings', height=6
+        )
+        self.duplicates_tree.heading('#0', text='Trecho')
+        self.duplicates_tree.heading('cópias', text='Cópias')
+        self.duplicates_tree.column('#0', width=650)
+        self.duplicates_tree.column('cópias', width=100)
+        duplicates_scrollbar = ttk.Scrollbar(self.duplicates_frame, orient=tk.VERTICAL,
+                                             command=self.duplicates_tree.yview)
+        self.duplicates_tree.configure(yscrollcommand=duplicates_scrollbar.set)
+        self.duplicates_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        duplicates_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # Treeview virtual: só as linhas visíveis existem como itens, preenchidas a partir do modelo
+        columns = NotesTableModel.COLUMNS
         self.notes_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=15)
         
         # Configurar colunas
-        self.notes_tree.heading('título', text='Título')
-        self.notes_tree.heading('caminho', text='Caminho')
-        self.notes_tree.heading('tamanho', text='Tamanho')
-        self.notes_tree.heading('modificação', text='Última Modificação')
+        self.notes_headings = {
+            'título': 'Título',
+            'caminho': 'Caminho',
+            'tamanho': 'Tamanho',
+            'modificação': 'Última Modificação'
+        }
+        for column, text in self.notes_headings.items():
+            self.notes_tree.heading(column, text=text, command=lambda column=column: self.sort_notes(column))
         
         self.notes_tree.column('título', width=200)
         self.notes_tree.column('caminho', width=300)
         self.notes_tree.column('tamanho', width=100)
         self.notes_tree.column('modificação', width=150)
         
-        # Scrollbar para a lista
-        notes_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.notes_tree.yview)
-        self.notes_tree.configure(yscrollcommand=notes_scrollbar.set)
+        # Scrollbar controla o deslocamento no modelo, não o Treeview
+        self.notes_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.scroll_notes)
         
         self.notes_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        notes_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.notes_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.notes_tree.bind('<Configure>', self.resize_notes)
+        self.notes_tree.bind('<MouseWheel>', self.wheel_notes)
+        self.notes_tree.bind('<Button-4>', lambda event: self.scroll_notes('scroll', -3, 'units'))
+        self.notes_tree.bind('<Button-5>', lambda event: self.scroll_notes('scroll', 3, 'units'))
+        self.notes_tree.bind('<Prior>', lambda event: self.scroll_notes('scroll', -1, 'pages'))
+        self.notes_tree.bind('<Next>', lambda event: self.scroll_notes('scroll', 1, 'pages'))
+        self.notes_tree.bind('<<TreeviewSelect>>', self.select_note)
+        self.update_sort_headings()
+        
+        # As notas carregadas antes de a aba existir entram de uma vez
+        self.notes_model.reset(self.engine.notes_data)
+        self.render_notes()
+        self.update_scan_report(self.scan_report)
     
     def create_status_bar(self, parent):
         """Cria a barra de status"""
@@ -316,13 +836,18 @@ class ObsidianAIManager:
         self.send_message()
         return 'break'
     
+    def handle_priority_enter(self, event):
+        """Shift+Enter: envia a pergunta à frente das que ainda estão na fila"""
+        self.send_message(HIGH)
+        return 'break'
+    
     def insert_newline(self, event):
         """Insere uma nova linha com Ctrl+Enter"""
         self.message_entry.insert(tk.INSERT, '\n')
         return 'break'
     
-    def send_message(self):
-        """Envia mensagem para a IA"""
+    def send_message(self, priority=NORMAL):
+        """Envia mensagem para a fila de perguntas à IA"""
         message = self.message_entry.get(1.0, tk.END).strip()
         if not message:
             return
@@ -332,127 +857,123 @@ class ObsidianAIManager:
             self.notebook.select(1)  # Ir para aba de configurações
             return
         
-        if not self.notes_data:
+        # Com notas no banco a pergunta vale já durante a carga dos índices (pelo FTS5, enquanto isso)
+        if not self.engine.note_count() and not self.engine.has_saved_notes():
             messagebox.showwarning("Aviso", "Nenhuma nota foi carregada. Por favor, escaneie as notas primeiro!")
             return
         
+        scope = self.conversation_scope()
+        if scope is not None and not scope:
+            messagebox.showwarning("Aviso", "Nenhum cofre marcado para esta conversa!")
+            return
+        
         # Limpar campo de entrada
         self.message_entry.delete(1.0, tk.END)
-        
-        # Adicionar mensagem do usuário ao chat
-        self.add_to_chat("Você", message, "user")
-        
-        # Enviar para IA em thread separada
-        threading.Thread(target=self.process_ai_request, args=(message,), daemon=True).start()
+        self.sync_engine_config()
+        
+        ticket, repeated = self.scheduler.submit(message, priority, scope)
+        sender = f"Você (#{ticket.number})"
+        if scope is not None:
+            sender += f" [{', '.join(vault_label(name) for name in sorted(scope))}]"
+        self.add_to_chat(sender, message, "user")
+        if repeated:
+            self.add_to_chat("Sistema", f"⏳ A mesma pergunta já está na fila (#{ticket.number}); "
+                                        "uma única resposta vale para as duas.", "system")
+    
+    def stop_requests(self):
+        """Cancela as perguntas na fila e as requisições à IA em andamento"""
+        if self.scheduler.cancel_all():
+            self.update_status("Cancelando requisições...")
+    
+    def cancel_selected_request(self, event=None):
+        """Cancela só a pergunta selecionada na fila"""
+        for position in self.queue_list.curselection():
+            if position < len(self.queue_tickets):
+                self.scheduler.cancel(self.queue_tickets[position])
     
-    def process_ai_request(self, message):
-        """Processa a requisição para a IA"""
+    def post_to_ui(self, function, *args):
+        """Encaminha um evento de outra thread para a thread do Tk, sem bloquear e na ordem de chegada"""
+        self.ui_events.put((function, args))
+    
+    def process_ui_events(self):
+        """Executa, na thread do Tk, os eventos encaminhados pela fila de perguntas"""
         try:
-            self.update_status("Processando mensagem...")
-            self.progress.start()
-            
-            # Preparar contexto das notas
-            context = self.prepare_context(message)
-            
-            # Fazer requisição para API
-            response = self.call_gemini_api(message, context)
-            
-            # Adicionar resposta ao chat
-            self.root.after(0, self.add_to_chat, "IA", response, "ai")
-            
-        except Exception as e:
-            error_msg = f"Erro ao processar mensagem: {str(e)}"
-            self.root.after(0, self.add_to_chat, "Sistema", error_msg, "system")
-        finally:
-            self.root.after(0, self.progress.stop)
-            self.root.after(0, self.update_status, "Pronto para usar")
+            while True:
+                function, args = self.ui_events.get_nowait()
+                function(*args)
+        except queue.Empty:
+            pass
+        self.root.after(self.UI_EVENTS_INTERVAL_MS, self.process_ui_events)
     
-    def prepare_context(self, user_message):
-        """Prepara o contexto das notas para enviar à IA"""
-        # Buscar notas relevantes baseadas na mensagem do usuário
-        relevant_notes = self.find_relevant_notes(user_message)
-        
-        context = "Base de conhecimento das suas anotações:\n\n"
-        
-        for note in relevant_notes[:5]:  # Limitar a 5 notas mais relevantes
-            context += f"=== {note['título']} ===\n"
-            context += f"Arquivo: {note['caminho']}\n"
-            context += f"Conteúdo: {note['conteúdo'][:1000]}...\n\n"  # Limitar conteúdo
-        
-        return context
+    def answer_question(self, ticket, on_chunk):
+        """Responde uma pergunta da fila (roda numa thread do agendador)"""
+        return self.engine.ask(ticket.question, ticket.cancel_token, on_chunk=on_chunk, trace=ticket.trace,
+                               vaults=ticket.scope)
     
-    def find_relevant_notes(self, query):
-        """Encontra notas relevantes baseadas na consulta"""
-        query_lower = query.lower()
-        scored_notes = []
-        
-        for note in self.notes_data:
-            score = 0
-            title_lower = note['título'].lower()
-            content_lower = note['conteúdo'].lower()
-            
-            # Pontuação baseada em palavras-chave no título
-            for word in query_lower.split():
-                if word in title_lower:
-                    score += 3
-                if word in content_lower:
-                    score += 1
-            
-            if score > 0:
-                scored_notes.append((score, note))
-        
-        # Ordenar por pontuação e retornar apenas as notas
-        scored_notes.sort(key=lambda x: x[0], reverse=True)
-        return [note for score, note in scored_notes]
+    def show_answer_chunk(self, ticket, chunk):
+        """Mostra um pedaço da resposta em streaming, abrindo a mensagem no primeiro"""
+        renderer = self.stream_renderers.get(ticket.number)
+        if renderer is None:
+            renderer = self.stream_renderers[ticket.number] = MarkdownStreamRenderer(self.chat_history)
+            self.begin_ai_stream(f"IA (#{ticket.number})")
+        self.append_ai_chunk(renderer, chunk, ticket.trace)
     
-    def call_gemini_api(self, message, context):
-        """Faz chamada para a API do Gemini"""
-        api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent"
-        
-        headers = {
-            "Content-Type": "application/json",
-        }
-        
-        prompt = f"""Você é um assistente inteligente especializado em ajudar com anotações pessoais do Obsidian.
-
-Sua tarefa é responder perguntas sobre o conteúdo das anotações, indicando sempre em qual arquivo a informação foi encontrada.
-
-**IMPORTANTE:** Use formatação Markdown em suas respostas para melhor legibilidade:
-- Use **negrito** para destacar informações importantes
-- Use *itálico* para ênfase
-- Use `código` para nomes de arquivos, funções, variáveis
-- Use ### para subtítulos
-- Use > para citações importantes
-- Use listas quando apropriado
-
-{context}
-
-**Pergunta do usuário:** {message}
-
-Por favor, responda de forma clara e útil, sempre mencionando as fontes (nomes dos arquivos) quando referenciar informações específicas das anotações. Use formatação Markdown para tornar sua resposta mais legível e organizada."""
-
-        data = {
-            "contents": [{
-                "parts": [{
-                    "text": prompt
-                }]
-            }]
-        }
-        
-        response = requests.post(
-            f"{api_url}?key={self.api_key.get()}",
-            headers=headers,
-            json=data,
-            timeout=30
+    def close_answer_stream(self, ticket):
+        renderer = self.stream_renderers.pop(ticket.number, None)
+        if renderer is not None:
+            self.finish_ai_stream(renderer, ticket.trace)
+        return renderer is not None
+    
+    def show_answer(self, ticket, result):
+        """Conclui a resposta de uma pergunta e mostra onde o tempo foi gasto"""
+        streamed = self.close_answer_stream(ticket)
+        if result['em_cache']:
+            self.add_to_chat(f"IA (#{ticket.number}) ⚡ (resposta em cache)", result['resposta'], "ai", ticket.trace)
+        elif not streamed:
+            self.add_to_chat(f"IA (#{ticket.number})", result['resposta'], "ai", ticket.trace)
+        self.finish_question(ticket.trace)
+    
+    def show_answer_error(self, ticket, error):
+        self.close_answer_stream(ticket)
+        self.add_to_chat("Sistema", f"Erro ao processar mensagem #{ticket.number}: {error}", "system")
+        self.update_status("Pronto para usar")
+    
+    def show_answer_cancelled(self, ticket):
+        self.close_answer_stream(ticket)
+        self.add_to_chat("Sistema", f"⏹️ Pergunta #{ticket.number} cancelada.", "system")
+        self.update_status("Pronto para usar")
+    
+    def update_request_queue(self, tickets):
+        """Mostra as perguntas aguardando resposta; some quando a fila esvazia"""
+        self.queue_tickets = tickets
+        self.queue_list.delete(0, tk.END)
+        icons = {QUEUED: "⏳", RUNNING: "▶"}
+        for ticket in tickets:
+            icon = icons.get(ticket.state, "✔")
+            state = "aguardando a vez de exibir" if ticket.finished else ticket.state
+            priority = " ⚑" if ticket.priority == HIGH else ""
+            repeated = f" ×{ticket.duplicates + 1}" if ticket.duplicates else ""
+            question = ' '.join(ticket.question.split())
+            self.queue_list.insert(tk.END, f"{icon} #{ticket.number}{priority}{repeated} {state}: {question[:80]}")
+        
+        if tickets and not self.queue_frame.winfo_ismapped():
+            self.queue_frame.pack(fill=tk.X, padx=5, pady=(5, 0), before=self.input_frame)
+            self.queue_progress.start()
+        elif not tickets and self.queue_frame.winfo_ismapped():
+            self.queue_progress.stop()
+            self.queue_frame.pack_forget()
+    
+    def finish_question(self, trace):
+        """Grava as métricas da pergunta e mostra o tempo de cada etapa na barra de status"""
+        record = self.engine.record_metrics(trace)
+        origin = " (cache)" if trace.values.get('em_cache') else ""
+        self.update_status(
+            f"✅ Resposta em {format_duration(trace.spans['total'])}{origin}: {describe_timings(trace.spans)} | "
+            f"{record['tokens_prompt']}+{record['tokens_resposta']} tokens | "
+            f"cache {record['janela'].get('taxa_cache', 0):.0%}"
         )
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result['candidates'][0]['content']['parts'][0]['text']
-        else:
-            raise Exception(f"Erro na API: {response.status_code} - {response.text}")
     
-    def add_to_chat(self, sender, message, tag):
+    def add_to_chat(self, sender, message, tag, trace=None):
         """Adiciona mensagem ao histórico do chat com suporte a Markdown"""
         timestamp = datetime.now().strftime("%H:%M:%S")
         
@@ -460,239 +981,461 @@ Por favor, responda de forma clara e útil, sempre mencionando as fontes (nomes
         
         # Se for mensagem da IA, aplicar formatação Markdown
         if tag == "ai":
-            self.insert_markdown_text(message)
+            with trace.span('renderização') if trace else nullcontext():
+                self.insert_markdown_text(message)
         else:
             self.chat_history.insert(tk.END, f"{message}\n\n")
         
-        # Auto-scroll para o final
+        # Descartar o histórico acima do limite e rolar para o final
+        self.trim_chat_history()
         self.chat_history.see(tk.END)
         
         # Focar no campo de entrada
         self.message_entry.focus_set()
     
     def insert_markdown_text(self, text):
-        """Insere texto com formatação Markdown no chat"""
-        import re
-        
-        lines = text.split('\n')
-        
-        for line in lines:
-            # Verificar se é um cabeçalho
-            if line.startswith('### '):
-                self.chat_history.insert(tk.END, line[4:] + '\n', 'heading3')
-            elif line.startswith('## '):
-                self.chat_history.insert(tk.END, line[3:] + '\n', 'heading2')
-            elif line.startswith('# '):
-                self.chat_history.insert(tk.END, line[2:] + '\n', 'heading1')
-            elif line.startswith('> '):
-                # Citação
-                self.chat_history.insert(tk.END, line[2:] + '\n', 'quote')
-            elif line.strip().startswith('```') and line.strip().endswith('```'):
-                # Bloco de código inline simples
-                code_content = line.strip()[3:-3]
-                self.chat_history.insert(tk.END, code_content + '\n', 'code_block')
-            elif '```' in line:
-                # Início ou fim de bloco de código
-                if line.strip() == '```':
-                    self.chat_history.insert(tk.END, '\n')
-                else:
-                    # Código com linguagem especificada
-                    self.chat_history.insert(tk.END, line + '\n', 'code_block')
-            else:
-                # Processar formatação inline
-                self.process_inline_formatting(line + '\n')
-    
-    def process_inline_formatting(self, text):
-        """Processa formatação inline como negrito, itálico, código"""
-        import re
-        
-        # Lista para armazenar segmentos de texto e suas formatações
-        segments = []
-        current_pos = 0
-        
-        # Padrões de formatação
-        patterns = [
-            (r'\*\*(.*?)\*\*', 'bold'),      # **texto**
-            (r'\*(.*?)\*', 'italic'),        # *texto*
-            (r'`(.*?)`', 'code'),            # `código`
-            (r'\[(.*?)\]\((.*?)\)', 'link'), # [texto](link)
-        ]
-        
-        # Encontrar todas as formatações
-        all_matches = []
-        for pattern, tag in patterns:
-            for match in re.finditer(pattern, text):
-                all_matches.append((match.start(), match.end(), match, tag))
-        
-        # Ordenar por posição
-        all_matches.sort(key=lambda x: x[0])
-        
-        # Processar texto
-        last_end = 0
-        
-        for start, end, match, tag in all_matches:
-            # Adicionar texto normal antes da formatação
-            if start > last_end:
-                normal_text = text[last_end:start]
-                if normal_text:
-                    self.chat_history.insert(tk.END, normal_text)
-            
-            # Adicionar texto formatado
-            if tag == 'link':
-                # Para links, usar apenas o texto do link
-                link_text = match.group(1)
-                self.chat_history.insert(tk.END, link_text, tag)
-            else:
-                # Para outras formatações, usar o conteúdo capturado
-                formatted_text = match.group(1)
-                self.chat_history.insert(tk.END, formatted_text, tag)
-            
-            last_end = end
-        
-        # Adicionar texto restante
-        if last_end < len(text):
-            remaining_text = text[last_end:]
-            self.chat_history.insert(tk.END, remaining_text)
+        """Insere texto com formatação Markdown no chat, numa única chamada ao Tk"""
+        runs = markdown_runs(text)
+        if runs:
+            self.chat_history.insert(tk.END, *merge_runs(runs))
+    
+    def begin_ai_stream(self, sender):
+        """Abre uma mensagem da IA que será preenchida aos poucos"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        self.chat_history.insert(tk.END, f"[{timestamp}] {sender}:\n", "ai")
+        self.chat_history.see(tk.END)
+    
+    def append_ai_chunk(self, renderer, chunk, trace):
+        """Acrescenta um pedaço da resposta em streaming ao chat"""
+        with trace.span('renderização'):
+            renderer.feed(chunk)
+            self.chat_history.see(tk.END)
+    
+    def finish_ai_stream(self, renderer, trace):
+        """Conclui a mensagem da IA em streaming"""
+        with trace.span('renderização'):
+            renderer.close()
+            self.trim_chat_history()
+            self.chat_history.see(tk.END)
+        self.message_entry.focus_set()
+    
+    def trim_chat_history(self):
+        """Descarta as linhas mais antigas do chat acima do limite, para o Text não ficar lento"""
+        limit = self.config['chat_scrollback_lines']
+        if not limit:
+            return
+        lines = int(self.chat_history.index('end-1c').split('.')[0])
+        if lines > limit:
+            self.chat_history.delete('1.0', f"{lines - limit + 1}.0")
     
     def clear_chat(self):
-        """Limpa o histórico do chat"""
+        """Limpa o histórico do chat; a nova conversa volta a consultar todos os cofres"""
         self.chat_history.delete(1.0, tk.END)
+        for variable in self.conversation_vaults.values():
+            variable.set(True)
+    
+    def refresh_conversation_vaults(self):
+        """Uma caixa por cofre configurado, marcando quais a conversa consulta"""
+        for widget in self.vaults_frame.winfo_children():
+            widget.destroy()
+        self.conversation_vaults = {name: self.conversation_vaults.get(name) or tk.BooleanVar(value=True)
+                                    for name in self.engine.shards}
+        
+        if len(self.conversation_vaults) < 2:
+            self.vaults_frame.pack_forget()
+            return
+        ttk.Label(self.vaults_frame, text="Cofres nesta conversa:", style='Custom.TLabel').pack(side=tk.LEFT)
+        for name, variable in self.conversation_vaults.items():
+            ttk.Checkbutton(self.vaults_frame, text=vault_label(name), variable=variable).pack(side=tk.LEFT, padx=5)
+        self.vaults_frame.pack(fill=tk.X, padx=5, pady=(5, 0), before=self.message_entry)
+    
+    def conversation_scope(self):
+        """Cofres marcados na conversa; None quando são todos (sem restrição)"""
+        selected = frozenset(name for name, variable in self.conversation_vaults.items() if variable.get())
+        return None if len(selected) == len(self.conversation_vaults) else selected
     
     def scan_notes_threaded(self):
         """Executa escaneamento de notas em thread separada"""
         threading.Thread(target=self.scan_notes, daemon=True).start()
     
     def scan_notes(self):
-        """Escaneia e processa todas as notas Markdown"""
+        """Escaneia as notas Markdown, relendo apenas arquivos novos ou modificados"""
         try:
             self.root.after(0, self.update_status, "Escaneando notas...")
-            self.root.after(0, self.progress.start)
-            
-            obsidian_path = Path(self.dir_var.get())
+            self.root.after(0, self.set_progress, None)
+            self.sync_engine_config()
             
-            if not obsidian_path.exists():
-                raise Exception(f"Diretório não encontrado: {obsidian_path}")
+            directory = self.dir_var.get().strip()
+            summary = self.engine.scan(directory)
+            # Diretório digitado em vez de escolhido no diálogo: também vira o cofre principal salvo
+            if directory != self.obsidian_path:
+                self.set_obsidian_path(directory)
+                self.root.after(0, self.save_config)
             
-            notes = []
+            # Atualizar interface só com o que mudou
+            self.root.after(0, self.apply_notes_changes, summary['mudanças'])
             
-            # Buscar todos os arquivos .md, ignorando a pasta .obsidian
-            for md_file in obsidian_path.rglob("*.md"):
-                if ".obsidian" in str(md_file):
-                    continue
-                
-                try:
-                    with open(md_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    title = md_file.stem
-                    relative_path = str(md_file.relative_to(obsidian_path))
-                    
-                    # Estatísticas do arquivo
-                    stat = md_file.stat()
-                    size = self.format_file_size(stat.st_size)
-                    modified = datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M")
-                    
-                    notes.append({
-                        'título': title,
-                        'conteúdo': content,
-                        'caminho': relative_path,
-                        'tamanho': size,
-                        'modificação': modified,
-                        'caminho_completo': str(md_file)
-                    })
-                    
-                except Exception as e:
-                    print(f"Erro ao ler arquivo {md_file}: {e}")
+            changes = (f"{summary['novas']} novas, {summary['alteradas']} alteradas, "
+                       f"{summary['removidas']} removidas")
+            if summary['ignorados']:
+                changes += f", {summary['ignorados']} arquivos ignorados (ver aba Notas)"
+            timings = summary['tempos_ms']
+            self.root.after(0, self.update_status,
+                            f"✅ {summary['total']} notas carregadas com sucesso! ({changes}) em "
+                            f"{format_duration(timings['total'])}: {describe_timings(timings)}")
             
-            # Salvar em CSV
-            self.save_notes_to_csv(notes)
+            report = list(summary['arquivos_ignorados'].items())
+            report += [(path, f"lido como {encoding}") for path, encoding in summary['codificações'].items()]
+            self.root.after(0, self.update_scan_report, sorted(report))
             
-            # Atualizar dados e interface
-            self.notes_data = notes
-            self.root.after(0, self.update_notes_display)
-            self.root.after(0, self.update_status, f"✅ {len(notes)} notas carregadas com sucesso!")
+            errors = summary.get('erros')
+            if errors:
+                details = '\n'.join(f"{vault_label(name)}: {error}" for name, error in errors.items())
+                self.root.after(0, messagebox.showwarning, "Aviso", f"Cofres não escaneados:\n{details}")
             
         except Exception as e:
             error_msg = f"Erro ao escanear notas: {str(e)}"
             self.root.after(0, self.update_status, f"❌ {error_msg}")
             self.root.after(0, messagebox.showerror, "Erro", error_msg)
         finally:
-            self.root.after(0, self.progress.stop)
+            self.root.after(0, self.stop_progress)
     
-    def save_notes_to_csv(self, notes):
-        """Salva as notas em um arquivo CSV"""
-        with open(self.csv_file, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['título', 'conteúdo', 'caminho', 'tamanho', 'modificação']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            
-            writer.writeheader()
-            for note in notes:
-                writer.writerow({
-                    'título': note['título'],
-                    'conteúdo': note['conteúdo'],
-                    'caminho': note['caminho'],
-                    'tamanho': note['tamanho'],
-                    'modificação': note['modificação']
-                })
+    def update_context_budget(self):
+        """Aplica o orçamento de tokens digitado na aba de configurações"""
+        try:
+            self.config['context_token_budget'] = max(250, int(self.budget_var.get()))
+        except (tk.TclError, ValueError):
+            self.budget_var.set(self.config['context_token_budget'])
+    
+    def update_max_note_size(self):
+        """Aplica o tamanho máximo de nota digitado na aba de configurações"""
+        try:
+            self.config['max_note_size_mb'] = max(0, int(self.max_note_size_var.get()))
+        except (tk.TclError, ValueError):
+            self.max_note_size_var.set(self.config['max_note_size_mb'])
+    
+    def update_scan_report(self, report):
+        """Mostra na aba de notas os arquivos ignorados ou lidos com outra codificação no último escaneamento"""
+        self.scan_report = report
+        if self.scan_report_tree is None:
+            return
+        self.scan_report_tree.delete(*self.scan_report_tree.get_children())
+        for path, situation in report:
+            self.scan_report_tree.insert('', tk.END, values=(path, situation))
+        if report:
+            self.scan_report_frame.pack(fill=tk.X, padx=10, pady=(0, 10), before=self.notes_list_frame)
+        else:
+            self.scan_report_frame.pack_forget()
+    
+    def find_duplicates_threaded(self):
+        """Monta o relatório de trechos quase iguais em thread separada"""
+        threading.Thread(target=self.find_duplicates, daemon=True).start()
+    
+    def find_duplicates(self):
+        """Agrupa os trechos quase iguais de todos os cofres e mostra na aba de notas"""
+        try:
+            self.root.after(0, self.update_status, "Procurando trechos repetidos...")
+            groups = self.engine.duplicate_report()
+            self.root.after(0, self.show_duplicate_report, groups)
+            copies = sum(len(group['trechos']) for group in groups)
+            self.root.after(0, self.update_status,
+                            f"🔁 {len(groups)} grupos de trechos quase iguais ({copies} trechos)")
+        except Exception as e:
+            self.root.after(0, self.update_status, f"❌ Erro ao procurar trechos repetidos: {str(e)}")
+    
+    def show_duplicate_report(self, groups):
+        """Mostra cada grupo de trechos quase iguais, com os trechos do grupo por baixo"""
+        self.duplicates_tree.delete(*self.duplicates_tree.get_children())
+        for group in groups:
+            parent = self.duplicates_tree.insert(
+                '', tk.END, text=group['prévia'], values=(f"{len(group['trechos'])} em {group['notas']} notas",)
+            )
+            for key in group['trechos']:
+                path, _, index = key.rpartition('#')
+                self.duplicates_tree.insert(parent, tk.END, text=f"{path} (trecho {int(index) + 1})")
+        if groups:
+            self.duplicates_frame.pack(fill=tk.X, padx=10, pady=(0, 10), after=self.notes_list_frame)
+        else:
+            self.duplicates_frame.pack_forget()
+    
+    def summarize_notes_threaded(self):
+        """Inicia os resumos das notas em segundo plano, ou para os que estão em andamento"""
+        if self.summary_token is not None:
+            self.summary_token.cancel()
+            return
+        if not self.api_key.get():
+            messagebox.showwarning("Aviso", "Configure a chave da API primeiro!")
+            return
+        self.sync_engine_config()
+        self.summary_token = CancelToken()
+        self.update_summarize_button()
+        threading.Thread(target=self.summarize_notes, args=(self.summary_token,), daemon=True).start()
+    
+    def summarize_notes(self, cancel_token):
+        """Resume as notas que ainda não têm resumo, para as perguntas amplas saírem em uma ou duas chamadas"""
+        try:
+            self.root.after(0, self.update_status, "Resumindo notas...")
+            self.root.after(0, self.set_progress, None)
+            summary = self.engine.summarize_vaults(cancel_token=cancel_token)
+            errors = f", {len(summary['erros'])} com erro" if summary['erros'] else ""
+            self.root.after(0, self.update_status,
+                            f"📝 {summary['resumidas']} notas resumidas, {summary['em_cache']} já tinham resumo"
+                            f"{errors} em {format_duration(summary['tempos_ms']['total'])}")
+        except RequestCancelled:
+            self.root.after(0, self.update_status, "⏹️ Resumos interrompidos (os já feitos ficam guardados)")
+        except Exception as e:
+            self.root.after(0, self.update_status, f"❌ Erro ao resumir notas: {str(e)}")
+        finally:
+            self.root.after(0, self.finish_summaries)
+    
+    def finish_summaries(self):
+        self.summary_token = None
+        self.update_summarize_button()
+        self.stop_progress()
+    
+    def update_summarize_button(self):
+        if self.summarize_btn is not None:
+            self.summarize_btn.config(text="📝 Resumir notas" if self.summary_token is None else "⏹️ Parar resumos")
+    
+    def update_scrollback_limit(self):
+        """Aplica o limite de linhas do histórico do chat"""
+        try:
+            self.config['chat_scrollback_lines'] = max(0, int(self.scrollback_var.get()))
+        except (tk.TclError, ValueError):
+            self.scrollback_var.set(self.config['chat_scrollback_lines'])
+            return
+        self.trim_chat_history()
+    
+    def get_ignore_patterns(self):
+        """Retorna os padrões glob configurados para ignorar arquivos e pastas"""
+        return [pattern.strip() for pattern in self.ignore_var.get().split(',') if pattern.strip()]
+    
+    def sync_engine_config(self):
+        """Copia para a configuração do núcleo os valores atuais dos campos da interface"""
+        self.config.update({
+            'api_key': self.api_key.get(),
+            'ignore_patterns': self.get_ignore_patterns(),
+            'stream_responses': self.stream_var.get(),
+            'semantic_search': self.semantic_var.get(),
+            'link_boost': self.link_boost_var.get(),
+            'collapse_duplicates': self.collapse_duplicates_var.get(),
+            'broad_questions': self.broad_questions_var.get()
+        })
+        self.engine.config = self.config
     
     def update_notes_display(self):
-        """Atualiza a exibição das notas na interface"""
-        # Limpar lista atual
-        for item in self.notes_tree.get_children():
+        """Recarrega a lista de notas inteira (após carregar do banco)"""
+        if self.notes_tree is None:
+            return  # a aba ainda não foi aberta: a lista é montada quando for
+        self.notes_model.reset(self.engine.notes_data)
+        self.render_notes()
+    
+    def apply_notes_changes(self, changes):
+        """Aplica à lista só as notas alteradas e removidas por um escaneamento"""
+        if self.notes_tree is None:
+            return
+        self.notes_model.apply_changes(changes['notas'], changes['removidas'])
+        self.render_notes()
+    
+    def render_notes(self):
+        """Preenche as linhas visíveis do Treeview a partir do deslocamento atual"""
+        if self.notes_tree is None:
+            return
+        model = self.notes_model
+        total = len(model)
+        self.notes_offset = max(0, min(self.notes_offset, total - self.notes_page_size))
+        
+        # Manter um item por linha visível, reaproveitando os que já existem
+        count = min(self.notes_page_size, total)
+        items = list(self.notes_tree.get_children())
+        for item in items[count:]:
             self.notes_tree.delete(item)
-        
-        # Adicionar notas
-        for note in self.notes_data:
-            self.notes_tree.insert('', tk.END, values=(
-                note['título'],
-                note['caminho'],
-                note['tamanho'],
-                note['modificação']
+        for _ in range(count - len(items)):
+            items.append(self.notes_tree.insert('', tk.END))
+        
+        selected = []
+        for position, item in enumerate(items[:count]):
+            note = model.row(self.notes_offset + position)
+            self.notes_tree.item(item, values=(
+                note.title,
+                note.path,
+                format_file_size(note.size),
+                format_timestamp(note.mtime)
             ))
+            if note.path == self.selected_note_path:
+                selected.append(item)
+        self.notes_tree.selection_set(selected)
         
-        # Atualizar informações
-        total_notes = len(self.notes_data)
-        total_chars = sum(len(note['conteúdo']) for note in self.notes_data)
-        
-        info_text = f"📊 Total: {total_notes} notas | {self.format_file_size(total_chars)} de conteúdo"
+        if total:
+            self.notes_scrollbar.set(self.notes_offset / total, (self.notes_offset + count) / total)
+        else:
+            self.notes_scrollbar.set(0, 1)
+        self.update_notes_info()
+    
+    def update_notes_info(self):
+        """Atualiza o total de notas e de conteúdo (mantido pelo modelo, sem somar tudo de novo)"""
+        model = self.notes_model
+        info_text = (f"📊 Total: {len(model.notes)} notas | "
+                     f"{self.format_file_size(model.total_bytes)} de conteúdo")
+        if model.filter_text:
+            info_text += f" | {len(model)} exibidas"
         self.notes_info_label.config(text=info_text)
     
+    def scroll_notes(self, action, amount, unit=None):
+        """Recebe os comandos da scrollbar ('moveto' ou 'scroll') e desloca a página visível"""
+        total = len(self.notes_model)
+        if action == 'moveto':
+            self.notes_offset = int(float(amount) * total)
+        elif unit == 'pages':
+            self.notes_offset += int(amount) * self.notes_page_size
+        else:
+            self.notes_offset += int(amount)
+        self.render_notes()
+        return 'break'
+    
+    def wheel_notes(self, event):
+        """Roda do mouse no Windows/macOS (no Linux chegam Button-4/5)"""
+        steps = -event.delta // 120 if abs(event.delta) >= 120 else -event.delta
+        return self.scroll_notes('scroll', steps * 3, 'units')
+    
+    def resize_notes(self, event):
+        """Ajusta quantas linhas cabem na altura atual da lista"""
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        # Descontar a linha dos cabeçalhos
+        page_size = max(1, event.height // row_height - 1)
+        if page_size != self.notes_page_size:
+            self.notes_page_size = page_size
+            self.render_notes()
+    
+    def select_note(self, event):
+        """Guarda a nota selecionada pelo caminho, para a seleção acompanhar a rolagem"""
+        selection = self.notes_tree.selection()
+        if selection:
+            self.selected_note_path = self.notes_tree.set(selection[0], 'caminho')
+    
+    def filter_notes(self):
+        """Filtra a lista enquanto o usuário digita"""
+        self.notes_model.set_filter(self.notes_filter_var.get())
+        self.notes_offset = 0
+        self.render_notes()
+    
+    def sort_notes(self, column):
+        """Ordena a lista pela coluna clicada"""
+        self.notes_model.sort(column)
+        self.notes_offset = 0
+        self.update_sort_headings()
+        self.render_notes()
+    
+    def update_sort_headings(self):
+        """Mostra ▲/▼ na coluna que define a ordem"""
+        model = self.notes_model
+        for column, text in self.notes_headings.items():
+            if column == model.sort_column:
+                text += " ▼" if model.reverse else " ▲"
+            self.notes_tree.heading(column, text=text)
+    
     def format_file_size(self, size_bytes):
         """Formata o tamanho do arquivo em formato legível"""
-        if size_bytes < 1024:
-            return f"{size_bytes} B"
-        elif size_bytes < 1024**2:
-            return f"{size_bytes/1024:.1f} KB"
-        else:
-            return f"{size_bytes/(1024**2):.1f} MB"
+        return format_file_size(size_bytes)
     
     def check_and_load_notes(self):
-        """Verifica se existe CSV de notas e carrega"""
-        if os.path.exists(self.csv_file):
-            threading.Thread(target=self.load_notes_from_csv, daemon=True).start()
+        """Verifica se há notas salvas (ou um CSV antigo a migrar) e carrega"""
+        if self.engine.has_saved_notes():
+            threading.Thread(target=self.load_notes_from_store, daemon=True).start()
     
-    def load_notes_from_csv(self):
-        """Carrega notas do arquivo CSV"""
-        try:
-            notes = []
-            with open(self.csv_file, 'r', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    notes.append(row)
-            
-            self.notes_data = notes
+    def load_notes_from_store(self):
+        """Carrega os metadados das notas do banco e abre os índices de busca em segundo plano"""
+        def ready(notes):
             self.root.after(0, self.update_notes_display)
+            self.root.after(0, self.update_status, f"⏳ {len(notes)} notas abertas; carregando índices de busca...")
+        
+        try:
+            notes = self.engine.load(on_ready=ready)
             self.root.after(0, self.update_status, f"✅ {len(notes)} notas carregadas do arquivo existente")
+            # Ainda em segundo plano: a primeira pergunta não paga a importação do cliente HTTP
+            self.engine.gemini_client.http_session()
             
         except Exception as e:
-            print(f"Erro ao carregar CSV: {e}")
+            print(f"Erro ao carregar notas: {e}")
     
     def browse_directory(self):
         """Abre diálogo para selecionar diretório"""
         directory = filedialog.askdirectory(initialdir=self.obsidian_path)
         if directory:
             self.dir_var.set(directory)
-            self.obsidian_path = directory
+            self.set_obsidian_path(directory)
+    
+    def set_obsidian_path(self, directory):
+        """Troca o diretório do cofre principal, na interface e na configuração"""
+        self.obsidian_path = directory
+        self.config['obsidian_path'] = directory
+    
+    def browse_vault_directory(self):
+        """Abre diálogo para selecionar o diretório de um cofre adicional"""
+        directory = filedialog.askdirectory(initialdir=self.vault_path_var.get() or self.obsidian_path)
+        if directory:
+            self.vault_path_var.set(directory)
+            if not self.vault_name_var.get().strip():
+                self.vault_name_var.set(os.path.basename(directory.rstrip('/\\')))
+    
+    def update_vaults_list(self):
+        """Mostra os cofres adicionais configurados"""
+        if self.vaults_list is None:
+            return
+        self.vaults_list.delete(0, tk.END)
+        for vault in self.config['vaults']:
+            self.vaults_list.insert(tk.END, f"{vault['nome']} — {vault['caminho']}")
+    
+    def add_vault(self):
+        """Registra um cofre adicional; ele passa a ser consultado depois de escaneado"""
+        name, path = self.vault_name_var.get().strip(), self.vault_path_var.get().strip()
+        try:
+            validate_vault_name(name)
+        except ValueError as e:
+            messagebox.showwarning("Aviso", str(e))
+            return
+        if name in self.engine.shards:
+            messagebox.showwarning("Aviso", f"Já existe um cofre chamado {name}!")
+            return
+        if not os.path.isdir(path):
+            messagebox.showwarning("Aviso", f"Diretório não encontrado: {path}")
+            return
+        
+        self.config['vaults'] = self.config['vaults'] + [{'nome': name, 'caminho': path}]
+        self.apply_vaults_change()
+        self.vault_name_var.set('')
+        self.vault_path_var.set('')
+        self.update_status(f"Cofre {name} adicionado. Escaneie as notas para indexá-lo.")
+    
+    def remove_vault(self):
+        """Tira o cofre selecionado da configuração (banco e índices dele ficam no disco)"""
+        selection = self.vaults_list.curselection()
+        if not selection:
+            return
+        vault = self.config['vaults'][selection[0]]
+        self.config['vaults'] = [entry for entry in self.config['vaults'] if entry is not vault]
+        self.apply_vaults_change()
+        self.update_notes_display()
+        self.update_status(f"Cofre {vault['nome']} removido da lista.")
+    
+    def apply_vaults_change(self):
+        """Abre ou fecha os shards conforme a lista de cofres e grava a configuração"""
+        opened = self.engine.configure_vaults()
+        self.update_vaults_list()
+        self.refresh_conversation_vaults()
+        self.save_config()
+        if opened:
+            # Um cofre já indexado antes (removido e adicionado de novo) volta sem reescanear tudo
+            threading.Thread(target=self.load_vaults, args=(opened,), daemon=True).start()
+    
+    def load_vaults(self, shards):
+        """Carrega do disco os cofres recém-adicionados"""
+        try:
+            for shard in shards:
+                shard.load()
+            self.root.after(0, self.update_notes_display)
+        except Exception as e:
+            print(f"Erro ao carregar cofre: {e}")
     
     def save_api_key(self):
         """Salva a chave da API"""
@@ -710,9 +1453,12 @@ Por favor, responda de forma clara e útil, sempre mencionando as fontes (nomes
                 self.root.after(0, self.update_status, "Testando conexão com API...")
                 self.root.after(0, self.progress.start)
                 
-                response = self.call_gemini_api("Olá, você está funcionando?", "")
+                # Direto na API, sem o cache de respostas: a chave atual é que precisa funcionar
+                self.sync_engine_config()
+                self.engine.gemini_client.generate(self.api_key.get(), "Olá, você está funcionando?")
                 
-                self.root.after(0, messagebox.showinfo, "Sucesso", "✅ Conexão com API funcionando corretamente!")
+                success_msg = "✅ Conexão com API funcionando corretamente!"
+                self.root.after(0, messagebox.showinfo, "Sucesso", success_msg)
                 self.root.after(0, self.update_status, "API testada com sucesso")
                 
             except Exception as e:
@@ -724,34 +1470,39 @@ Por favor, responda de forma clara e útil, sempre mencionando as fontes (nomes
         
         threading.Thread(target=test_connection, daemon=True).start()
     
+    def clear_response_cache(self):
+        """Apaga todas as respostas guardadas em cache"""
+        self.engine.response_cache.clear()
+        self.update_status("Cache de respostas limpo")
+    
     def update_status(self, message):
         """Atualiza a mensagem de status"""
         self.status_var.set(message)
     
+    def set_progress(self, percent):
+        """Mostra progresso real (0-100) ou indeterminado quando `percent` é None"""
+        if percent is None:
+            self.progress.config(mode='indeterminate')
+            self.progress.start()
+        else:
+            self.progress.stop()
+            self.progress.config(mode='determinate', maximum=100, value=percent)
+    
+    def stop_progress(self):
+        """Para a barra de progresso e volta ao modo indeterminado"""
+        self.progress.stop()
+        self.progress.config(mode='indeterminate', value=0)
+    
     def save_config(self):
         """Salva configurações no arquivo"""
-        config = {
-            'api_key': self.api_key.get(),
-            'obsidian_path': self.obsidian_path
-        }
+        self.sync_engine_config()
+        self.config['obsidian_path'] = self.obsidian_path
         
         try:
-            with open(self.config_file, 'w') as f:
-                json.dump(config, f)
+            save_config(self.config, self.config_file)
         except Exception as e:
             messagebox.showerror("Erro", f"Erro ao salvar configurações: {e}")
     
-    def load_config(self):
-        """Carrega configurações do arquivo"""
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                    self.api_key.set(config.get('api_key', ''))
-                    self.obsidian_path = config.get('obsidian_path', self.obsidian_path)
-        except Exception as e:
-            print(f"Erro ao carregar configurações: {e}")
-    
     def run(self):
         """Inicia a aplicação"""
         # Mensagem de boas-vindas
@@ -779,7 +1530,9 @@ Este sistema permite que você converse com suas anotações do Obsidian usando
         self.message_entry.focus_set()
         
         # Iniciar loop principal
+        self.process_ui_events()
         self.root.mainloop()
+        self.scheduler.shutdown()
 
 if __name__ == "__main__":
     app = ObsidianAIManager()
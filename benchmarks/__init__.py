@@ -0,0 +1 @@
+"""Medições de desempenho e gerador de cofres sintéticos"""
@@ -0,0 +1,81 @@
+"""Tempo até a primeira pergunta (time-to-interactive) ao abrir o EchoNote, num processo novo
+
+Roda como processo separado para que as importações sejam medidas a frio. Chamado
+por benchmarks.run; imprime um JSON com os tempos em ms:
+
+    python -m benchmarks.coldstart motor DADOS CONFIG_JSON "pergunta"
+    python -m benchmarks.coldstart interface DADOS CONFIG_JSON
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import json
+import os
+import sys
+import threading
+
+
+def elapsed_ms():
+    return round((time.perf_counter() - STARTED) * 1000, 1)
+
+
+def measure_engine(data_dir, config, query):
+    """Importação, abertura rápida (notas, metadados e links), primeira busca e aquecimento completo"""
+    from echonote import VaultEngine
+    metrics = {'importação_ms': elapsed_ms()}
+
+    engine = VaultEngine(config, data_dir)
+    ready = threading.Event()
+    loader = threading.Thread(target=engine.load, kwargs={'on_ready': lambda notes: ready.set()})
+    loader.start()
+    ready.wait()
+    metrics['interativo_ms'] = elapsed_ms()
+
+    # A primeira busca concorre com o aquecimento, como quando o usuário pergunta logo ao abrir
+    started = time.perf_counter()
+    engine.find_relevant_passages(query, limit=engine.PASSAGE_CANDIDATES)
+    metrics['primeira_busca_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    loader.join()
+    metrics['aquecido_ms'] = elapsed_ms()
+    return metrics
+
+
+def measure_interface(data_dir, config):
+    """Importação do Main e montagem da janela até o primeiro desenho"""
+    import Main
+    metrics = {'importação_ms': elapsed_ms()}
+
+    # A interface lê a configuração e os dados do diretório atual
+    os.chdir(data_dir)
+    with open('obsidian_config.json', 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    try:
+        app = Main.ObsidianAIManager()
+    except Main.tk.TclError as e:
+        return {'ignorada': f"Tk indisponível: {e}"}
+    app.root.update()
+    metrics['interativo_ms'] = elapsed_ms()
+
+    # Os avisos da carga chegam à janela por root.after: o loop do Tk precisa continuar rodando
+    while not app.engine.warm.is_set():
+        app.root.update()
+        time.sleep(0.01)
+    metrics['aquecido_ms'] = elapsed_ms()
+    app.scheduler.shutdown()
+    app.root.destroy()
+    return metrics
+
+
+def main(argv):
+    mode, data_dir, config = argv[0], argv[1], json.loads(argv[2])
+    if mode == 'motor':
+        metrics = measure_engine(data_dir, config, argv[3])
+    else:
+        metrics = measure_interface(data_dir, config)
+    print(json.dumps(metrics))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,218 @@
+"""Teste de carga do caminho da API: sessões de chat simultâneas contra o servidor simulado do Gemini
+
+Cada sessão é uma thread que faz perguntas em sequência, com uma pausa entre
+elas, pelo mesmo GeminiClient compartilhado que o programa usa (pool de
+conexões, limite de requisições simultâneas, novas tentativas com backoff).
+O resultado sai em JSON com vazão, percentis de latência, tentativas e falhas.
+Exemplo:
+
+    python -m benchmarks.load --sessions 16 --turns 5 --latency lognormal:0.4,0.5 --rate-limit 0.05 --truncate 0.02
+
+Com `--api-base` a carga vai para outro servidor em vez do simulado.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from echonote.gemini import PROMPT_TEMPLATE, GeminiClient
+from echonote.passages import estimate_tokens
+from echonote.tracing import Trace, percentile
+
+from .mock_gemini import add_server_arguments, latency_sampler, server_from_args
+
+# "Erro na API: 503 - {...}" -> "Erro na API: 503"
+ERROR_KIND_PATTERN = re.compile(r"[^:]+(: \d{3})?")
+
+
+def error_kind(error):
+    """Tipo da falha, sem os detalhes que mudam de uma requisição para outra"""
+    match = ERROR_KIND_PATTERN.match(str(error))
+    return match.group(0) if match else type(error).__name__
+
+
+def build_prompt(session, turn, context_tokens):
+    """Prompt de uma pergunta, com um contexto sintético de cerca de `context_tokens` tokens"""
+    line = f"Anotação {session}.{turn}: reunião de projeto, orçamento revisado e próximos passos.\n"
+    context = line * max(1, context_tokens // estimate_tokens(line))
+    return PROMPT_TEMPLATE.format(context=context, message=f"O que ficou decidido na sessão {session}?")
+
+
+def latency_summary(durations):
+    """Percentis de uma lista de durações em segundos, em ms"""
+    if not durations:
+        return {'n': 0}
+    durations = sorted(durations)
+    metrics = {'n': len(durations)}
+    for name, fraction in (('p50_ms', 0.5), ('p90_ms', 0.9), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+        metrics[name] = round(percentile(durations, fraction) * 1000, 1)
+    metrics['máx_ms'] = round(durations[-1] * 1000, 1)
+    return metrics
+
+
+class LoadTest:
+    """Dispara as sessões de chat e junta o resultado de cada pergunta"""
+
+    def __init__(self, client, api_key, sessions, turns, think, stream=True, context_tokens=2000, seed=None):
+        self.client = client
+        self.api_key = api_key
+        self.sessions = sessions
+        self.turns = turns
+        self.think = latency_sampler(think)
+        self.stream = stream
+        self.context_tokens = context_tokens
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.results = []  # um dicionário por pergunta
+
+    def ask(self, prompt):
+        """Faz uma pergunta; retorna o resultado com tempos, tentativas e a falha, se houver"""
+        trace = Trace('carga')
+        started = time.perf_counter()
+        result = {'erro': None, 'tokens_resposta': 0}
+        with trace.activate():
+            try:
+                if self.stream:
+                    answer = ''.join(self.client.stream(self.api_key, prompt))
+                else:
+                    answer = self.client.generate(self.api_key, prompt)
+                result['tokens_resposta'] = estimate_tokens(answer)
+            except Exception as e:
+                result['erro'] = error_kind(e)
+        result['segundos'] = time.perf_counter() - started
+        result['tentativas'] = trace.values.get('tentativas')
+        if 'api_primeiro_texto' in trace.spans:
+            result['primeiro_texto_s'] = trace.spans['api_primeiro_texto'] / 1000
+        return result
+
+    def session(self, number):
+        rng = random.Random(None if self.seed is None else self.seed * 1000 + number)
+        for turn in range(self.turns):
+            if turn:
+                time.sleep(self.think(rng))
+            result = self.ask(build_prompt(number, turn, self.context_tokens))
+            with self.lock:
+                self.results.append(result)
+
+    def run(self):
+        """Roda todas as sessões ao mesmo tempo e retorna o resumo"""
+        threads = [threading.Thread(target=self.session, args=(number,), daemon=True)
+                   for number in range(self.sessions)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summary(time.perf_counter() - started)
+
+    def summary(self, seconds):
+        succeeded = [result for result in self.results if result['erro'] is None]
+        attempts = [result['tentativas'] for result in succeeded if result['tentativas']]
+        summary = {
+            'duração_s': round(seconds, 3),
+            'perguntas': len(self.results),
+            'concluídas': len(succeeded),
+            'falhas': dict(Counter(result['erro'] for result in self.results if result['erro'])),
+            'vazão_por_s': round(len(succeeded) / seconds, 2) if seconds else None,
+            'tokens_resposta_por_s': round(sum(result['tokens_resposta'] for result in succeeded) / seconds, 1)
+            if seconds else None,
+            'latência': latency_summary([result['segundos'] for result in succeeded]),
+            'latência_falhas': latency_summary([result['segundos'] for result in self.results if result['erro']]),
+            'tentativas': {
+                'média': round(sum(attempts) / len(attempts), 2) if attempts else None,
+                'máx': max(attempts, default=None),
+                'repetidas': sum(1 for value in attempts if value > 1)
+            }
+        }
+        if self.stream:
+            summary['primeiro_texto'] = latency_summary(
+                [result['primeiro_texto_s'] for result in succeeded if 'primeiro_texto_s' in result]
+            )
+        return summary
+
+
+def print_summary(summary):
+    """Resumo legível no stderr; o JSON completo vai para a saída escolhida"""
+    latency = summary['latência']
+    print(f"\n📈 {summary['concluídas']}/{summary['perguntas']} perguntas em {summary['duração_s']} s "
+          f"({summary['vazão_por_s']}/s)", file=sys.stderr)
+    if latency['n']:
+        print(f"  latência p50 {latency['p50_ms']} ms | p95 {latency['p95_ms']} ms | p99 {latency['p99_ms']} ms",
+              file=sys.stderr)
+    first_text = summary.get('primeiro_texto', {})
+    if first_text.get('n'):
+        print(f"  1º texto p50 {first_text['p50_ms']} ms | p95 {first_text['p95_ms']} ms", file=sys.stderr)
+    print(f"  tentativas: média {summary['tentativas']['média']}, {summary['tentativas']['repetidas']} repetidas",
+          file=sys.stderr)
+    for kind, count in summary['falhas'].items():
+        print(f"  ❌ {count}× {kind}", file=sys.stderr)
+    if 'servidor' in summary:
+        print(f"  servidor: {summary['servidor']}", file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='benchmarks.load', description="Teste de carga do caminho da API")
+    parser.add_argument('--sessions', type=int, default=8, help="sessões de chat simultâneas (padrão: 8)")
+    parser.add_argument('--turns', type=int, default=5, help="perguntas por sessão (padrão: 5)")
+    parser.add_argument('--think', default='0', metavar='DIST',
+                        help="pausa entre as perguntas de uma sessão, em s (mesmo formato de --latency; padrão: 0)")
+    parser.add_argument('--context-tokens', type=int, default=2000, help="tamanho do contexto (padrão: 2000)")
+    parser.add_argument('--no-stream', dest='stream', action='store_false', help="usa o generateContent")
+    parser.add_argument('--max-concurrency', type=int, default=4,
+                        help="requisições simultâneas do cliente, como no programa (padrão: 4)")
+    parser.add_argument('--max-retries', type=int, default=4, help="novas tentativas em 429/5xx (padrão: 4)")
+    parser.add_argument('--backoff-base', type=float, default=1.0, help="base do backoff exponencial (padrão: 1)")
+    parser.add_argument('--api-base', help="outro servidor (padrão: o simulado, iniciado aqui)")
+    parser.add_argument('--api-key', default='carga', help="chave enviada à API (padrão: carga)")
+    parser.add_argument('-o', '--output', default='-', help="arquivo JSON de resultado (padrão: stdout)")
+    add_server_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    mock = None
+    if args.api_base is None:
+        try:
+            mock = server_from_args(args).start()
+        except ValueError as e:
+            parser.error(str(e))
+    client = GeminiClient(max_concurrency=args.max_concurrency, max_retries=args.max_retries,
+                          backoff_base=args.backoff_base, base_url=args.api_base or mock.url)
+    test = LoadTest(client, args.api_key, args.sessions, args.turns, args.think, args.stream,
+                    args.context_tokens, args.seed)
+
+    print(f"🔥 {args.sessions} sessões × {args.turns} perguntas contra {client.base_url}", file=sys.stderr)
+    try:
+        summary = test.run()
+    finally:
+        if mock is not None:
+            mock.stop()
+    if mock is not None:
+        summary['servidor'] = {'requisições': mock.requests, **mock.outcomes}
+
+    results = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'opções': {key: value for key, value in vars(args).items() if key not in ('output', 'api_key')},
+        **summary
+    }
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+
+    print_summary(summary)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""Servidor local que imita o generateContent/streamGenerateContent do Gemini para medições e testes de carga
+
+Além da resposta fixa em Markdown, simula o que a API real faz sob carga:
+latência sorteada de uma distribuição, 429 com Retry-After, rajadas de 5xx e
+streams cortados no meio. Também roda sozinho, para apontar o programa para ele
+(`api_base` no `obsidian_config.json` ou a variável GEMINI_API_BASE):
+
+    python -m benchmarks.mock_gemini --port 8765 --latency lognormal:0.4,0.5 --rate-limit 0.05
+"""
+import argparse
+import json
+import math
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_ANSWER = """## Resumo
+
+Encontrei **três notas** que tratam do assunto, principalmente em `Projetos/Roteiro.md`.
+
+### Detalhes
+- A reunião de *segunda-feira* definiu o escopo inicial
+- O orçamento foi revisado em [[Financeiro 2024]]
+- Há um exemplo de código na nota de estudos:
+
+```python
+def resumo(notas):
+    return [nota.titulo for nota in notas]
+```
+
+> **Fonte:** `Reuniões/Semanal 12.md` e `Estudos/Python.md`
+
+Consulte também [a documentação](https://example.com) para mais informações.
+"""
+
+# Corpos de erro no formato da API real
+ERRORS = {
+    429: ('RESOURCE_EXHAUSTED', "Resource has been exhausted (e.g. check quota)."),
+    500: ('INTERNAL', "An internal error has occurred."),
+    503: ('UNAVAILABLE', "The model is overloaded. Please try again later."),
+}
+
+
+def split_text(text, chunks):
+    """Divide o texto em `chunks` pedaços, como os eventos de uma resposta em streaming"""
+    size = max(1, len(text) // chunks + 1)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def latency_sampler(spec):
+    """Converte a descrição de uma latência (em segundos) numa função que a sorteia
+
+    Aceita um número (fixa), `uniform:mín,máx`, `exp:média` ou `lognormal:mediana,sigma`
+    (cauda longa, como a de uma API real). A função recebe o `random.Random` a usar.
+    """
+    if isinstance(spec, (int, float)):
+        return lambda rng: spec
+    name, _, args = spec.partition(':')
+    try:
+        if not args:
+            value = float(name)
+            return lambda rng: value
+        values = [float(value) for value in args.split(',')]
+        if name == 'uniform':
+            low, high = values
+            return lambda rng: rng.uniform(low, high)
+        if name == 'exp':
+            mean, = values
+            return lambda rng: rng.expovariate(1 / mean) if mean else 0.0
+        if name == 'lognormal':
+            median, sigma = values
+            return lambda rng: rng.lognormvariate(math.log(median), sigma) if median else 0.0
+    except ValueError:
+        pass
+    raise ValueError(f"latência inválida: {spec!r} (use 0.2, uniform:0.1,0.5, exp:0.3 ou lognormal:0.3,0.5)")
+
+
+class MockGeminiServer:
+    """Atende as rotas do Gemini com uma resposta fixa em Markdown e falhas configuráveis
+
+    - `latency`: tempo até os cabeçalhos da resposta (1º byte); `chunk_delay`: entre os eventos do streaming
+    - `rate_limit`: fração das requisições recusadas com 429 e `Retry-After: retry_after`
+    - `error_rate`: chance de uma requisição começar uma rajada de `burst_length` respostas 5xx seguidas
+    - `truncate`: fração dos streams cortados no meio (a conexão cai antes do último evento)
+
+    O que aconteceu com cada requisição fica em `outcomes` ('ok', '429', '5xx', 'cortadas').
+    """
+
+    def __init__(self, answer=SAMPLE_ANSWER, latency=0.0, chunks=8, chunk_delay=0.0, rate_limit=0.0,
+                 retry_after=1, error_rate=0.0, burst_length=3, truncate=0.0, seed=None,
+                 host='127.0.0.1', port=0):
+        self.answer = answer
+        self.latency = latency_sampler(latency)
+        self.chunks = chunks
+        self.chunk_delay = latency_sampler(chunk_delay)
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.burst_length = burst_length
+        self.truncate = truncate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.burst_remaining = 0
+        self.requests = 0
+        self.outcomes = Counter()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def plan(self, stream):
+        """Sorteia o destino de uma requisição; retorna (status, latência, cortar o stream)"""
+        with self.lock:
+            self.requests += 1
+            if self.burst_remaining:
+                self.burst_remaining -= 1
+                status = 503
+            elif self.rng.random() < self.error_rate:
+                self.burst_remaining = self.burst_length - 1
+                status = self.rng.choice((500, 503))
+            elif self.rng.random() < self.rate_limit:
+                status = 429
+            else:
+                status = 200
+            truncated = stream and status == 200 and self.rng.random() < self.truncate
+            latency = self.latency(self.rng) if status == 200 else 0.0
+            outcome = 'cortadas' if truncated else {200: 'ok', 429: '429'}.get(status, '5xx')
+            self.outcomes[outcome] += 1
+        return status, latency, truncated
+
+    def make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if ':streamGenerateContent' in self.path:
+                    stream = True
+                elif ':generateContent' in self.path:
+                    stream = False
+                else:
+                    self.send_body(404, b'{"error": "rota desconhecida"}')
+                    return
+
+                status, latency, truncated = mock.plan(stream)
+                if status != 200:
+                    self.send_error_body(status)
+                    return
+                if latency:
+                    time.sleep(latency)
+                usage = {'promptTokenCount': len(body) // 4, 'candidatesTokenCount': len(mock.answer) // 4}
+                if stream:
+                    self.send_stream(usage, truncated)
+                else:
+                    self.send_body(200, json.dumps(mock.event(mock.answer, usage, 'STOP')).encode('utf-8'))
+
+            def send_body(self, status, body, headers=()):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_error_body(self, status):
+                name, message = ERRORS[status]
+                body = json.dumps({'error': {'code': status, 'message': message, 'status': name}}).encode('utf-8')
+                headers = [('Retry-After', str(mock.retry_after))] if status == 429 else []
+                self.send_body(status, body, headers)
+
+            def send_stream(self, usage, truncated):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                pieces = split_text(mock.answer, mock.chunks)
+                for number, piece in enumerate(pieces, 1):
+                    if truncated and number > len(pieces) // 2:
+                        # Conexão derrubada no meio da resposta, sem o evento final
+                        self.close_connection = True
+                        self.connection.shutdown(socket.SHUT_RDWR)
+                        return
+                    if number > 1:
+                        delay = mock.chunk_delay(mock.rng)
+                        if delay:
+                            time.sleep(delay)
+                    # Como a API real, o uso de tokens e o finishReason vêm no último evento
+                    last = number == len(pieces)
+                    event = mock.event(piece, usage if last else None, 'STOP' if last else None)
+                    data = f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8')
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                    self.wfile.flush()
+                self.wfile.write(b'0\r\n\r\n')
+
+        return Handler
+
+    @staticmethod
+    def event(text, usage=None, finish_reason=None):
+        candidate = {'content': {'parts': [{'text': text}], 'role': 'model'}}
+        if finish_reason:
+            candidate['finishReason'] = finish_reason
+        event = {'candidates': [candidate]}
+        if usage:
+            event['usageMetadata'] = usage
+        return event
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_server_arguments(parser):
+    """Opções do servidor simulado (também usadas pelo teste de carga)"""
+    parser.add_argument('--latency', default='0', metavar='DIST',
+                        help="latência até o 1º byte, em s: 0.2, uniform:0.1,0.5, exp:0.3 ou lognormal:0.3,0.5")
+    parser.add_argument('--chunk-delay', default='0', metavar='DIST',
+                        help="intervalo entre os eventos do streaming (mesmo formato; padrão: 0)")
+    parser.add_argument('--chunks', type=int, default=8, help="eventos por resposta em streaming (padrão: 8)")
+    parser.add_argument('--rate-limit', type=float, default=0.0, metavar='FRAÇÃO',
+                        help="fração das requisições recusadas com 429 (padrão: 0)")
+    parser.add_argument('--retry-after', type=int, default=1, metavar='S',
+                        help="valor do Retry-After nas respostas 429 (padrão: 1)")
+    parser.add_argument('--error-rate', type=float, default=0.0, metavar='FRAÇÃO',
+                        help="chance de uma requisição começar uma rajada de 5xx (padrão: 0)")
+    parser.add_argument('--burst-length', type=int, default=3, help="respostas 5xx seguidas numa rajada (padrão: 3)")
+    parser.add_argument('--truncate', type=float, default=0.0, metavar='FRAÇÃO',
+                        help="fração dos streams cortados no meio (padrão: 0)")
+    parser.add_argument('--seed', type=int, help="semente dos sorteios (padrão: aleatória)")
+
+
+def server_from_args(args, **kwargs):
+    """Cria o servidor com as opções de `add_server_arguments`"""
+    return MockGeminiServer(latency=args.latency, chunks=args.chunks, chunk_delay=args.chunk_delay,
+                            rate_limit=args.rate_limit, retry_after=args.retry_after, error_rate=args.error_rate,
+                            burst_length=args.burst_length, truncate=args.truncate, seed=args.seed, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmarks.mock_gemini', description="Servidor local que imita o Gemini")
+    parser.add_argument('--host', default='127.0.0.1', help="endereço (padrão: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765, help="porta (padrão: 8765)")
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        mock = server_from_args(args, host=args.host, port=args.port)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Gemini simulado em {mock.url} (Ctrl+C para parar)", file=sys.stderr)
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.server.server_close()
+        print(f"{mock.requests} requisições: {dict(mock.outcomes)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""Medições de desempenho do EchoNote sobre cofres sintéticos
+
+Cada tamanho de cofre roda num processo separado, para que o pico de memória
+(RSS) de um não contamine o do outro. O pico é um só por tamanho: o do processo
+inteiro, que inclui todas as etapas. Exemplo (o baseline é gravado por uma
+execução anterior com --save-baseline):
+
+    python -m benchmarks.run --sizes 1000 10000 -o resultado.json --baseline baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows: sem getrusage, o pico de memória não é medido
+    resource = None
+
+from echonote import VaultEngine
+from echonote.markdown import markdown_runs
+from echonote.tracing import percentile
+
+from .mock_gemini import SAMPLE_ANSWER, MockGeminiServer, split_text
+from .vaultgen import ensure_vault
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+# Métricas comparadas com o baseline; em todas, menor é melhor
+COMPARED_METRICS = ('segundos', 'p50_ms', 'p95_ms', 'interativo_ms', 'aquecido_ms', 'rss_pico_mb')
+RUN_STAGE = 'execução'  # métricas da execução inteira (pico de memória) na comparação
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo até agora, em MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB; macOS, em bytes
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def timed(function, *args):
+    """Executa a função e retorna (resultado, segundos)"""
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def measure_bulk(function, items=None, size_bytes=None):
+    """Mede uma etapa executada uma vez (escaneamento, carregamento)"""
+    _, seconds = timed(function)
+    metrics = {'segundos': round(seconds, 4)}
+    if items:
+        metrics['notas_por_s'] = round(items / seconds, 1)
+    if size_bytes:
+        metrics['mb_por_s'] = round(size_bytes / 1024 ** 2 / seconds, 2)
+    return metrics
+
+
+def measure_latency(function, inputs):
+    """Mede cada chamada e resume em percentis de latência e vazão sequencial"""
+    durations = []
+    for item in inputs:
+        _, seconds = timed(function, item)
+        durations.append(seconds)
+
+    durations.sort()
+    total = sum(durations)
+    metrics = {'n': len(durations)}
+    for name, fraction in (('p50_ms', 0.5), ('p90_ms', 0.9), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+        metrics[name] = round(percentile(durations, fraction) * 1000, 3)
+    metrics['máx_ms'] = round(durations[-1] * 1000, 3)
+    metrics['vazão_por_s'] = round(len(durations) / total, 1) if total else None
+    return metrics
+
+
+def measure_cold_start(mode, data_dir, config, *args):
+    """Abre o programa num processo novo e mede o tempo até aceitar perguntas (ver benchmarks.coldstart)"""
+    command = [sys.executable, '-m', 'benchmarks.coldstart', mode, data_dir, json.dumps(config), *args]
+    result = subprocess.run(command, cwd=ROOT_DIR, capture_output=True, text=True)
+    if result.returncode:
+        return {'ignorada': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'falhou'}
+    # Só a última linha é o JSON; antes dela pode haver avisos impressos pelo programa
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_markdown(repetitions):
+    """Mede só o tokenizador Markdown, sem o Tk (roda mesmo sem interface gráfica)"""
+    return measure_latency(lambda _: markdown_runs(SAMPLE_ANSWER), range(repetitions))
+
+
+def measure_render(repetitions, chunks=8):
+    """Mede a renderização Markdown no chat, alimentada em pedaços como no streaming"""
+    try:
+        import tkinter as tk
+        from Main import MarkdownStreamRenderer
+        root = tk.Tk()
+    except Exception as e:
+        return {'ignorada': f"Tk indisponível: {e}"}
+
+    root.withdraw()
+    widget = tk.Text(root)
+    pieces = split_text(SAMPLE_ANSWER, chunks)
+
+    def render(_):
+        renderer = MarkdownStreamRenderer(widget)
+        for piece in pieces:
+            renderer.feed(piece)
+        renderer.close()
+        root.update_idletasks()
+        widget.delete('1.0', tk.END)
+
+    try:
+        return measure_latency(render, range(repetitions))
+    finally:
+        root.destroy()
+
+
+def bench_size(notes, options):
+    """Gera (ou reaproveita) um cofre e mede cada etapa sobre ele"""
+    seed = options['seed']
+    vault_dir = os.path.join(options['work_dir'], f"vault-{notes}-{seed}")
+    (vault, size_bytes, generated), generation_seconds = timed(ensure_vault, vault_dir, notes, seed)
+
+    data_dir = tempfile.mkdtemp(prefix='dados-', dir=options['work_dir'])
+    config = {
+        'api_key': 'benchmark',
+        'obsidian_path': vault_dir,
+        'semantic_search': options['semantic'],
+        'vector_dimensions': options['dimensions'],
+        'stream_responses': False
+    }
+    stages = {}
+    try:
+        engine = VaultEngine(config, data_dir)
+        stages['scan'] = measure_bulk(engine.scan, notes, size_bytes)
+        stages['rescan'] = measure_bulk(engine.scan, notes)
+
+        # Carregamento a frio: banco e índices salvos pelo escaneamento anterior
+        engine = VaultEngine(config, data_dir)
+        stages['load'] = measure_bulk(engine.load, notes)
+
+        queries = list(dict.fromkeys(vault.queries(options['queries'])))
+        # Time-to-interactive: importação e abertura rápida, com o aquecimento dos índices em segundo plano
+        stages['startup'] = measure_cold_start('motor', data_dir, config, queries[0])
+        stages['startup_gui'] = measure_cold_start('interface', data_dir, config)
+
+        search = lambda query: engine.find_relevant_passages(query, limit=engine.PASSAGE_CANDIDATES)
+        stages['search'] = measure_latency(search, queries)
+        # Mesmas buscas de novo: resultados guardados em memória (cache de buscas)
+        stages['search_cached'] = measure_latency(search, queries)
+        stages['search_cached']['caches'] = engine.search_cache_stats()
+        # As etapas seguintes medem a busca de verdade, não o cache
+        engine.query_cache.clear()
+        stages['prepare_context'] = measure_latency(engine.prepare_context, queries)
+
+        mock = MockGeminiServer(latency=options['api_latency']).start()
+        engine.gemini_client.base_url = mock.url
+        try:
+            questions = queries[:options['asks']]
+            engine.response_cache.clear()
+            engine.query_cache.clear()
+            stages['ask'] = measure_latency(engine.ask, questions)
+
+            engine.response_cache.clear()
+            engine.query_cache.clear()
+            engine.config['stream_responses'] = True
+            stages['ask_stream'] = measure_latency(
+                lambda question: engine.ask(question, on_chunk=lambda chunk: None), questions
+            )
+            # Mesmas perguntas de novo: agora todas respondidas pelo cache
+            stages['ask_cached'] = measure_latency(engine.ask, questions)
+        finally:
+            mock.stop()
+
+        stages['markdown'] = measure_markdown(options['renders'])
+        stages['render'] = measure_render(options['renders'])
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    return {
+        'notas': notes,
+        'bytes': size_bytes,
+        'cofre_gerado': generated,
+        'geração_s': round(generation_seconds, 2),
+        # ru_maxrss é o pico do processo todo: medido por etapa, repetiria o da maior
+        'rss_pico_mb': peak_rss_mb(),
+        'etapas': stages
+    }
+
+
+def run_isolated(notes, options):
+    """Roda a medição de um tamanho num processo novo (spawn), com memória limpa"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(bench_size, notes, options).result()
+
+
+def compared_stages(run):
+    """Etapas de uma execução, mais a pseudoetapa com as métricas da execução inteira"""
+    return {**run['etapas'], RUN_STAGE: {'rss_pico_mb': run.get('rss_pico_mb')}}
+
+
+def compare(runs, baseline, threshold=None):
+    """Compara com o baseline; retorna (comparações, regressões acima do limite em %)"""
+    baseline_runs = {run['notas']: run for run in baseline.get('execuções', [])}
+    comparisons = []
+    regressions = []
+
+    for run in runs:
+        previous_run = baseline_runs.get(run['notas'])
+        if previous_run is None:
+            continue
+        previous_stages = compared_stages(previous_run)
+        for stage, metrics in compared_stages(run).items():
+            previous_metrics = previous_stages.get(stage, {})
+            for metric in COMPARED_METRICS:
+                current, previous = metrics.get(metric), previous_metrics.get(metric)
+                if not current or not previous:
+                    continue
+                entry = {
+                    'notas': run['notas'],
+                    'etapa': stage,
+                    'métrica': metric,
+                    'baseline': previous,
+                    'atual': current,
+                    'variação_%': round((current - previous) / previous * 100, 1)
+                }
+                comparisons.append(entry)
+                if threshold is not None and entry['variação_%'] > threshold:
+                    regressions.append(entry)
+
+    return comparisons, regressions
+
+
+def print_summary(runs, comparisons):
+    """Resumo legível no stderr; o JSON completo vai para a saída escolhida"""
+    changes = {(entry['notas'], entry['etapa'], entry['métrica']): entry['variação_%'] for entry in comparisons}
+
+    for run in runs:
+        change = changes.get((run['notas'], RUN_STAGE, 'rss_pico_mb'))
+        delta = f" ({change:+.1f}%)" if change is not None else ''
+        rss = f" | pico de RSS {run['rss_pico_mb']} MB{delta}" if run.get('rss_pico_mb') else ''
+        print(f"\n📊 {run['notas']} notas ({run['bytes'] / 1024 ** 2:.1f} MB){rss}", file=sys.stderr)
+        for stage, metrics in run['etapas'].items():
+            if 'ignorada' in metrics:
+                print(f"  {stage:<16} ignorada: {metrics['ignorada']}", file=sys.stderr)
+                continue
+            metric = next(name for name in ('segundos', 'interativo_ms', 'p50_ms') if name in metrics)
+            change = changes.get((run['notas'], stage, metric))
+            delta = f" ({change:+.1f}%)" if change is not None else ''
+            extra = f" p95 {metrics['p95_ms']} ms" if 'p95_ms' in metrics else ''
+            if 'aquecido_ms' in metrics:
+                extra = f" aquecido {metrics['aquecido_ms']} ms"
+            print(f"  {stage:<16} {metric} {metrics[metric]}{delta}{extra}", file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='benchmarks.run', description="Medições de desempenho do EchoNote")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="quantidades de notas dos cofres sintéticos (padrão: 1000 10000 100000)")
+    parser.add_argument('--seed', type=int, default=42, help="semente do gerador (padrão: 42)")
+    parser.add_argument('--queries', type=int, default=200, help="buscas medidas por cofre (padrão: 200)")
+    parser.add_argument('--asks', type=int, default=30, help="perguntas enviadas ao servidor simulado (padrão: 30)")
+    parser.add_argument('--renders', type=int, default=50, help="renderizações Markdown medidas (padrão: 50)")
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help="latência simulada da API, em segundos (padrão: 0)")
+    parser.add_argument('--dimensions', type=int, default=128, help="dimensões do índice vetorial (padrão: 128)")
+    parser.add_argument('--no-semantic', dest='semantic', action='store_false', help="desliga o índice vetorial")
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'echonote-bench'),
+                        help="onde os cofres gerados ficam guardados entre execuções")
+    parser.add_argument('-o', '--output', default='-', help="arquivo JSON de resultado (padrão: stdout)")
+    parser.add_argument('--baseline', help="resultado anterior para comparação")
+    parser.add_argument('--save-baseline', metavar='PATH', help="também grava o resultado como novo baseline")
+    parser.add_argument('--max-regression', type=float, metavar='PCT',
+                        help="termina com erro se alguma métrica piorar mais que PCT%% em relação ao baseline")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    options = {
+        'seed': args.seed,
+        'queries': args.queries,
+        'asks': args.asks,
+        'renders': args.renders,
+        'api_latency': args.api_latency,
+        'dimensions': args.dimensions,
+        'semantic': args.semantic,
+        'work_dir': args.work_dir
+    }
+
+    runs = []
+    for notes in args.sizes:
+        print(f"⏱️ Medindo cofre com {notes} notas...", file=sys.stderr)
+        runs.append(run_isolated(notes, options))
+
+    comparisons, regressions = [], []
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            comparisons, regressions = compare(runs, json.load(f), args.max_regression)
+
+    results = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'opções': {key: value for key, value in options.items() if key != 'work_dir'},
+        'execuções': runs,
+        'comparação': comparisons
+    }
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+
+    print_summary(runs, comparisons)
+    if regressions:
+        print(f"\n❌ {len(regressions)} métricas pioraram mais que {args.max_regression}%", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""Gerador de cofres sintéticos do Obsidian, reproduzíveis a partir de uma semente"""
+import json
+import os
+import random
+import shutil
+from itertools import accumulate
+
+SYLLABLES = ("ba be bi bo bu ca ce ci co cu da de di do du fa fe fi fo fu ga go gu la le li lo lu "
+             "ma me mi mo mu na ne ni no nu pa pe pi po pu ra re ri ro ru sa se si so su ta te ti "
+             "to tu va ve vi vo vu xa xe zi zo an en in on un ar er or al el il").split()
+VOCABULARY_SIZE = 6000
+FOLDER_NAMES = ("Projetos", "Áreas", "Recursos", "Arquivo", "Diário", "Reuniões", "Estudos", "Ideias")
+MANIFEST_NAME = ".echonote-bench.json"
+
+
+class SyntheticVault:
+    """Vocabulário, títulos e texto sintéticos derivados de uma semente
+
+    As palavras seguem uma distribuição de Zipf, como em texto real: poucas muito
+    frequentes e uma cauda longa de termos raros.
+    """
+
+    def __init__(self, notes, seed=42):
+        self.notes = notes
+        self.seed = seed
+        rng = random.Random(seed)
+
+        words = set()
+        while len(words) < VOCABULARY_SIZE:
+            words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+        self.vocabulary = sorted(words)
+        rng.shuffle(self.vocabulary)
+        self.cum_weights = list(accumulate(1.0 / rank for rank in range(1, VOCABULARY_SIZE + 1)))
+
+        self.tags = self.vocabulary[:60]
+        self.titles = [f"{self.vocabulary[rng.randrange(2000)].capitalize()} "
+                       f"{self.vocabulary[rng.randrange(VOCABULARY_SIZE)]} {i:06d}" for i in range(notes)]
+        self.folders = self.make_folders(rng)
+
+    def make_folders(self, rng):
+        """Árvore de pastas aninhadas (até 3 níveis) proporcional ao tamanho do cofre"""
+        folders = ['']
+        for _ in range(max(1, int(self.notes ** 0.5) // 2)):
+            parent = rng.choice(folders)
+            name = rng.choice(FOLDER_NAMES) if not parent else f"{rng.choice(FOLDER_NAMES)} {rng.randint(1, 99)}"
+            if parent.count('/') < 2:
+                folders.append(f"{parent}/{name}" if parent else name)
+        return sorted(set(folders))
+
+    def words(self, rng, count):
+        return rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=count)
+
+    def paragraph(self, rng, count):
+        """Parágrafo com wikilinks, embeds, apelidos e tags espalhados pelo texto"""
+        words = self.words(rng, count)
+        for position in rng.sample(range(count), min(count, rng.randint(0, 3))):
+            target = rng.choice(self.titles)
+            kind = rng.random()
+            if kind < 0.6:
+                words[position] = f"[[{target}]]"
+            elif kind < 0.85:
+                words[position] = f"[[{target}|{words[position]}]]"
+            elif kind < 0.95:
+                words[position] = f"![[{target}]]"
+            else:
+                words[position] = f"#{rng.choice(self.tags)}"
+        return ' '.join(words).capitalize() + '.'
+
+    def note(self, rng, index, target_size=None):
+        """Conteúdo de uma nota: frontmatter opcional, seções com cabeçalhos, listas e código"""
+        parts = []
+        if rng.random() < 0.7:
+            tags = ', '.join(rng.sample(self.tags, rng.randint(1, 4)))
+            created = f"20{rng.randint(18, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            parts.append(f"---\ntags: [{tags}]\naliases: [{' '.join(self.words(rng, 2))}]\n"
+                         f"created: {created}\n---\n")
+        parts.append(f"# {self.titles[index]}\n")
+
+        size = 0
+        sections = rng.randint(1, 5)
+        while sections > 0 or (target_size and size < target_size):
+            sections -= 1
+            section = [f"## {' '.join(self.words(rng, rng.randint(1, 4))).capitalize()}\n"]
+            for _ in range(rng.randint(1, 3)):
+                section.append(self.paragraph(rng, rng.randint(15, 90)) + '\n')
+            if rng.random() < 0.2:
+                section.append('\n'.join(f"- {' '.join(self.words(rng, rng.randint(2, 8)))}"
+                                         for _ in range(rng.randint(2, 6))) + '\n')
+            if rng.random() < 0.1:
+                section.append(f"```python\n{self.words(rng, 1)[0]} = {rng.randint(0, 999)}\n```\n")
+            text = '\n'.join(section)
+            size += len(text)
+            parts.append(text)
+        return '\n'.join(parts)
+
+    def path(self, rng, index):
+        folder = rng.choice(self.folders)
+        name = f"{self.titles[index]}.md"
+        return os.path.join(folder, name) if folder else name
+
+    def queries(self, count, seed=None):
+        """Perguntas sintéticas: termos frequentes, raros e trechos de títulos"""
+        rng = random.Random(self.seed + 1 if seed is None else seed)
+        queries = []
+        for i in range(count):
+            kind = i % 3
+            if kind == 0:
+                queries.append(' '.join(self.words(rng, rng.randint(2, 4))))
+            elif kind == 1:
+                queries.append(' '.join(rng.sample(self.vocabulary[500:], rng.randint(1, 3))))
+            else:
+                queries.append(' '.join(rng.choice(self.titles).split()[:2]))
+        return queries
+
+    def write(self, root, large_every=1000, large_sizes=(64 * 1024, 512 * 1024)):
+        """Grava o cofre em `root`; uma a cada `large_every` notas é um arquivo grande"""
+        rng = random.Random(self.seed)
+        total_bytes = 0
+        for folder in self.folders:
+            os.makedirs(os.path.join(root, folder), exist_ok=True)
+
+        for index in range(self.notes):
+            target_size = rng.randint(*large_sizes) if index % large_every == large_every - 1 else None
+            content = self.note(rng, index, target_size)
+            data = content.encode('utf-8')
+            with open(os.path.join(root, self.path(rng, index)), 'wb') as f:
+                f.write(data)
+            total_bytes += len(data)
+
+        with open(os.path.join(root, MANIFEST_NAME), 'w') as f:
+            json.dump({'notas': self.notes, 'semente': self.seed, 'bytes': total_bytes}, f)
+        return total_bytes
+
+
+def ensure_vault(root, notes, seed=42):
+    """Gera o cofre se ainda não existir com o mesmo tamanho e semente; retorna (vault, bytes, gerado)"""
+    vault = SyntheticVault(notes, seed)
+    manifest_path = os.path.join(root, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('notas') == notes and manifest.get('semente') == seed:
+            return vault, manifest['bytes'], False
+
+    shutil.rmtree(root, ignore_errors=True)
+    return vault, vault.write(root), True
@@ -0,0 +1,22 @@
+"""EchoNote: busca e perguntas com IA sobre as anotações de um cofre do Obsidian, sem interface gráfica"""
+from .cache import ResponseCache
+from .config import CONFIG_FILE, DEFAULT_CONFIG, load_config, save_config
+from .engine import VaultEngine
+from .gemini import GEMINI_MODEL, PROMPT_TEMPLATE, PROMPT_VERSION, CancelToken, GeminiClient, RequestCancelled
+from .index import BM25Index, reciprocal_rank_fusion, tokenize
+from .links import LinkGraph, expand_with_neighbors, extract_links
+from .metadata import MetadataIndex
+from .passages import Passage, estimate_tokens, pack_context, passage_key, split_passages
+from .scanner import VaultFile, VaultScanner
+from .shard import VaultShard
+from .store import NoteRecord, NoteStore, format_file_size, format_timestamp
+from .summaries import SummaryCache
+from .vectors import VectorIndex
+
+__all__ = [
+    'BM25Index', 'CONFIG_FILE', 'CancelToken', 'DEFAULT_CONFIG', 'GEMINI_MODEL', 'GeminiClient',
+    'LinkGraph', 'MetadataIndex', 'NoteRecord', 'NoteStore', 'PROMPT_TEMPLATE', 'PROMPT_VERSION', 'Passage', 'RequestCancelled', 'ResponseCache',
+    'SummaryCache', 'VaultEngine', 'VaultFile', 'VaultScanner', 'VaultShard', 'VectorIndex', 'estimate_tokens', 'expand_with_neighbors', 'extract_links', 'format_file_size',
+    'format_timestamp', 'load_config', 'pack_context', 'passage_key', 'reciprocal_rank_fusion',
+    'save_config', 'split_passages', 'tokenize',
+]
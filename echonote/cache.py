@@ -0,0 +1,172 @@
+"""Caches: respostas da IA em disco e resultados de busca em memória"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .index import fold_term
+from .store import batched
+
+
+class ResponseCache:
+    """Cache em disco (SQLite) das respostas da IA, com TTL e remoção LRU por quantidade e tamanho"""
+
+    BATCH_SIZE = 500
+
+    def __init__(self, path, max_entries=500, max_bytes=20 * 1024**2, ttl=7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    expires REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS response_notes (
+                    key TEXT NOT NULL,
+                    path TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS response_notes_path ON response_notes (path);
+                CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+            """)
+
+    @staticmethod
+    def make_key(model, prompt_version, fingerprints, question):
+        """Gera a chave a partir do modelo, versão do prompt, trechos usados (com hashes) e pergunta normalizada
+
+        A pergunta só perde maiúsculas, acentos e espaços extras: nenhuma palavra é
+        descartada, já que "como", "sem" ou "onde" mudam o que se pergunta.
+        """
+        normalized = ' '.join(fold_term(word) for word in question.lower().split())
+        payload = json.dumps([model, prompt_version, sorted(fingerprints), normalized], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Retorna a resposta em cache (atualizando o acesso) ou None"""
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT response, expires FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            if row[1] < now:
+                self.delete_keys([key])
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key, response, paths=(), ttl=None):
+        """Guarda uma resposta, associada às notas citadas, e aplica a política de remoção"""
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        with self.lock, self.conn:
+            self.delete_keys([key])
+            self.conn.execute(
+                "INSERT INTO responses (key, response, size, created, accessed, expires) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response, len(response.encode('utf-8')), now, now, expires)
+            )
+            self.conn.executemany(
+                "INSERT INTO response_notes (key, path) VALUES (?, ?)", [(key, path) for path in set(paths)]
+            )
+            self.evict(now)
+
+    def evict(self, now):
+        """Remove expirados e, depois, os menos usados até respeitar os limites"""
+        expired = [row[0] for row in self.conn.execute("SELECT key FROM responses WHERE expires < ?", (now,))]
+        self.delete_keys(expired)
+        
+        count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append(key)
+            count -= 1
+            total -= size
+        self.delete_keys(victims)
+
+    def invalidate_notes(self, paths):
+        """Descarta respostas que citaram alguma das notas alteradas ou removidas"""
+        with self.lock, self.conn:
+            keys = set()
+            for batch in batched(list(paths), self.BATCH_SIZE):
+                placeholders = ','.join('?' * len(batch))
+                keys.update(row[0] for row in self.conn.execute(
+                    f"SELECT key FROM response_notes WHERE path IN ({placeholders})", batch
+                ))
+            self.delete_keys(list(keys))
+        return len(keys)
+
+    def delete_keys(self, keys):
+        for batch in batched(keys, self.BATCH_SIZE):
+            placeholders = ','.join('?' * len(batch))
+            self.conn.execute(f"DELETE FROM responses WHERE key IN ({placeholders})", batch)
+            self.conn.execute(f"DELETE FROM response_notes WHERE key IN ({placeholders})", batch)
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.execute("DELETE FROM response_notes")
+
+
+def query_key(query):
+    """Forma normalizada de uma busca: minúsculas e espaços simples (os filtros e a tokenização ignoram o resto)"""
+    return ' '.join(query.lower().split())
+
+
+class QueryCache:
+    """Cache LRU em memória de busca -> resultados ranqueados
+
+    Cada resultado é guardado com a geração dos índices em que foi calculado e só
+    vale enquanto ela não muda: qualquer escaneamento ou carga de índice invalida
+    tudo o que foi calculado antes, sem precisar saber quais buscas foram afetadas.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # chave -> (geração, resultados), do menos para o mais recente
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generation):
+        """Resultados guardados para `key` na geração atual, ou None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != generation:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, key, generation, results):
+        with self.lock:
+            self.entries[key] = (generation, list(results))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'acertos': self.hits, 'falhas': self.misses, 'entradas': len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,243 @@
+"""Linha de comando: escanear o cofre, buscar trechos e perguntar à IA sem abrir a interface"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import CONFIG_FILE, load_config
+from .engine import VaultEngine
+from .store import format_file_size
+from .tracing import Trace, describe_timings, format_duration
+
+
+def build_parser():
+    """Monta o parser dos argumentos e subcomandos"""
+    parser = argparse.ArgumentParser(
+        prog='echonote',
+        description="Busca e perguntas com IA sobre as anotações do Obsidian, sem interface gráfica"
+    )
+    parser.add_argument('--config', default=CONFIG_FILE,
+                        help=f"arquivo de configuração (padrão: {CONFIG_FILE})")
+    parser.add_argument('--data-dir', default='.',
+                        help="pasta do banco de notas, índices e cache (padrão: pasta atual)")
+    parser.add_argument('--vault', dest='vaults', action='append', metavar='NOME',
+                        help="usa só este cofre (pode repetir; \"\" é o principal; padrão: todos)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan = subparsers.add_parser('scan', help="escaneia o cofre e atualiza os índices")
+    scan.add_argument('vault', nargs='?', help="diretório do cofre (padrão: o da configuração)")
+    scan.add_argument('--ignore', action='append', metavar='GLOB',
+                      help="padrão glob a ignorar (pode repetir; substitui o da configuração)")
+    scan.add_argument('--max-size', type=int, metavar='MB',
+                      help="ignora notas maiores que isso (0: sem limite; padrão: o da configuração)")
+
+    search = subparsers.add_parser('search', help="mostra os trechos mais relevantes para uma busca")
+    search.add_argument('query', help="texto da busca")
+    search.add_argument('-k', '--limit', type=int, default=5, help="quantidade de trechos (padrão: 5)")
+
+    ask = subparsers.add_parser('ask', help="faz uma pergunta à IA sobre as notas")
+    ask.add_argument('question', help="pergunta")
+    ask.add_argument('--json', action='store_true', help="imprime o resultado completo em JSON")
+    ask.add_argument('--broad', action=argparse.BooleanOptionalAction,
+                     help="responde sobre os resumos das notas (padrão: só perguntas como \"resuma...\")")
+
+    subparsers.add_parser('summarize', help="resume pela IA as notas que ainda não têm resumo")
+
+    subparsers.add_parser('vaults', help="lista os cofres configurados e quantas notas cada um tem")
+
+    duplicates = subparsers.add_parser('duplicates', help="lista os grupos de trechos quase iguais")
+    duplicates.add_argument('-n', '--limit', type=int, default=20, help="quantidade de grupos (padrão: 20)")
+
+    batch = subparsers.add_parser('batch', help="responde perguntas de um arquivo JSONL em paralelo")
+    batch.add_argument('input', help="arquivo JSONL com um objeto {\"pergunta\": ...} por linha ('-' para stdin)")
+    batch.add_argument('-o', '--output', default='-', help="arquivo JSONL de saída (padrão: stdout)")
+    batch.add_argument('-w', '--workers', type=int, default=4,
+                       help="perguntas processadas ao mesmo tempo (padrão: 4)")
+
+    return parser
+
+
+def print_progress(message):
+    """Mostra o andamento no stderr para não misturar com a saída dos comandos"""
+    print(message, file=sys.stderr)
+
+
+def run_scan(engine, args):
+    """Escaneia o cofre e imprime o resumo das mudanças"""
+    if args.ignore is not None:
+        engine.config['ignore_patterns'] = args.ignore
+    if args.max_size is not None:
+        engine.config['max_note_size_mb'] = args.max_size
+
+    engine.load()
+    summary = engine.scan(args.vault, args.vaults)
+    total_bytes = sum(note.size for note in engine.notes_data)
+    print(f"{summary['total']} notas ({format_file_size(total_bytes)}): {summary['novas']} novas, "
+          f"{summary['alteradas']} alteradas, {summary['removidas']} removidas")
+    for name, error in summary.get('erros', {}).items():
+        print_progress(f"⚠️ Cofre {name or 'principal'} não escaneado: {error}")
+    for path, reason in sorted(summary['arquivos_ignorados'].items()):
+        print_progress(f"⚠️ {path} ignorado: {reason}")
+    for path, encoding in sorted(summary['codificações'].items()):
+        print_progress(f"ℹ️ {path} lido como {encoding}")
+    print(f"⏱️ {format_duration(summary['tempos_ms']['total'])}: {describe_timings(summary['tempos_ms'])}",
+          file=sys.stderr)
+
+
+def run_search(engine, args):
+    """Imprime os trechos mais relevantes com a pontuação de cada um"""
+    engine.load()
+    ranked = engine.find_relevant_passages(args.query, limit=args.limit, vaults=args.vaults)
+    passages = engine.get_passages([key for key, score in ranked])
+
+    for key, score in ranked:
+        passage = passages.get(key)
+        if passage is None:
+            continue
+        heading = f" › {passage['cabeçalho']}" if passage['cabeçalho'] else ''
+        preview = ' '.join(passage['texto'].split())[:160]
+        print(f"{score:8.3f}  {passage['caminho']}{heading}\n          {preview}")
+
+
+def run_ask(engine, args):
+    """Responde uma pergunta, mostrando a resposta enquanto é gerada quando possível"""
+    engine.load()
+    streamed = False
+
+    def show_chunk(chunk):
+        nonlocal streamed
+        streamed = True
+        sys.stdout.write(chunk)
+        sys.stdout.flush()
+
+    trace = Trace('pergunta')
+    result = engine.ask(args.question, on_chunk=None if args.json else show_chunk, trace=trace, vaults=args.vaults,
+                        broad=args.broad)
+    engine.record_metrics(trace)
+
+    if args.json:
+        result['tempos_ms'] = trace.timings()
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    if not streamed:
+        sys.stdout.write(result['resposta'])
+    print("\n")
+    for citation in result['citações']:
+        heading = f" › {citation['cabeçalho']}" if citation['cabeçalho'] else ''
+        heading += " (resumo)" if citation['trecho'] is None else ''
+        print(f"📄 {citation['arquivo']}{heading}")
+
+    origin = " (resposta em cache)" if result['em_cache'] else ''
+    print(f"⏱️ {format_duration(trace.spans['total'])}{origin}: {describe_timings(trace.spans)} | "
+          f"{result['tokens']['prompt']}+{result['tokens']['resposta']} tokens", file=sys.stderr)
+
+
+def run_vaults(engine, args):
+    """Lista os cofres: nome, diretório e notas no banco de cada um"""
+    for shard in engine.select(args.vaults):
+        print(f"{shard.name or '(principal)':<20} {shard.note_store.count():>8} notas  {shard.root}")
+
+
+def run_summarize(engine, args):
+    """Resume as notas que ainda não têm resumo (ou cujo conteúdo mudou)"""
+    engine.load()
+    summary = engine.summarize_vaults(args.vaults)
+    print(f"{summary['notas']} notas: {summary['resumidas']} resumidas, {summary['em_cache']} já tinham resumo, "
+          f"{summary['descartados']} resumos antigos descartados")
+    for path, error in sorted(summary['erros'].items()):
+        print_progress(f"⚠️ {path} não resumida: {error}")
+    print(f"⏱️ {format_duration(summary['tempos_ms']['total'])}", file=sys.stderr)
+    return 1 if summary['erros'] else 0
+
+
+def run_duplicates(engine, args):
+    """Lista os grupos de trechos quase iguais, do maior para o menor"""
+    engine.load()
+    groups = engine.duplicate_report(args.vaults, limit=args.limit)
+    if not groups:
+        print_progress("Nenhum trecho repetido encontrado")
+    for group in groups:
+        print(f"{len(group['trechos'])} cópias em {group['notas']} notas: {group['prévia']}")
+        for key in group['trechos']:
+            print(f"          {key}")
+
+
+def read_questions(path):
+    """Lê as perguntas do arquivo JSONL, ignorando linhas vazias"""
+    stream = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        return [json.loads(line) for line in stream if line.strip()]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def run_batch(engine, args):
+    """Responde as perguntas em paralelo e grava os resultados na mesma ordem da entrada"""
+    engine.load()
+    items = read_questions(args.input)
+
+    def answer(item):
+        try:
+            result = engine.ask(item['pergunta'], vaults=args.vaults)
+        except Exception as e:
+            result = {'pergunta': item.get('pergunta'), 'erro': str(e)}
+        if 'id' in item:
+            result = {'id': item['id'], **result}
+        return result
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    started = time.perf_counter()
+    failures = 0
+    try:
+        # map() devolve os resultados na ordem das perguntas, mesmo concluídas fora de ordem
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            for result in executor.map(answer, items):
+                failures += 'erro' in result
+                output.write(json.dumps(result, ensure_ascii=False) + '\n')
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    print_progress(f"{len(items)} perguntas em {elapsed:.1f} s ({failures} com erro)")
+    return 1 if failures else 0
+
+
+COMMANDS = {
+    'scan': run_scan,
+    'search': run_search,
+    'ask': run_ask,
+    'batch': run_batch,
+    'vaults': run_vaults,
+    'duplicates': run_duplicates,
+    'summarize': run_summarize,
+}
+
+
+def main(argv=None):
+    """Ponto de entrada de `python -m echonote`"""
+    args = build_parser().parse_args(argv)
+
+    config = load_config(args.config)
+    config['api_key'] = os.environ.get('GEMINI_API_KEY', config['api_key'])
+    config['api_base'] = os.environ.get('GEMINI_API_BASE', config['api_base'])
+
+    if args.command in ('ask', 'batch', 'summarize') and not config['api_key']:
+        print_progress("Configure a chave da API (arquivo de configuração ou variável GEMINI_API_KEY)")
+        return 2
+
+    engine = VaultEngine(config, args.data_dir)
+    engine.on_status = print_progress
+
+    try:
+        return COMMANDS[args.command](engine, args) or 0
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        print_progress(f"❌ Erro: {e}")
+        return 1
@@ -0,0 +1,45 @@
+"""Configuração compartilhada pela interface gráfica e pela linha de comando"""
+import json
+import os
+
+CONFIG_FILE = "obsidian_config.json"
+
+DEFAULT_CONFIG = {
+    'api_key': '',
+    'api_base': '',  # outro endereço da API (ex.: o servidor local de benchmarks.mock_gemini); vazio: o do Google
+    'obsidian_path': r"C:",
+    'vaults': [],  # cofres adicionais: [{'nome': 'Pesquisa', 'caminho': '...'}]
+    'ignore_patterns': [],
+    'max_note_size_mb': 50,  # notas maiores ficam de fora do escaneamento (0: sem limite)
+    'note_encodings': ['utf-8', 'cp1252', 'latin-1'],  # tentadas em ordem ao ler as notas
+    'context_token_budget': 2000,
+    'stream_responses': True,
+    'semantic_search': True,
+    'vector_dimensions': 128,
+    'link_boost': True,
+    'collapse_duplicates': True,  # de trechos quase iguais, só o mais relevante vai para o contexto
+    'max_parallel_requests': 2,
+    'broad_questions': True,       # perguntas como "resuma minhas notas sobre..." são respondidas sobre os resumos
+    'broad_max_notes': 60,         # notas consideradas numa pergunta ampla
+    'broad_context_tokens': 8000,  # resumos por chamada; além disso, map-reduce
+    'summary_workers': 3,          # notas resumidas ao mesmo tempo (sobra conexão para o chat)
+    'chat_scrollback_lines': 5000,
+}
+
+
+def load_config(path=CONFIG_FILE):
+    """Carrega as configurações do arquivo, completando com os valores padrão"""
+    config = dict(DEFAULT_CONFIG)
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                config.update(json.load(f))
+    except Exception as e:
+        print(f"Erro ao carregar configurações: {e}")
+    return config
+
+
+def save_config(config, path=CONFIG_FILE):
+    """Salva as configurações no arquivo"""
+    with open(path, 'w') as f:
+        json.dump(config, f)
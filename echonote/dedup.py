@@ -0,0 +1,257 @@
+"""Assinaturas MinHash dos trechos e LSH para achar quase-duplicatas (modelos, rotina de notas diárias, cópias)"""
+import os
+import re
+import zlib
+import pickle
+from array import array
+
+from .vectors import load_numpy
+
+WORD_PATTERN = re.compile(r"\w+")
+MASK = 0xFFFFFFFF
+SLOTS = 32             # valores da assinatura
+BANDS = 8              # faixas do LSH (SLOTS / BANDS valores cada)
+SHINGLE_WORDS = 3
+MIN_WORDS = 8          # trechos mais curtos não recebem assinatura
+VALUE_BITS = 27        # o hash de 32 bits dá 5 bits de compartimento e 27 de valor
+
+
+def mix(h):
+    """Finalizador do MurmurHash3: espalha os bits de um inteiro de 32 bits"""
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & MASK
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & MASK
+    return h ^ (h >> 16)
+
+
+def minhash_signature(text):
+    """Assinatura MinHash do texto (shingles de 3 palavras); None se o texto for curto demais
+
+    Usa uma permutação só (one permutation hashing): cada shingle cai num dos
+    SLOTS compartimentos pelo próprio hash e cada compartimento guarda o menor
+    valor. Compartimentos vazios copiam o próximo cheio (densificação), com um
+    deslocamento pela distância. A fração de valores iguais entre duas
+    assinaturas estima a semelhança de Jaccard dos textos.
+    """
+    words = [zlib.crc32(word.encode()) for word in WORD_PATTERN.findall(text.lower())]
+    if len(words) < MIN_WORDS:
+        return None
+
+    np = load_numpy()
+    if np is not None:
+        hashes = np.array(words, dtype=np.uint64)
+        shingles = (hashes[:-2] * 0x9E3779B1 + hashes[1:-1] * 0x7FEB352D + hashes[2:]) & MASK
+        shingles ^= shingles >> 16
+        shingles = (shingles * 0x85EBCA6B) & MASK
+        shingles ^= shingles >> 13
+        shingles = (shingles * 0xC2B2AE35) & MASK
+        shingles ^= shingles >> 16
+        minimums = np.full(SLOTS, MASK, dtype=np.uint64)
+        np.minimum.at(minimums, shingles % SLOTS, shingles >> 5)
+        minimums = minimums.tolist()
+    else:
+        minimums = [MASK] * SLOTS
+        for i in range(len(words) - SHINGLE_WORDS + 1):
+            h = mix((words[i] * 0x9E3779B1 + words[i + 1] * 0x7FEB352D + words[i + 2]) & MASK)
+            slot, value = h % SLOTS, h >> 5
+            if value < minimums[slot]:
+                minimums[slot] = value
+
+    signature = []
+    for slot in range(SLOTS):
+        distance = 0
+        while minimums[(slot + distance) % SLOTS] == MASK:
+            distance += 1
+        signature.append(minimums[(slot + distance) % SLOTS] + (distance << VALUE_BITS))
+    return tuple(signature)
+
+
+def similarity(first, second):
+    """Semelhança de Jaccard estimada entre duas assinaturas"""
+    return sum(a == b for a, b in zip(first, second)) / SLOTS
+
+
+def band_keys(signature):
+    """Uma chave por faixa da assinatura (o número da faixa e seus valores num inteiro só)
+
+    Trechos com alguma faixa igual são candidatos a quase-duplicatas.
+    """
+    rows = SLOTS // BANDS
+    keys = []
+    for band in range(BANDS):
+        key = band
+        for value in signature[band * rows:(band + 1) * rows]:
+            key = key << 32 | value
+        keys.append(key)
+    return keys
+
+
+def collapse_duplicates(ranked, signatures, threshold):
+    """Mantém, de cada grupo de trechos quase iguais, só o mais bem colocado; retorna (ranking, omitidos)
+
+    `signatures` mapeia chave -> assinatura (trechos sem assinatura nunca são omitidos).
+    """
+    kept = []
+    kept_signatures = []
+    bands = {}  # chave da faixa -> índices em kept_signatures
+    omitted = 0
+    for key, score in ranked:
+        signature = signatures.get(key)
+        if signature is None:
+            kept.append((key, score))
+            continue
+        keys = band_keys(signature)
+        candidates = {index for band in keys for index in bands.get(band, ())}
+        if any(similarity(signature, kept_signatures[index]) >= threshold for index in candidates):
+            omitted += 1
+            continue
+        kept.append((key, score))
+        for band in keys:
+            bands.setdefault(band, []).append(len(kept_signatures))
+        kept_signatures.append(signature)
+    return kept, omitted
+
+
+class DuplicateIndex:
+    """Assinaturas MinHash de todos os trechos, com LSH para achar quase-duplicatas sem comparar tudo com tudo
+
+    As assinaturas ficam num array compacto (SLOTS valores por linha). Cada faixa
+    da assinatura aponta, num dicionário, para as linhas que a têm: incluir ou
+    procurar um trecho custa algumas consultas a esse dicionário, qualquer que
+    seja o tamanho do cofre.
+    """
+
+    VERSION = 1
+    THRESHOLD = 0.8   # semelhança estimada a partir da qual dois trechos são quase iguais
+
+    def __init__(self):
+        self.signatures = array('I')  # linha -> SLOTS valores
+        self.keys = []                # linha -> chave do trecho (None se removido)
+        self.key_to_row = {}
+        self.buckets = {}             # chave da faixa -> linha, ou lista de linhas se mais de uma
+        self.removed = 0
+        self.stamp = None             # identifica a versão salva, conferida com o banco
+
+    def __len__(self):
+        return len(self.key_to_row)
+
+    def add(self, key, text):
+        """Inclui (ou substitui) um trecho"""
+        self.remove(key)
+        signature = minhash_signature(text)
+        if signature is not None:
+            self.insert(key, signature)
+
+    def insert(self, key, signature):
+        row = len(self.keys)
+        self.keys.append(key)
+        self.key_to_row[key] = row
+        self.signatures.extend(signature)
+        for band in band_keys(signature):
+            rows = self.buckets.get(band)
+            if rows is None:
+                self.buckets[band] = row
+            elif isinstance(rows, list):
+                rows.append(row)
+            else:
+                self.buckets[band] = [rows, row]
+
+    def remove(self, key):
+        row = self.key_to_row.pop(key, None)
+        if row is None:
+            return
+        for band in band_keys(self.row_signature(row)):
+            rows = self.buckets[band]
+            if isinstance(rows, list):
+                rows.remove(row)
+                if len(rows) == 1:
+                    self.buckets[band] = rows[0]
+            else:
+                del self.buckets[band]
+        self.keys[row] = None
+        self.removed += 1
+        if self.removed > 1000 and self.removed > len(self.key_to_row):
+            self.compact()
+
+    def compact(self):
+        """Descarta as linhas removidas, refazendo o array e os compartimentos"""
+        live = [(key, self.row_signature(row)) for row, key in enumerate(self.keys) if key is not None]
+        self.signatures, self.keys, self.key_to_row, self.buckets = array('I'), [], {}, {}
+        self.removed = 0
+        for key, signature in live:
+            self.insert(key, signature)
+
+    def row_signature(self, row):
+        return tuple(self.signatures[row * SLOTS:(row + 1) * SLOTS])
+
+    def signature(self, key):
+        """Assinatura de um trecho (None se desconhecido ou curto demais)"""
+        row = self.key_to_row.get(key)
+        return self.row_signature(row) if row is not None else None
+
+    def similar(self, key):
+        """Trechos quase iguais a `key`, como lista de (chave, semelhança estimada)"""
+        signature = self.signature(key)
+        if signature is None:
+            return []
+        candidates = set()
+        for band in band_keys(signature):
+            rows = self.buckets.get(band, ())
+            candidates.update(rows if isinstance(rows, list) else (rows,))
+        candidates.discard(self.key_to_row[key])
+        found = ((self.keys[row], similarity(signature, self.row_signature(row))) for row in candidates)
+        return sorted((item for item in found if item[1] >= self.THRESHOLD), key=lambda item: -item[1])
+
+    def clusters(self):
+        """Grupos de trechos quase iguais (com mais de um trecho), do maior para o menor
+
+        Só compara linhas que dividem alguma faixa; dentro de uma faixa cada linha
+        entra no grupo do primeiro representante parecido com ela.
+        """
+        parent = list(range(len(self.keys)))
+
+        def find(row):
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        for rows in self.buckets.values():
+            if not isinstance(rows, list):
+                continue
+            representatives = []
+            for row in rows:
+                signature = self.row_signature(row)
+                for other, other_signature in representatives:
+                    if similarity(signature, other_signature) >= self.THRESHOLD:
+                        parent[find(row)] = find(other)
+                        break
+                else:
+                    representatives.append((row, signature))
+
+        groups = {}
+        for row, key in enumerate(self.keys):
+            if key is not None:
+                groups.setdefault(find(row), []).append(key)
+        return sorted((sorted(keys) for keys in groups.values() if len(keys) > 1), key=len, reverse=True)
+
+    def save(self, path):
+        """Grava o índice em disco de forma atômica e retorna o novo carimbo de versão"""
+        self.stamp = os.urandom(8).hex()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.VERSION, self.__dict__), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return self.stamp
+
+    @classmethod
+    def load(cls, path):
+        """Carrega um índice salvo; retorna None se o arquivo for de outra versão"""
+        with open(path, 'rb') as f:
+            version, state = pickle.load(f)
+        if version != cls.VERSION:
+            return None
+        index = cls()
+        index.__dict__.update(state)
+        return index
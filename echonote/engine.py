@@ -0,0 +1,630 @@
+"""Núcleo sem interface gráfica: cofres indexados, busca, contexto e chamadas à IA"""
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .cache import QueryCache, ResponseCache, query_key
+from .config import DEFAULT_CONFIG
+from .dedup import DuplicateIndex, collapse_duplicates
+from .gemini import (GEMINI_MODEL, MAP_PROMPT, PROMPT_TEMPLATE, PROMPT_VERSION, SUMMARY_PROMPT,
+                     SUMMARY_PROMPT_VERSION, CancelToken, GeminiClient, RequestCancelled)
+from .index import reciprocal_rank_fusion
+from .metadata import has_relative_date
+from .passages import estimate_tokens, pack_context, passage_key
+from .shard import VAULT_SEPARATOR, VaultShard
+from .store import NoteRecord
+from .summaries import SummaryCache, group_blocks, is_broad_question, split_for_summary, summary_block
+from .tracing import MetricsLog, Trace, current_trace, span
+
+# Resumos feitos com outro modelo ou outro prompt não valem
+SUMMARY_VERSION = f"{GEMINI_MODEL}/{SUMMARY_PROMPT_VERSION}"
+# Respostas sobre resumos ficam no cache separadas das respostas sobre trechos
+BROAD_PROMPT_VERSION = f"{PROMPT_VERSION}/resumos-{SUMMARY_PROMPT_VERSION}"
+
+
+def validate_vault_name(name):
+    """Confere se o nome serve de prefixo dos caminhos e de nome de pasta; levanta ValueError se não"""
+    if not name or name != name.strip() or name.startswith('.') or any(char in name for char in ':/\\'):
+        raise ValueError(f"Nome de cofre inválido: {name!r} (não pode ser vazio, começar com '.' "
+                         "nem conter ':', '/' ou '\\')")
+
+
+class VaultEngine:
+    """Mantém um ou mais cofres indexados e responde perguntas sobre as notas deles
+
+    O cofre principal (`obsidian_path`) guarda banco e índices em `data_dir`, como
+    sempre; cada cofre registrado em `vaults` é um shard à parte, em
+    `data_dir/cofres/<nome>`, escaneado e carregado de forma independente. As
+    buscas consultam os cofres escolhidos em paralelo e juntam os melhores trechos.
+    """
+
+    PASSAGE_CANDIDATES = 30
+    VAULTS_DIR = 'cofres'
+    SEARCH_THREADS = 8
+    BROAD_CANDIDATES = 200       # trechos buscados para escolher as notas de uma pergunta ampla
+    MAP_ROUNDS = 3               # rodadas de redução dos resumos que não cabem numa chamada só
+    SUMMARY_PART_TOKENS = 6000   # tamanho de cada parte de uma nota enviada para resumo
+    SUMMARY_PARTS = 8            # partes resumidas de uma nota muito grande; o resto fica de fora
+    SUMMARY_MAX_FAILURES = 5     # falhas seguidas (chave inválida, cota esgotada...) que interrompem os resumos
+
+    def __init__(self, config=None, data_dir='.'):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.data_dir = data_dir
+        self.cache_file = os.path.join(data_dir, "obsidian_cache.db")
+        self.metrics_file = os.path.join(data_dir, "obsidian_metrics.jsonl")
+        self.summary_file = os.path.join(data_dir, "obsidian_summaries.db")
+
+        self.response_cache = ResponseCache(self.cache_file)
+        self.query_cache = QueryCache()
+        self.summary_cache = SummaryCache(self.summary_file)
+        self.gemini_client = GeminiClient(base_url=self.config['api_base'])
+        self.metrics = MetricsLog(self.metrics_file)
+        self.shards = {}           # nome -> VaultShard ('' é o cofre principal)
+        self.search_executor = None
+        self.executor_lock = threading.Lock()
+        self.warm = threading.Event()  # índices de todos os cofres completos em memória
+
+        # Ganchos para quem quiser acompanhar o andamento (ex.: a barra de status da interface)
+        self.on_status = lambda message: None
+        self.on_progress = lambda percent: None
+
+        self.configure_vaults()
+
+    # Cofres
+
+    def configure_vaults(self):
+        """Abre um shard para cada cofre da configuração, mantendo os que já estavam abertos
+
+        Retorna os shards abertos agora, ainda não carregados (ver VaultShard.load).
+        """
+        names = [''] + [vault['nome'] for vault in self.config['vaults']]
+        for name in names[1:]:
+            validate_vault_name(name)
+        if len(set(names)) != len(names):
+            raise ValueError("Há cofres com o mesmo nome na configuração")
+
+        shards = {}
+        opened = []
+        for name in names:
+            shard = self.shards.get(name)
+            if shard is None:
+                data_dir = os.path.join(self.data_dir, self.VAULTS_DIR, name) if name else self.data_dir
+                os.makedirs(data_dir, exist_ok=True)
+                shard = VaultShard(self, name, data_dir)
+                opened.append(shard)
+            shards[name] = shard
+        for name, shard in self.shards.items():
+            if name not in shards:
+                shard.note_store.close()
+        self.shards = shards
+        return opened
+
+    def select(self, vaults=None):
+        """Cofres consultados: todos, ou só os nomeados em `vaults` ('' é o principal)"""
+        if vaults is None:
+            return list(self.shards.values())
+        return [shard for name, shard in self.shards.items() if name in vaults]
+
+    def route(self, path):
+        """Cofre e caminho local de um caminho (ou chave de trecho) com o prefixo do cofre"""
+        name, separator, local = path.partition(VAULT_SEPARATOR)
+        if separator and name and name in self.shards:
+            return self.shards[name], local
+        return self.shards[''], path
+
+    @property
+    def notes_data(self):
+        """Notas de todos os cofres; as dos cofres com nome levam o prefixo no caminho"""
+        notes = list(self.shards[''].notes_data)
+        for shard in self.select()[1:]:
+            notes.extend(qualified_notes(shard, shard.notes_data))
+        return notes
+
+    def note_count(self):
+        return sum(len(shard.notes_data) for shard in self.shards.values())
+
+    # Carregamento e escaneamento
+
+    def has_saved_notes(self):
+        """Indica se algum cofre tem notas no banco (ou um CSV antigo a migrar)"""
+        return any(shard.has_saved_notes() for shard in self.shards.values())
+
+    def load(self, on_ready=None):
+        """Carrega todos os cofres em paralelo (ver VaultShard.load); retorna as notas
+
+        `on_ready(notas)` é chamado quando todos os cofres já aceitam perguntas, e
+        `warm` fica marcado quando os índices de todos terminam de carregar.
+        """
+        self.warm.clear()
+        shards = self.select()
+        pending = len(shards)
+        lock = threading.Lock()
+
+        def shard_ready(notes):
+            nonlocal pending
+            with lock:
+                pending -= 1
+                ready = not pending
+            if ready and on_ready is not None:
+                on_ready(self.notes_data)
+
+        try:
+            if len(shards) == 1:
+                shards[0].load(shard_ready)
+            else:
+                with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix='carga') as executor:
+                    list(executor.map(lambda shard: shard.load(shard_ready), shards))
+        finally:
+            self.warm.set()
+        return self.notes_data
+
+    def scan(self, obsidian_path=None, vaults=None):
+        """Escaneia os cofres, um de cada vez (todos, ou só os nomeados em `vaults`)
+
+        `obsidian_path` substitui o diretório do cofre principal. Retorna o resumo de
+        VaultShard.scan somado entre os cofres, com os caminhos (das mudanças e dos
+        arquivos ignorados) já com o prefixo do cofre; com mais de um cofre, 'cofres'
+        traz o resumo de cada um e 'erros' os que não puderam ser escaneados (ex.:
+        disco desconectado).
+        """
+        shards = self.select(vaults)
+        summaries = {}
+        errors = {}
+        for shard in shards:
+            try:
+                summaries[shard.name] = shard.scan(None if shard.name else obsidian_path)
+            except Exception as e:
+                if len(shards) == 1:
+                    raise
+                errors[shard.name] = str(e)
+        if not summaries:
+            raise Exception('; '.join(f"{name or 'principal'}: {error}" for name, error in errors.items()))
+
+        summary = {'total': 0, 'novas': 0, 'alteradas': 0, 'removidas': 0, 'ignorados': 0}
+        timings = {}
+        changes = {'notas': [], 'removidas': []}
+        report = {'arquivos_ignorados': {}, 'codificações': {}}
+        for name, result in summaries.items():
+            shard = self.shards[name]
+            for key in summary:
+                summary[key] += result[key]
+            for stage, milliseconds in result['tempos_ms'].items():
+                timings[stage] = round(timings.get(stage, 0.0) + milliseconds, 1)
+            changes['notas'].extend(qualified_notes(shard, result['mudanças']['notas']))
+            changes['removidas'].extend(shard.qualify(path) for path in result['mudanças']['removidas'])
+            for key, files in report.items():
+                files.update((shard.qualify(path), value) for path, value in result[key].items())
+
+        summary['tempos_ms'] = timings
+        summary['mudanças'] = changes
+        summary.update(report)
+        if len(shards) > 1:
+            summary['cofres'] = {name: {key: result[key] for key in ('total', 'novas', 'alteradas', 'removidas')}
+                                 for name, result in summaries.items()}
+            summary['erros'] = errors
+        return summary
+
+    # Busca e respostas
+
+    def find_relevant_passages(self, query, limit=5, vaults=None):
+        """Encontra os trechos mais relevantes, consultando os cofres em paralelo
+
+        Cada cofre pontua só as próprias notas (ver VaultShard.find_relevant_passages);
+        as chaves voltam com o prefixo do cofre. As pontuações de cofres diferentes não
+        são comparáveis (estatísticas do BM25 próprias, fusão com vetores ou FTS5 durante
+        o carregamento), então as listas são combinadas pela posição (RRF). Com `collapse_duplicates`, de cada
+        grupo de trechos quase iguais (modelos, cópias) fica só o mais bem colocado.
+        """
+        shards = self.select(vaults)
+        collapse = self.config['collapse_duplicates']
+        # A mesma busca (ou a de uma pergunta de acompanhamento) não é pontuada de novo
+        # enquanto nenhum dos cofres consultados mudar. Filtros como `after:7d` dependem
+        # da hora da busca e nunca vão para o cache
+        cacheable = not has_relative_date(query)
+        cache_key = (query_key(query), limit, None if vaults is None else frozenset(vaults),
+                     self.config['semantic_search'], self.config['link_boost'], collapse)
+        generation = tuple((shard.name, shard.generation) for shard in shards)
+        cached = self.query_cache.get(cache_key, generation) if cacheable else None
+        trace = current_trace()
+        if trace is not None:
+            trace.set('busca_em_cache', cached is not None)
+        if cached is not None:
+            return cached
+
+        # Folga para os trechos repetidos que saem do ranking
+        candidates = limit * 2 if collapse else limit
+        if len(shards) == 1:
+            # Um cofre só: na própria thread, sem custo de coordenação (e com o trace ativo)
+            ranked = qualified_results(shards[0], shards[0].find_relevant_passages(query, candidates))
+        else:
+            executor = self.get_search_executor()
+            futures = [executor.submit(shard.find_relevant_passages, query, candidates) for shard in shards]
+            ranked = [qualified_results(shard, future.result()) for shard, future in zip(shards, futures)]
+            ranked = reciprocal_rank_fusion(ranked, candidates)
+
+        if collapse:
+            ranked, omitted = collapse_duplicates(ranked, self.duplicate_signatures(key for key, _ in ranked),
+                                                  DuplicateIndex.THRESHOLD)
+            if trace is not None and omitted:
+                trace.set('duplicatas_omitidas', omitted)
+        ranked = ranked[:limit]
+        if cacheable:
+            self.query_cache.put(cache_key, generation, ranked)
+        return ranked
+
+    def duplicate_signatures(self, keys):
+        """Assinaturas MinHash dos trechos pedidos, de qualquer cofre (comparáveis entre cofres)"""
+        by_shard = defaultdict(list)
+        for key in keys:
+            shard, local_key = self.route(key)
+            by_shard[shard].append(local_key)
+
+        signatures = {}
+        for shard, local_keys in by_shard.items():
+            for key, signature in shard.duplicate_signatures(local_keys).items():
+                signatures[shard.qualify(key)] = signature
+        return signatures
+
+    def duplicate_report(self, vaults=None, limit=200):
+        """Grupos de trechos quase iguais de cada cofre, do maior para o menor
+
+        Retorna até `limit` grupos {'trechos': [chaves], 'notas': quantas notas
+        diferentes, 'prévia': início do texto do primeiro trecho}.
+        """
+        groups = []
+        for shard in self.select(vaults):
+            with shard.index_lock:
+                clusters = shard.duplicate_index.clusters()
+            groups.extend([shard.qualify(key) for key in keys] for keys in clusters)
+        groups = sorted(groups, key=len, reverse=True)[:limit]
+
+        passages = self.get_passages([keys[0] for keys in groups])
+        report = []
+        for keys in groups:
+            passage = passages.get(keys[0])
+            preview = ' '.join(passage['texto'].split())[:120] if passage else ''
+            report.append({'trechos': keys, 'notas': len({key.rpartition('#')[0] for key in keys}),
+                           'prévia': preview})
+        return report
+
+    def get_search_executor(self):
+        with self.executor_lock:
+            if self.search_executor is None:
+                self.search_executor = ThreadPoolExecutor(max_workers=self.SEARCH_THREADS,
+                                                          thread_name_prefix='busca')
+            return self.search_executor
+
+    def get_passages(self, keys):
+        """Trechos pelo identificador, de qualquer cofre (ver NoteStore.get_passages)"""
+        by_shard = defaultdict(list)
+        for key in keys:
+            shard, local_key = self.route(key)
+            by_shard[shard].append(local_key)
+
+        passages = {}
+        for shard, local_keys in by_shard.items():
+            for key, passage in shard.note_store.get_passages(local_keys).items():
+                if shard.name:
+                    passage['caminho'] = shard.qualify(passage['caminho'])
+                passages[shard.qualify(key)] = passage
+        return passages
+
+    def get_hashes(self, paths):
+        """Hash do conteúdo atual de cada nota, de qualquer cofre"""
+        by_shard = defaultdict(list)
+        for path in paths:
+            shard, local_path = self.route(path)
+            by_shard[shard].append(local_path)
+
+        hashes = {}
+        for shard, local_paths in by_shard.items():
+            for path, content_hash in shard.note_store.get_hashes(local_paths).items():
+                hashes[shard.qualify(path)] = content_hash
+        return hashes
+
+    def strip_filters(self, question, vaults=None):
+        """Texto da pergunta sem os filtros (tag:, path:...), que só escolhem as notas
+
+        Campos do frontmatter só viram filtro no cofre que os tem: vale o cofre que
+        reconheceu mais filtros.
+        """
+        texts = [shard.metadata_index.parse_query(question)[0] for shard in self.select(vaults)]
+        return min(texts, key=len, default='') or question
+
+    def prepare_context(self, user_message, vaults=None):
+        """Prepara o contexto com os trechos mais relevantes; retorna (contexto, trechos usados)"""
+        with span('busca'):
+            ranked = self.find_relevant_passages(user_message, limit=self.PASSAGE_CANDIDATES, vaults=vaults)
+
+        with span('contexto'):
+            passages = self.get_passages([key for key, score in ranked])
+            return pack_context(
+                [passages[key] for key, score in ranked if key in passages],
+                self.config['context_token_budget']
+            )
+
+    def response_cache_key(self, message, passage_keys, prompt_version=PROMPT_VERSION):
+        """Calcula a chave do cache de respostas; retorna (chave, notas citadas)"""
+        paths = {key.rpartition('#')[0] for key in passage_keys}
+        hashes = self.get_hashes(paths)
+        fingerprints = [f"{key}:{hashes.get(key.rpartition('#')[0], '')}" for key in passage_keys]
+        return ResponseCache.make_key(GEMINI_MODEL, prompt_version, fingerprints, message), paths
+
+    def get_ai_response(self, message, context, passage_keys, ttl=None, cancel_token=None, on_chunk=None,
+                        prompt_version=PROMPT_VERSION):
+        """Consulta o cache de respostas antes de chamar a API; retorna (resposta, veio_do_cache)
+
+        Com `on_chunk` e streaming ativado, cada pedaço da resposta é entregue assim que chega.
+        `context` também pode ser uma função, chamada só quando a resposta não está em cache.
+        """
+        with span('cache'):
+            cache_key, paths = self.response_cache_key(message, passage_keys, prompt_version)
+            cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return cached, True
+
+        if callable(context):
+            context = context()
+        prompt = PROMPT_TEMPLATE.format(context=context, message=message)
+        if on_chunk and self.config['stream_responses']:
+            parts = []
+            for chunk in self.gemini_client.stream(self.config['api_key'], prompt, cancel_token):
+                parts.append(chunk)
+                on_chunk(chunk)
+            response = ''.join(parts)
+        else:
+            response = self.gemini_client.generate(self.config['api_key'], prompt, cancel_token)
+
+        self.response_cache.put(cache_key, response, paths, ttl)
+        return response, False
+
+    def ask(self, question, cancel_token=None, on_chunk=None, trace=None, vaults=None, broad=None):
+        """Responde uma pergunta sobre as notas; retorna resposta, citações e tempos de cada etapa
+
+        `vaults` limita os cofres consultados (None: todos). Perguntas amplas ("resuma
+        minhas notas sobre...") são respondidas sobre os resumos das notas (ver
+        `ask_broad`); `broad` força um modo ou outro (None: decide pela pergunta,
+        se `broad_questions` estiver ligado). Sem `trace`, a pergunta é registrada no
+        arquivo de métricas ao terminar. Quem passa o próprio trace (a interface, que
+        ainda mede a renderização) registra depois com `record_metrics`.
+        """
+        own_trace = trace is None
+        trace = trace or Trace('pergunta')
+        if broad is None:
+            broad = self.config['broad_questions'] and is_broad_question(question)
+        with trace.activate():
+            # Os filtros (tag:, path:...) só escolhem as notas; a IA recebe o resto da pergunta
+            message = self.strip_filters(question, vaults)
+            if broad:
+                answer, cached, context, paths = self.ask_broad(question, message, vaults, cancel_token, on_chunk)
+                citations = [{'arquivo': path, 'cabeçalho': '', 'trecho': None} for path in paths]
+                trace.set('modo', 'resumos')
+                trace.set('notas', len(paths))
+            else:
+                context, passages = self.prepare_context(question, vaults)
+                keys = [passage_key(passage['caminho'], passage['ordem']) for passage in passages]
+                answer, cached = self.get_ai_response(message, context, keys,
+                                                      cancel_token=cancel_token, on_chunk=on_chunk)
+                citations = [{'arquivo': passage['caminho'], 'cabeçalho': passage['cabeçalho'],
+                              'trecho': passage['ordem']} for passage in passages]
+                trace.set('trechos', len(passages))
+
+        # Sem usageMetadata (ex.: resposta do cache) os tokens são estimados
+        trace.set('em_cache', cached)
+        trace.values.setdefault('tokens_prompt', estimate_tokens(PROMPT_TEMPLATE) + estimate_tokens(context)
+                                + estimate_tokens(question))
+        trace.values.setdefault('tokens_resposta', estimate_tokens(answer))
+
+        if own_trace:
+            self.record_metrics(trace)
+
+        return {
+            'pergunta': question,
+            'resposta': answer,
+            'em_cache': cached,
+            'citações': citations,
+            'tempos_ms': trace.timings(),
+            'tokens': {'prompt': trace.values['tokens_prompt'], 'resposta': trace.values['tokens_resposta']}
+        }
+
+    # Resumos e perguntas amplas
+
+    def summarize_note(self, path, cancel_token=None):
+        """Resume uma nota pela IA, em partes se for grande; retorna o resumo ('' se a nota estiver vazia)"""
+        shard, local_path = self.route(path)
+        max_chars = self.SUMMARY_PART_TOKENS * 4
+        content = shard.note_store.get_content(local_path, max_chars * self.SUMMARY_PARTS)
+        parts = split_for_summary(content, max_chars)[:self.SUMMARY_PARTS]
+        summaries = []
+        for number, part in enumerate(parts, 1):
+            label = f" (parte {number} de {len(parts)})" if len(parts) > 1 else ''
+            prompt = SUMMARY_PROMPT.format(path=path, part=label, content=part)
+            summaries.append(self.gemini_client.generate(self.config['api_key'], prompt, cancel_token).strip())
+        return '\n'.join(summaries)
+
+    def summarize(self, paths, cancel_token=None, on_progress=None):
+        """Resumo de cada nota, resumindo em paralelo as que ainda não têm; retorna (resumos, novos, erros)
+
+        Os resumos ficam em cache pelo hash do conteúdo: nota que não mudou não é
+        resumida de novo, e notas idênticas custam uma chamada só. Até
+        `summary_workers` notas são resumidas ao mesmo tempo; `on_progress(feitas,
+        total)` acompanha as que faltavam. `novos` conta as notas resumidas agora e
+        `erros` mapeia caminho -> mensagem.
+        """
+        hashes = {path: content_hash for path, content_hash in self.get_hashes(paths).items() if content_hash}
+        cached = self.summary_cache.get_many(hashes.values(), SUMMARY_VERSION)
+        summaries = {path: cached[content_hash] for path, content_hash in hashes.items() if content_hash in cached}
+        pending = defaultdict(list)  # hash -> notas com esse conteúdo
+        for path, content_hash in hashes.items():
+            if content_hash not in cached:
+                pending[content_hash].append(path)
+        if not pending:
+            return summaries, 0, {}
+
+        cancel_token = cancel_token or CancelToken()
+        created = 0
+        errors = {}
+        failures = 0
+        executor = ThreadPoolExecutor(max_workers=max(1, self.config['summary_workers']),
+                                      thread_name_prefix='resumo')
+        try:
+            futures = {executor.submit(self.summarize_note, same[0], cancel_token): content_hash
+                       for content_hash, same in pending.items()}
+            for done, future in enumerate(as_completed(futures), 1):
+                content_hash = futures[future]
+                try:
+                    summary = future.result()
+                except RequestCancelled:
+                    raise
+                except Exception as e:
+                    errors.update(dict.fromkeys(pending[content_hash], str(e)))
+                    failures += 1
+                    if failures >= self.SUMMARY_MAX_FAILURES:
+                        raise Exception(f"Resumos interrompidos após {failures} falhas seguidas: {e}")
+                else:
+                    failures = 0
+                    self.summary_cache.put(content_hash, SUMMARY_VERSION, summary)
+                    summaries.update(dict.fromkeys(pending[content_hash], summary))
+                    created += len(pending[content_hash])
+                if on_progress is not None:
+                    on_progress(done, len(futures))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return summaries, created, errors
+
+    def summarize_vaults(self, vaults=None, cancel_token=None):
+        """Resume as notas dos cofres que ainda não têm resumo (trabalho em segundo plano)
+
+        Retorna {'notas', 'resumidas', 'em_cache', 'erros', 'descartados', 'tempos_ms'}.
+        Quando passa por todos os cofres, descarta os resumos de conteúdos que não
+        existem mais.
+        """
+        trace = Trace('resumos')
+        last_percent = -1
+
+        def report_progress(done, total):
+            nonlocal last_percent
+            percent = done * 100 // total
+            if percent != last_percent:
+                last_percent = percent
+                self.on_progress(percent)
+                self.on_status(f"Resumindo notas... {percent}% ({done}/{total})")
+
+        with trace.activate():
+            paths = [note.path for shard in self.select(vaults) for note in qualified_notes(shard, shard.notes_data)]
+            with span('resumos'):
+                summaries, created, errors = self.summarize(paths, cancel_token, report_progress)
+            pruned = 0
+            if vaults is None:
+                pruned = self.summary_cache.prune(self.get_hashes(paths).values(), SUMMARY_VERSION)
+
+        summary = {
+            'notas': len(paths),
+            'resumidas': created,
+            'em_cache': len(summaries) - created,
+            'erros': errors,
+            'descartados': pruned,
+        }
+        trace.values.update({key: value for key, value in summary.items() if key != 'erros'})
+        trace.set('com_erro', len(errors))
+        self.metrics.record(trace.finish())
+        summary['tempos_ms'] = trace.timings()
+        return summary
+
+    def ask_broad(self, question, message, vaults=None, cancel_token=None, on_chunk=None):
+        """Responde uma pergunta ampla sobre os resumos das notas; retorna (resposta, veio_do_cache, contexto, notas)
+
+        As notas são as de melhores trechos na busca, até `broad_max_notes`. Os
+        resumos que faltam são feitos na hora (e ficam em cache); se não couberem
+        em `broad_context_tokens`, cada grupo é reduzido em paralelo ao que importa
+        para a pergunta (map) e a resposta sai dos grupos reduzidos (reduce).
+        """
+        with span('busca'):
+            ranked = self.find_relevant_passages(question, limit=self.BROAD_CANDIDATES, vaults=vaults)
+        first_keys = {}
+        for key, _ in ranked:
+            first_keys.setdefault(key.rpartition('#')[0], key)
+        paths = list(first_keys)[:self.config['broad_max_notes']]
+        # A resposta em cache vale enquanto nenhuma dessas notas mudar
+        keys = [passage_key(path, 'resumo') for path in paths]
+        built = {}
+
+        def build_context():
+            built['contexto'], built['notas'] = self.summary_context(
+                message, paths, [first_keys[path] for path in paths], cancel_token
+            )
+            return built['contexto']
+
+        answer, cached = self.get_ai_response(message, build_context, keys, cancel_token=cancel_token,
+                                              on_chunk=on_chunk, prompt_version=BROAD_PROMPT_VERSION)
+        return answer, cached, built.get('contexto', ''), built.get('notas', paths)
+
+    def summary_context(self, message, paths, first_keys, cancel_token=None):
+        """Contexto com os resumos das notas, reduzido por map-reduce se não couber; retorna (contexto, notas usadas)"""
+        trace = current_trace()
+        with span('resumos'):
+            summaries, created, errors = self.summarize(paths, cancel_token)
+        if trace is not None:
+            trace.set('resumos_novos', created)
+            trace.set('resumos_com_erro', len(errors))
+
+        titles = {passage['caminho']: passage['título'] for passage in self.get_passages(first_keys).values()}
+        used = [path for path in paths if summaries.get(path)]
+        blocks = [summary_block(path, titles.get(path, path), summaries[path]) for path in used]
+        budget = self.config['broad_context_tokens']
+
+        map_calls = 0
+        with span('mapa'):
+            for _ in range(self.MAP_ROUNDS):
+                groups = group_blocks(blocks, budget)
+                if len(groups) <= 1:
+                    break
+                with ThreadPoolExecutor(max_workers=max(1, self.config['summary_workers']),
+                                        thread_name_prefix='mapa') as executor:
+                    partials = list(executor.map(
+                        lambda group: self.map_summaries(message, group, cancel_token), groups
+                    ))
+                map_calls += len(groups)
+                blocks = [f"=== Extraído dos resumos (parte {number}) ===\n{partial.strip()}\n\n"
+                          for number, partial in enumerate(partials, 1)
+                          if not partial.strip().lower().startswith('nada relevante')]
+            # O que ainda não couber depois das rodadas fica de fora (os resumos vêm por relevância)
+            blocks = group_blocks(blocks, budget)[0] if blocks else []
+        if trace is not None:
+            trace.set('chamadas_mapa', map_calls)
+
+        return "Resumos das suas anotações:\n\n" + ''.join(blocks), used
+
+    def map_summaries(self, message, blocks, cancel_token=None):
+        """Passo map: extrai de um grupo de resumos o que importa para a pergunta"""
+        prompt = MAP_PROMPT.format(context=''.join(blocks), message=message)
+        return self.gemini_client.generate(self.config['api_key'], prompt, cancel_token)
+
+    def record_metrics(self, trace):
+        """Fecha o trace e o grava no arquivo de métricas"""
+        trace.set('caches_busca', self.search_cache_stats())
+        return self.metrics.record(trace.finish())
+
+    def search_cache_stats(self):
+        """Acertos e falhas dos caches de busca: buscas inteiras e pontuações de termos do BM25 (de todos os cofres)"""
+        term_hits = term_misses = 0
+        for shard in self.select():
+            with shard.index_lock:
+                term_hits += shard.search_index.term_hits
+                term_misses += shard.search_index.term_misses
+        return {'buscas': self.query_cache.stats(), 'termos': {'acertos': term_hits, 'falhas': term_misses}}
+
+
+def qualified_notes(shard, notes):
+    """Notas de um cofre com o caminho visto de fora (cópias, só nos cofres com nome)"""
+    if not shard.name:
+        return notes
+    return [NoteRecord(shard.qualify(note.path), note.title, note.size, note.mtime, note.passages)
+            for note in notes]
+
+
+def qualified_results(shard, ranked):
+    if not shard.name:
+        return ranked
+    return [(shard.qualify(key), score) for key, score in ranked]
@@ -0,0 +1,259 @@
+"""Cliente HTTP da API do Gemini e o prompt usado nas perguntas"""
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from .tracing import current_trace, span
+
+GEMINI_MODEL = "gemini-1.5-flash-latest"
+
+# Aumente PROMPT_VERSION sempre que o texto do prompt mudar: invalida o cache de respostas
+PROMPT_VERSION = 1
+PROMPT_TEMPLATE = """Você é um assistente inteligente especializado em ajudar com anotações pessoais do Obsidian.
+
+Sua tarefa é responder perguntas sobre o conteúdo das anotações, indicando sempre em qual arquivo a informação foi encontrada.
+
+**IMPORTANTE:** Use formatação Markdown em suas respostas para melhor legibilidade:
+- Use **negrito** para destacar informações importantes
+- Use *itálico* para ênfase
+- Use `código` para nomes de arquivos, funções, variáveis
+- Use ### para subtítulos
+- Use > para citações importantes
+- Use listas quando apropriado
+
+{context}
+
+**Pergunta do usuário:** {message}
+
+Por favor, responda de forma clara e útil, sempre mencionando as fontes (nomes dos arquivos) quando referenciar informações específicas das anotações. Use formatação Markdown para tornar sua resposta mais legível e organizada."""
+
+# Aumente SUMMARY_PROMPT_VERSION sempre que um destes prompts mudar: os resumos são refeitos
+SUMMARY_PROMPT_VERSION = 1
+SUMMARY_PROMPT = """Resuma a anotação do Obsidian abaixo em até 8 frases curtas, em português.
+
+Mantenha nomes, datas, números, decisões e termos técnicos importantes. Responda só com o resumo, sem introdução nem formatação.
+
+Arquivo: {path}{part}
+
+{content}"""
+
+# Passo intermediário das perguntas amplas: extrai de um grupo de resumos o que importa para a pergunta
+MAP_PROMPT = """Abaixo estão resumos de várias anotações do Obsidian.
+
+Extraia deles tudo o que ajuda a responder a pergunta, em tópicos curtos, indicando o arquivo de origem de cada informação. Se nada for relevante, responda apenas "Nada relevante".
+
+{context}
+
+**Pergunta do usuário:** {message}"""
+
+
+class RequestCancelled(Exception):
+    """A requisição foi cancelada pelo usuário"""
+
+
+class CancelToken:
+    """Sinal de cancelamento compartilhado entre a interface e uma requisição em andamento"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.responses = set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        """Cancela a requisição, fechando conexões abertas para destravar leituras bloqueadas"""
+        self.event.set()
+        with self.lock:
+            responses = list(self.responses)
+        for response in responses:
+            response.close()
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise RequestCancelled("Requisição cancelada")
+
+    def wait(self, seconds):
+        """Espera `seconds`, interrompendo cedo (com RequestCancelled) se houver cancelamento"""
+        if self.event.wait(seconds):
+            raise RequestCancelled("Requisição cancelada")
+
+    def attach(self, response):
+        with self.lock:
+            self.responses.add(response)
+        if self.event.is_set():
+            response.close()
+
+    def detach(self, response):
+        with self.lock:
+            self.responses.discard(response)
+
+
+def record_usage(event):
+    """Guarda no trace ativo os tokens informados pela API (usageMetadata)"""
+    trace = current_trace()
+    usage = event.get('usageMetadata')
+    if trace is None or not usage:
+        return
+    if 'promptTokenCount' in usage:
+        trace.set('tokens_prompt', usage['promptTokenCount'])
+    if 'candidatesTokenCount' in usage:
+        trace.set('tokens_resposta', usage['candidatesTokenCount'])
+
+
+class GeminiClient:
+    """Cliente HTTP compartilhado: pool de conexões, novas tentativas com backoff e cancelamento"""
+
+    BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+    RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, max_concurrency=4, max_retries=4, backoff_base=1.0, backoff_max=30.0,
+                 timeout=(10, 60), base_url=None):
+        self.base_url = (base_url or self.BASE_URL).rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.session = None
+        self.session_lock = threading.Lock()
+
+    def http_session(self):
+        """Sessão com conexões keep-alive reaproveitadas entre chamadas (sem novo handshake TCP+TLS)
+
+        Criada na primeira requisição: o `requests` só é importado quando a API é usada,
+        e não na abertura do programa.
+        """
+        with self.session_lock:
+            if self.session is None:
+                from .transport import new_session
+                self.session = new_session(pool_maxsize=self.max_concurrency * 2)
+            return self.session
+
+    def generate(self, api_key, prompt, cancel_token=None):
+        """Chama o generateContent e retorna o texto da resposta"""
+        cancel_token = cancel_token or CancelToken()
+        with self.acquire_slot(cancel_token), span('api_total'):
+            response = self.send('generateContent', api_key, prompt, cancel_token)
+            try:
+                body = b''.join(self.iter_body(response, cancel_token))
+            finally:
+                cancel_token.detach(response)
+                response.close()
+        
+        result = json.loads(body)
+        record_usage(result)
+        return result['candidates'][0]['content']['parts'][0]['text']
+
+    def stream(self, api_key, prompt, cancel_token=None):
+        """Chama o streamGenerateContent (SSE) e gera os pedaços de texto da resposta"""
+        cancel_token = cancel_token or CancelToken()
+        trace = current_trace()
+        with self.acquire_slot(cancel_token), span('api_total'):
+            started = time.perf_counter()
+            response = self.send('streamGenerateContent', api_key, prompt, cancel_token, {'alt': 'sse'})
+            first_text = True
+            finished = False
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    cancel_token.raise_if_cancelled()
+                    if not line or not line.startswith('data:'):
+                        continue
+                    event = json.loads(line[5:])
+                    record_usage(event)
+                    for candidate in event.get('candidates', [])[:1]:
+                        finished = finished or bool(candidate.get('finishReason'))
+                        for part in candidate.get('content', {}).get('parts', []):
+                            if part.get('text'):
+                                if first_text and trace is not None:
+                                    trace.add('api_primeiro_texto', (time.perf_counter() - started) * 1000)
+                                first_text = False
+                                yield part['text']
+            except Exception as e:
+                # Conexão fechada pelo cancelamento aparece como erro de leitura
+                cancel_token.raise_if_cancelled()
+                from .transport import READ_ERRORS
+                if isinstance(e, READ_ERRORS):
+                    raise Exception(f"Resposta interrompida pela API: {e}") from e
+                raise
+            finally:
+                cancel_token.detach(response)
+                response.close()
+            # O último evento sempre traz o finishReason; sem ele a resposta veio cortada
+            if not finished:
+                cancel_token.raise_if_cancelled()
+                raise Exception("Resposta interrompida pela API antes do fim")
+
+    def send(self, method, api_key, prompt, cancel_token, params=None):
+        """Envia a requisição, repetindo em 429/5xx e falhas de rede; retorna a resposta já com status 200"""
+        url = f"{self.base_url}/models/{GEMINI_MODEL}:{method}"
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        headers = {"Content-Type": "application/json", "x-goog-api-key": api_key}
+        from .transport import NETWORK_ERRORS  # já carregado por http_session
+        session = self.http_session()
+        
+        for attempt in range(self.max_retries + 1):
+            cancel_token.raise_if_cancelled()
+            try:
+                # Com stream=True o post retorna assim que chegam os cabeçalhos (1º byte)
+                with span('api_primeiro_byte'):
+                    response = session.post(url, params=params, headers=headers, json=payload,
+                                                 stream=True, timeout=self.timeout)
+            except NETWORK_ERRORS as e:
+                cancel_token.raise_if_cancelled()
+                if attempt == self.max_retries:
+                    raise Exception(f"Erro de conexão com a API: {e}")
+                cancel_token.wait(self.backoff_delay(attempt))
+                continue
+            
+            if response.status_code == 200:
+                cancel_token.attach(response)
+                trace = current_trace()
+                if trace is not None:
+                    trace.set('tentativas', attempt + 1)
+                return response
+            
+            retry_after = response.headers.get('Retry-After')
+            error = f"Erro na API: {response.status_code} - {response.text}"
+            response.close()
+            if response.status_code not in self.RETRY_STATUS or attempt == self.max_retries:
+                raise Exception(error)
+            cancel_token.wait(self.backoff_delay(attempt, retry_after))
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Atraso antes da próxima tentativa: Retry-After, se houver; senão exponencial com jitter"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                try:
+                    seconds = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    return min(max(seconds, 0.0), self.backoff_max)
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def iter_body(self, response, cancel_token):
+        try:
+            for block in response.iter_content(chunk_size=65536):
+                cancel_token.raise_if_cancelled()
+                yield block
+        except Exception:
+            cancel_token.raise_if_cancelled()
+            raise
+
+    @contextmanager
+    def acquire_slot(self, cancel_token):
+        """Limita as requisições simultâneas, sem impedir o cancelamento enquanto espera"""
+        while not self.slots.acquire(timeout=0.1):
+            cancel_token.raise_if_cancelled()
+        try:
+            yield
+        finally:
+            self.slots.release()
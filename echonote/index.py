@@ -0,0 +1,281 @@
+"""Tokenização e índice invertido BM25 dos trechos das notas"""
+import os
+import re
+import math
+import heapq
+import pickle
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+from functools import lru_cache
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Palavras muito frequentes que não ajudam a ranquear (pt/en)
+STOPWORDS = frozenset("""
+a ao aos as até com como da das de do dos e é ela ele em entre era essa esse esta este eu
+foi há isso isto já mais mas me meu minha muito na nas no nos o os ou para pela pelo por
+qual quais que se sem ser seu sua são também tem um uma umas uns você
+an and are as at be by for from how in is it of on or the this to was what where which with
+""".split())
+
+
+@lru_cache(maxsize=65536)
+def fold_term(term):
+    """Remove acentos de um termo (ex.: 'reunião' -> 'reuniao')"""
+    if term.isascii():
+        return term
+    decomposed = unicodedata.normalize('NFKD', term)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    """Quebra o texto em termos normalizados (minúsculas, sem acentos, sem stopwords)"""
+    terms = map(fold_term, TOKEN_PATTERN.findall(text.lower()))
+    return [term for term in terms if term not in STOPWORDS]
+
+
+class BM25Index:
+    """Índice invertido com ranqueamento BM25 e bônus para termos no título
+
+    Com NumPy, a pontuação de cada termo já buscado fica guardada (LRU) até o índice
+    mudar: perguntas parecidas e de acompanhamento não recalculam os termos que repetem.
+    """
+
+    VERSION = 2
+    K1 = 1.5
+    B = 0.75
+    TITLE_BOOST = 3.0
+    TERM_CACHE_SIZE = 500_000  # pontuações (termo, trecho) guardadas entre buscas (~8 MB)
+    # Estado só da memória: não vai para o arquivo salvo
+    TRANSIENT = ('generation', 'term_cache', 'term_cache_size', 'term_cache_generation', 'length_array',
+                 'term_hits', 'term_misses')
+
+    def __init__(self):
+        self.postings = {}        # termo -> {doc_id: frequência}
+        self.title_postings = {}  # termo -> {doc_id}
+        self.doc_keys = []        # doc_id -> chave do documento (None se removido)
+        self.doc_lengths = []     # doc_id -> quantidade de termos
+        self.doc_terms = []       # doc_id -> termos distintos (para remoção)
+        self.doc_title_terms = []
+        self.key_to_id = {}
+        self.total_length = 0
+        self.stamp = None         # identifica a versão salva, conferida com o banco
+        self.generation = 0       # muda a cada inclusão ou remoção e invalida as pontuações guardadas
+        self.term_hits = 0
+        self.term_misses = 0
+        self.reset_term_cache()
+
+    def __len__(self):
+        return len(self.key_to_id)
+
+    def reset_term_cache(self):
+        self.term_cache = OrderedDict()  # termo -> pontuações (ver term_scores), do menos para o mais recente
+        self.term_cache_size = 0
+        self.term_cache_generation = self.generation
+        self.length_array = None         # doc_lengths como array, refeito depois de cada mudança
+
+    def add(self, key, title, content):
+        """Indexa um documento, substituindo a versão anterior se existir"""
+        if key in self.key_to_id:
+            self.remove(key)
+        
+        self.generation += 1
+        doc_id = len(self.doc_keys)
+        terms = tokenize(content)
+        self.doc_keys.append(key)
+        self.doc_lengths.append(len(terms))
+        self.key_to_id[key] = doc_id
+        self.total_length += len(terms)
+        
+        counts = Counter(terms)
+        title_terms = tuple(set(tokenize(title)))
+        self.doc_terms.append(tuple(counts))
+        self.doc_title_terms.append(title_terms)
+        
+        for term, freq in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = freq
+        for term in title_terms:
+            self.title_postings.setdefault(term, set()).add(doc_id)
+
+    def remove(self, key):
+        """Remove um documento do índice"""
+        doc_id = self.key_to_id.pop(key, None)
+        if doc_id is None:
+            return
+        self.generation += 1
+        
+        for term in self.doc_terms[doc_id]:
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+        for term in self.doc_title_terms[doc_id]:
+            docs = self.title_postings[term]
+            docs.discard(doc_id)
+            if not docs:
+                del self.title_postings[term]
+        
+        self.total_length -= self.doc_lengths[doc_id]
+        self.doc_lengths[doc_id] = 0
+        self.doc_keys[doc_id] = None
+        self.doc_terms[doc_id] = ()
+        self.doc_title_terms[doc_id] = ()
+        # Cada nota editada deixa lacunas; sem compactar, as listas crescem com o histórico
+        removed = len(self.doc_keys) - len(self.key_to_id)
+        if removed > 1000 and removed > len(self.key_to_id):
+            self.compact()
+
+    def compact(self):
+        """Renumera os documentos vivos (na mesma ordem), descartando as lacunas das remoções"""
+        live = [doc_id for doc_id, key in enumerate(self.doc_keys) if key is not None]
+        new_ids = {doc_id: new_id for new_id, doc_id in enumerate(live)}
+        self.postings = {term: {new_ids[doc_id]: freq for doc_id, freq in docs.items()}
+                         for term, docs in self.postings.items()}
+        self.title_postings = {term: {new_ids[doc_id] for doc_id in docs}
+                               for term, docs in self.title_postings.items()}
+        self.doc_keys = [self.doc_keys[doc_id] for doc_id in live]
+        self.doc_lengths = [self.doc_lengths[doc_id] for doc_id in live]
+        self.doc_terms = [self.doc_terms[doc_id] for doc_id in live]
+        self.doc_title_terms = [self.doc_title_terms[doc_id] for doc_id in live]
+        self.key_to_id = {key: doc_id for doc_id, key in enumerate(self.doc_keys)}
+        self.generation += 1
+        self.reset_term_cache()
+
+    def search(self, query, limit=10, keys=None):
+        """Retorna as `limit` chaves mais relevantes como lista de (chave, pontuação)
+
+        Com `keys`, só esses documentos são pontuados (as estatísticas continuam as do
+        índice inteiro); cada termo percorre a menor das duas listas. Com NumPy, as
+        pontuações de cada termo ficam guardadas entre buscas (ver `term_scores`).
+        """
+        doc_count = len(self.key_to_id)
+        if not doc_count:
+            return []
+        
+        allowed = None
+        if keys is not None:
+            allowed = {self.key_to_id[key] for key in keys if key in self.key_to_id}
+            if not allowed:
+                return []
+        
+        avg_length = self.total_length / doc_count or 1.0
+        terms = set(tokenize(query))
+        from .vectors import load_numpy  # vectors importa este módulo
+        np = load_numpy()
+        if np is not None:
+            return self.search_arrays(np, terms, limit, allowed, doc_count, avg_length)
+        
+        scores = defaultdict(float)
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings:
+                df = len(postings)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for doc_id, freq in restrict(postings, allowed):
+                    norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * freq * (self.K1 + 1) / (freq + norm)
+            
+            title_docs = self.title_postings.get(term, ())
+            if allowed is not None:
+                title_docs = allowed.intersection(title_docs)
+            for doc_id in title_docs:
+                scores[doc_id] += self.TITLE_BOOST
+        
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(self.doc_keys[doc_id], score) for doc_id, score in top]
+
+    def search_arrays(self, np, terms, limit, allowed, doc_count, avg_length):
+        """`search` com NumPy: soma as pontuações guardadas de cada termo num vetor denso"""
+        totals = np.zeros(len(self.doc_keys))
+        for term in terms:
+            doc_ids, values, title_ids = self.term_scores(np, term, doc_count, avg_length)
+            totals[doc_ids] += values
+            totals[title_ids] += self.TITLE_BOOST
+
+        if allowed is not None:
+            candidates = np.sort(np.fromiter(allowed, dtype=np.int64, count=len(allowed)))
+            candidates = candidates[totals[candidates] > 0]
+        else:
+            candidates = np.flatnonzero(totals)
+        if len(candidates) > limit:
+            candidates = np.sort(candidates[np.argpartition(-totals[candidates], limit - 1)[:limit]])
+        # Empates na ordem dos documentos
+        top = candidates[np.argsort(-totals[candidates], kind='stable')]
+        return [(self.doc_keys[doc_id], float(totals[doc_id])) for doc_id in top.tolist()]
+
+    def term_scores(self, np, term, doc_count, avg_length):
+        """Pontuações BM25 do termo: (documentos, pontuações, documentos com o termo no título)
+
+        Ficam guardadas (LRU, até TERM_CACHE_SIZE valores) até a próxima inclusão ou
+        remoção, que muda as estatísticas de todos os termos.
+        """
+        if self.term_cache_generation != self.generation:
+            self.reset_term_cache()
+        cached = self.term_cache.get(term)
+        if cached is not None:
+            self.term_cache.move_to_end(term)
+            self.term_hits += 1
+            return cached
+        self.term_misses += 1
+
+        postings = self.postings.get(term, {})
+        doc_ids = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+        values = np.fromiter(postings.values(), dtype=np.float64, count=len(postings))
+        if len(postings):
+            if self.length_array is None:
+                self.length_array = np.array(self.doc_lengths, dtype=np.float64)
+            df = len(postings)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            norms = self.K1 * (1 - self.B + self.B * self.length_array[doc_ids] / avg_length)
+            values = idf * values * (self.K1 + 1) / (values + norms)
+        title_docs = self.title_postings.get(term, ())
+        title_ids = np.fromiter(title_docs, dtype=np.int64, count=len(title_docs))
+
+        scores = (doc_ids, values, title_ids)
+        size = len(doc_ids) + len(title_ids) + 1
+        if size <= self.TERM_CACHE_SIZE:
+            self.term_cache[term] = scores
+            self.term_cache_size += size
+            while self.term_cache_size > self.TERM_CACHE_SIZE:
+                _, (evicted_ids, _, evicted_titles) = self.term_cache.popitem(last=False)
+                self.term_cache_size -= len(evicted_ids) + len(evicted_titles) + 1
+        return scores
+
+    def save(self, path):
+        """Grava o índice em disco de forma atômica e retorna o novo carimbo de versão"""
+        self.stamp = os.urandom(8).hex()
+        state = {name: value for name, value in self.__dict__.items() if name not in self.TRANSIENT}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.VERSION, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return self.stamp
+
+    @classmethod
+    def load(cls, path):
+        """Carrega um índice salvo; retorna None se o arquivo for de outra versão"""
+        with open(path, 'rb') as f:
+            version, state = pickle.load(f)
+        if version != cls.VERSION:
+            return None
+        index = cls()
+        index.__dict__.update(state)
+        return index
+
+
+def restrict(postings, allowed):
+    """Itens (documento, frequência) da lista de postings, limitados a `allowed` se houver"""
+    if allowed is None:
+        return postings.items()
+    if len(allowed) < len(postings):
+        return ((doc_id, postings[doc_id]) for doc_id in allowed if doc_id in postings)
+    return ((doc_id, freq) for doc_id, freq in postings.items() if doc_id in allowed)
+
+
+def reciprocal_rank_fusion(rankings, limit, k=60):
+    """Combina listas ranqueadas de (chave, pontuação) pela soma de 1/(k + posição)"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for position, (key, _) in enumerate(ranking):
+            scores[key] += 1.0 / (k + position + 1)
+    return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,116 @@
+"""Leitura das notas do disco: limite de tamanho, arquivos binários, codificações alternativas e leitura em blocos"""
+import codecs
+import hashlib
+
+from .store import format_file_size
+
+CHUNK_SIZE = 1 << 16          # bytes lidos de cada vez
+SNIFF_SIZE = 8192             # início do arquivo examinado para detectar conteúdo binário
+STREAM_THRESHOLD = 512 * 1024  # acima disso a nota não é lida inteira para a memória
+
+# Caracteres de controle que aparecem em texto (tab, quebras de linha, escape de cores...)
+TEXT_CONTROLS = frozenset(b'\t\n\r\x0b\x0c\x08\x1b')
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+class SkippedFile(Exception):
+    """Arquivo deixado de fora do escaneamento (grande demais, binário, codificação desconhecida)"""
+
+
+def looks_binary(sample):
+    """Indica se o início do arquivo parece binário: bytes nulos ou muitos caracteres de controle"""
+    if b'\0' in sample:
+        return True
+    controls = sum(1 for byte in sample if byte < 32 and byte not in TEXT_CONTROLS)
+    return controls > len(sample) // 10
+
+
+def candidate_encodings(head, encodings):
+    """Codificações a tentar, na ordem: a indicada pelo BOM, se houver, ou as configuradas"""
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return [encoding]
+    return list(encodings)
+
+
+def decodes_as(path, encoding):
+    """Indica se o arquivo inteiro decodifica com `encoding`, lendo em blocos"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        with open(path, 'rb') as f:
+            while chunk := f.read(CHUNK_SIZE):
+                decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def read_note(path, size, encodings, max_bytes=None):
+    """Lê uma nota; retorna (hash do conteúdo, codificação usada, texto)
+
+    O texto só vem para notas de até STREAM_THRESHOLD bytes; nas maiores é None e
+    o conteúdo deve ser lido em blocos com `read_chunks`, sem nunca estar inteiro
+    na memória. Levanta SkippedFile se a nota passar de `max_bytes`, parecer
+    binária ou não decodificar com nenhuma das `encodings`.
+    """
+    if max_bytes and size > max_bytes:
+        raise SkippedFile(f"maior que o limite de {format_file_size(max_bytes)} ({format_file_size(size)})")
+
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_SIZE)
+        encodings = candidate_encodings(head, encodings)
+        if encodings[0] != 'utf-16' and looks_binary(head):
+            raise SkippedFile("conteúdo binário")
+
+        if size <= STREAM_THRESHOLD:
+            raw = head + f.read()
+            for encoding in encodings:
+                try:
+                    return hashlib.sha1(raw).hexdigest(), encoding, raw.decode(encoding)
+                except UnicodeDecodeError:
+                    continue
+            raise SkippedFile(f"codificação desconhecida (tentadas: {', '.join(encodings)})")
+
+        # Nota grande: hash e validação da primeira codificação numa só passada em blocos
+        digest = hashlib.sha1(head)
+        decoder = codecs.getincrementaldecoder(encodings[0])()
+        valid = True
+        chunk = head
+        while chunk:
+            if valid:
+                try:
+                    decoder.decode(chunk)
+                except UnicodeDecodeError:
+                    valid = False
+            chunk = f.read(CHUNK_SIZE)
+            digest.update(chunk)
+    if valid:
+        try:
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            valid = False
+    if valid:
+        return digest.hexdigest(), encodings[0], None
+
+    for encoding in encodings[1:]:
+        if decodes_as(path, encoding):
+            return digest.hexdigest(), encoding, None
+    raise SkippedFile(f"codificação desconhecida (tentadas: {', '.join(encodings)})")
+
+
+def read_chunks(path, encoding, chunk_size=CHUNK_SIZE):
+    """Gera o texto de um arquivo em blocos, decodificando aos poucos"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
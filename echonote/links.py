@@ -0,0 +1,286 @@
+"""Grafo de links entre as notas ([[wikilinks]], embeds e apelidos) com backlinks e prior de PageRank"""
+import os
+import re
+import pickle
+from array import array
+
+from .passages import passage_key
+from .vectors import load_numpy
+
+# [[Nota]], [[Nota|texto]], [[Nota#Seção]], [[Nota#^bloco]] e os embeds ![[Nota]]
+WIKILINK_PATTERN = re.compile(r"!?\[\[([^\[\]|#^\n]*)(?:[#^][^\[\]|\n]*)?(?:\|[^\[\]\n]*)?\]\]")
+FRONTMATTER_PATTERN = re.compile(r"\A---[ \t]*\n(.*?)\n---[ \t]*(?:\n|\Z)", re.DOTALL)
+FRONTMATTER_KEY_PATTERN = re.compile(r"^([\w-]+):[ \t]*(.*)$")
+
+
+def normalize_link(target):
+    """Forma canônica do alvo de um link: sem '.md', com '/' e sem diferenciar maiúsculas"""
+    target = target.strip().replace('\\', '/')
+    if target.lower().endswith('.md'):
+        target = target[:-3]
+    return target.casefold()
+
+
+def extract_links(text):
+    """Alvos normalizados dos wikilinks e embeds do texto, sem repetição"""
+    targets = (normalize_link(match.group(1)) for match in WIKILINK_PATTERN.finditer(text))
+    return list(dict.fromkeys(target for target in targets if target))
+
+
+def read_frontmatter(text):
+    """Lê o frontmatter YAML simples do início da nota; retorna {chave: [valores]}
+
+    Cobre o que o Obsidian gera: `chave: valor`, listas `[a, b]` e listas em bloco (`- a`).
+    """
+    match = FRONTMATTER_PATTERN.match(text)
+    if not match:
+        return {}
+
+    values = {}
+    key = None
+    for line in match.group(1).split('\n'):
+        stripped = line.strip()
+        if key and stripped.startswith('- '):
+            values[key].append(stripped[2:].strip().strip('"\''))
+            continue
+        found = FRONTMATTER_KEY_PATTERN.match(line)
+        if not found:
+            key = None
+            continue
+        key, value = found.group(1).lower(), found.group(2).strip()
+        if value.startswith('[') and value.endswith(']'):
+            items = value[1:-1].split(',')
+        else:
+            items = [value] if value else []
+        values[key] = [item.strip().strip('"\'') for item in items if item.strip()]
+    return values
+
+
+def frontmatter_only(text):
+    """Indica se o texto é só o frontmatter, sem conteúdo depois dele (trecho 0 de muitas notas)"""
+    match = FRONTMATTER_PATTERN.match(text)
+    return match is not None and not text[match.end():].strip()
+
+
+def note_aliases(text):
+    """Apelidos declarados no frontmatter (`aliases` ou `alias`), normalizados"""
+    frontmatter = read_frontmatter(text)
+    aliases = frontmatter.get('aliases', []) + frontmatter.get('alias', [])
+    return list(dict.fromkeys(normalize_link(alias) for alias in aliases if alias))
+
+
+class LinkGraph:
+    """Grafo dirigido nota → nota guardado em arrays compactos (CSR), com backlinks
+
+    Os alvos de cada nota ficam como foram escritos; ao compilar, são resolvidos
+    pelo nome do arquivo, pelo caminho ou por um apelido. Assim, um link para uma
+    nota que ainda não existe passa a valer quando ela aparece no cofre. A
+    compilação também calcula o PageRank de cada nota, usado como prior na busca.
+    """
+
+    VERSION = 1
+    DAMPING = 0.85
+    ITERATIONS = 30
+
+    def __init__(self):
+        self.targets = {}          # caminho -> alvos normalizados dos links da nota
+        self.aliases = {}          # caminho -> apelidos normalizados da nota
+        self.nodes = []            # id -> caminho
+        self.node_ids = {}
+        self.indptr, self.indices = array('i', [0]), array('i')            # links de saída
+        self.back_indptr, self.back_indices = array('i', [0]), array('i')  # backlinks
+        self.rank = array('d')     # id -> PageRank normalizado (a nota mais central vale 1)
+        self.dirty = False
+        self.stamp = None          # identifica a versão salva, conferida com o banco
+
+    def __len__(self):
+        return len(self.targets)
+
+    def set_note(self, path, targets, aliases=()):
+        """Registra (ou substitui) os links e apelidos de uma nota"""
+        self.targets[path] = tuple(targets)
+        if aliases:
+            self.aliases[path] = tuple(aliases)
+        else:
+            self.aliases.pop(path, None)
+        self.dirty = True
+
+    def remove_note(self, path):
+        if self.targets.pop(path, None) is not None:
+            self.aliases.pop(path, None)
+            self.dirty = True
+
+    def resolver(self):
+        """Mapa nome normalizado -> caminho; em nomes repetidos vence o caminho mais curto, como no Obsidian"""
+        names = {}
+        for path in sorted(self.targets, key=lambda path: (len(path), path)):
+            name = normalize_link(path)
+            names.setdefault(name, path)
+            names.setdefault(name.rpartition('/')[2], path)
+        for path, aliases in self.aliases.items():
+            for alias in aliases:
+                names.setdefault(alias, path)
+        return names
+
+    def compile(self):
+        """Resolve os links e recalcula as listas de adjacência e o PageRank"""
+        if not self.dirty:
+            return
+        names = self.resolver()
+        self.nodes = sorted(self.targets)
+        self.node_ids = {path: node for node, path in enumerate(self.nodes)}
+
+        edges = []
+        for node, path in enumerate(self.nodes):
+            linked = {self.node_ids[names[target]] for target in self.targets[path] if target in names}
+            linked.discard(node)
+            edges.append(sorted(linked))
+
+        self.indptr, self.indices = self.to_csr(edges)
+        backlinks = [[] for _ in self.nodes]
+        for node, linked in enumerate(edges):
+            for target in linked:
+                backlinks[target].append(node)
+        self.back_indptr, self.back_indices = self.to_csr(backlinks)
+        self.rank = self.pagerank()
+        self.dirty = False
+
+    @staticmethod
+    def to_csr(lists):
+        indptr = array('i', [0])
+        indices = array('i')
+        for items in lists:
+            indices.extend(items)
+            indptr.append(len(indices))
+        return indptr, indices
+
+    def pagerank(self):
+        """PageRank por iteração de potência; notas sem links distribuem seu peso igualmente"""
+        count = len(self.nodes)
+        if not count:
+            return array('d')
+        out_degree = [self.indptr[node + 1] - self.indptr[node] for node in range(count)]
+
+        np = load_numpy()
+        if np is not None:
+            degree = np.array(out_degree, dtype=np.float64)
+            sources = np.repeat(np.arange(count), degree.astype(np.int64))
+            targets = np.frombuffer(self.indices, dtype=np.int32)
+            dangling = degree == 0
+            rank = np.full(count, 1.0 / count)
+            for _ in range(self.ITERATIONS):
+                share = np.divide(rank, degree, out=np.zeros(count), where=~dangling)
+                flow = np.bincount(targets, weights=share[sources], minlength=count)
+                rank = (1 - self.DAMPING) / count + self.DAMPING * (flow + rank[dangling].sum() / count)
+            return array('d', (rank / rank.max()).tolist())
+
+        rank = [1.0 / count] * count
+        for _ in range(self.ITERATIONS):
+            dangling = sum(rank[node] for node in range(count) if not out_degree[node])
+            base = (1 - self.DAMPING) / count + self.DAMPING * dangling / count
+            flow = [base] * count
+            for node in range(count):
+                if out_degree[node]:
+                    share = self.DAMPING * rank[node] / out_degree[node]
+                    for target in self.indices[self.indptr[node]:self.indptr[node + 1]]:
+                        flow[target] += share
+            rank = flow
+        top = max(rank)
+        return array('d', (value / top for value in rank))
+
+    def links(self, path):
+        """Notas para as quais `path` aponta"""
+        node = self.node_ids.get(path)
+        if node is None:
+            return []
+        return [self.nodes[target] for target in self.indices[self.indptr[node]:self.indptr[node + 1]]]
+
+    def backlinks(self, path):
+        """Notas que apontam para `path`"""
+        node = self.node_ids.get(path)
+        if node is None:
+            return []
+        return [self.nodes[source]
+                for source in self.back_indices[self.back_indptr[node]:self.back_indptr[node + 1]]]
+
+    def neighbors(self, path):
+        """Vizinhos a um salto, nos dois sentidos"""
+        return set(self.links(path)) | set(self.backlinks(path))
+
+    def prior(self, path):
+        """PageRank normalizado da nota (0 se desconhecida)"""
+        node = self.node_ids.get(path)
+        return self.rank[node] if node is not None else 0.0
+
+    def save(self, path):
+        """Grava o grafo em disco de forma atômica e retorna o novo carimbo de versão"""
+        self.stamp = os.urandom(8).hex()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.VERSION, self.__dict__), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return self.stamp
+
+    @classmethod
+    def load(cls, path):
+        """Carrega um grafo salvo; retorna None se o arquivo for de outra versão"""
+        with open(path, 'rb') as f:
+            version, state = pickle.load(f)
+        if version != cls.VERSION:
+            return None
+        graph = cls()
+        graph.__dict__.update(state)
+        return graph
+
+
+def expand_with_neighbors(ranked, graph, limit, seeds=3, prior_weight=0.05, neighbor_weight=0.15, pulled=3,
+                          allowed=None, first_passage=None):
+    """Reordena trechos ranqueados usando o grafo de links
+
+    Cada trecho ganha um bônus proporcional ao PageRank da nota. Trechos de notas
+    vizinhas (a um salto) das `seeds` melhores notas sobem com uma fração da
+    pontuação da nota que os liga, sem passar à frente dela. Até `pulled` vizinhos fora da lista, os de maior
+    PageRank, entram pelo primeiro trecho de conteúdo (`first_passage(caminho)`, que
+    pula o frontmatter; sem ela, o trecho 0), com pontuação menor que a dos vizinhos
+    encontrados pela busca (só entre as notas `allowed`, quando há filtros). Só
+    consulta arrays em memória; não relê conteúdo.
+    """
+    if not ranked or not len(graph):
+        return ranked[:limit]
+
+    # BM25 e a fusão têm escalas diferentes: os pesos valem sobre a pontuação relativa à melhor
+    top = ranked[0][1] or 1.0
+    scores = {key: score / top for key, score in ranked}
+    note_of = {key: key.rpartition('#')[0] for key in scores}
+
+    seed_scores = {}
+    for key, _ in ranked:
+        path = note_of[key]
+        if path not in seed_scores:
+            seed_scores[path] = scores[key]
+            if len(seed_scores) == seeds:
+                break
+
+    neighbor_scores = {}
+    for path, score in seed_scores.items():
+        for neighbor in graph.neighbors(path):
+            if neighbor not in seed_scores:
+                neighbor_scores[neighbor] = max(neighbor_scores.get(neighbor, 0.0), score)
+
+    present = set(note_of.values())
+    for key, path in note_of.items():
+        if path in neighbor_scores:
+            seed_score = neighbor_scores[path]
+            scores[key] = min(scores[key] + neighbor_weight * seed_score, max(scores[key], seed_score))
+        scores[key] *= 1 + prior_weight * graph.prior(path)
+
+    missing = sorted((path for path in neighbor_scores
+                      if path not in present and (allowed is None or path in allowed)),
+                     key=graph.prior, reverse=True)[:pulled]
+    for path in missing:
+        ordinal = first_passage(path) if first_passage else 0
+        scores[passage_key(path, ordinal)] = neighbor_weight / 2 * neighbor_scores[path]
+
+    # De volta à escala original da busca deste cofre (outros cofres têm a sua; a junção é por posição)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [(key, score * top) for key, score in ranked]
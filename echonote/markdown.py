@@ -0,0 +1,99 @@
+"""Tokenizador do subconjunto de Markdown mostrado no chat, sem depender do Tk"""
+import re
+from itertools import groupby
+from operator import itemgetter
+
+# Uma única expressão, varrida da esquerda para a direita: os trechos nunca se sobrepõem
+# (o `**` do negrito é consumido antes de o itálico ter chance de casar com ele)
+INLINE_PATTERN = re.compile(
+    r"`(?P<code>[^`\n]+)`"
+    r"|\*\*(?P<bold>[^*\n](?:.*?[^*\n])?)\*\*"
+    r"|\[(?P<link>[^\]\n]+)\]\((?P<url>[^)\s]*)\)"
+    r"|\*(?P<italic>[^*\s](?:[^*\n]*?[^*\s])?)\*"
+)
+HEADING_PATTERN = re.compile(r"(#{1,3}) ")
+HEADING_TAGS = ('heading1', 'heading2', 'heading3')
+
+
+def inline_runs(text, base_tags=()):
+    """Divide o texto em trechos (texto, tags) de negrito, itálico, código e links
+
+    `base_tags` vale para a linha inteira (ex.: uma citação com negrito dentro).
+    """
+    runs = []
+    last = 0
+    for match in INLINE_PATTERN.finditer(text):
+        if match.start() > last:
+            runs.append((text[last:match.start()], base_tags))
+        kind = match.lastgroup
+        if kind == 'url':
+            # Dos links, só o texto aparece no chat
+            runs.append((match.group('link'), base_tags + ('link',)))
+        else:
+            runs.append((match.group(kind), base_tags + (kind,)))
+        last = match.end()
+    if last < len(text):
+        runs.append((text[last:], base_tags))
+    return runs
+
+
+def merge_runs(runs):
+    """Junta trechos vizinhos com as mesmas tags; retorna os argumentos de um Text.insert"""
+    args = []
+    for tags, group in groupby(runs, key=itemgetter(1)):
+        args.append(''.join(text for text, _ in group))
+        args.append(tags)
+    return args
+
+
+class MarkdownTokenizer:
+    """Converte linhas completas de Markdown em trechos (texto, tags), lembrando blocos de código"""
+
+    def __init__(self):
+        self.in_code_block = False
+
+    def line_runs(self, line):
+        """Trechos de uma linha completa, já com a quebra de linha final"""
+        stripped = line.strip()
+
+        if self.in_code_block:
+            if stripped.startswith('```'):
+                # Fim de bloco de código
+                self.in_code_block = False
+                return []
+            return [(line + '\n', ('code_block',))]
+        if stripped.startswith('```'):
+            if stripped.endswith('```') and len(stripped) >= 6:
+                # Bloco de código numa linha só
+                return [(stripped[3:-3] + '\n', ('code_block',))]
+            # Início de bloco de código: a linguagem, se houver, vira o cabeçalho do bloco
+            self.in_code_block = True
+            info = stripped[3:].strip()
+            return [(info + '\n', ('code_block',))] if info else []
+
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            return inline_runs(line[heading.end():] + '\n', (HEADING_TAGS[len(heading.group(1)) - 1],))
+        if line.startswith('> '):
+            return inline_runs(line[2:] + '\n', ('quote',))
+        return inline_runs(line + '\n')
+
+    def pending_tags(self):
+        """Tags do texto provisório de uma linha ainda incompleta"""
+        return ('code_block',) if self.in_code_block else ()
+
+    def close(self):
+        """Fecha um bloco de código que ficou aberto no fim da mensagem"""
+        self.in_code_block = False
+
+
+def markdown_runs(text):
+    """Todos os trechos (texto, tags) de uma mensagem completa"""
+    tokenizer = MarkdownTokenizer()
+    *lines, last = text.split('\n')
+    runs = []
+    for line in lines:
+        runs.extend(tokenizer.line_runs(line))
+    if last:
+        runs.extend(tokenizer.line_runs(last))
+    return runs
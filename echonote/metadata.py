@@ -0,0 +1,250 @@
+"""Índice de metadados (tags, frontmatter, pasta e data) e filtros na pergunta (tag:, path:, after:)"""
+import os
+import re
+import time
+import bisect
+import pickle
+from datetime import datetime
+
+from .links import read_frontmatter
+
+# Tag do Obsidian: '#' no início de palavra, com ao menos um caractere que não seja dígito
+TAG_PATTERN = re.compile(r"(?<![\w#/&])#([\w/-]*[^\W\d_][\w/-]*)")
+FILTER_PATTERN = re.compile(r"(?<!\S)(-?)([\w-]+):(\"[^\"]+\"|\S+)")
+RELATIVE_DATE_PATTERN = re.compile(r"^(\d+)([dwmy])$")
+RELATIVE_DAYS = {'d': 1, 'w': 7, 'm': 30, 'y': 365}
+
+# Nome aceito na pergunta -> tipo do filtro
+FILTER_NAMES = {
+    'tag': 'tag',
+    'path': 'path', 'pasta': 'path',
+    'after': 'after', 'depois': 'after',
+    'before': 'before', 'antes': 'before',
+}
+# Campos do frontmatter que já viram tags ou links
+RESERVED_FIELDS = ('tags', 'tag', 'aliases', 'alias')
+
+
+def normalize_tag(tag):
+    return tag.strip().lstrip('#').casefold()
+
+
+def normalize_folder(path):
+    return path.strip().strip('"').replace('\\', '/').strip('/').casefold()
+
+
+def text_tags(text):
+    """Tags escritas no texto (#tag, #projeto/x), normalizadas"""
+    return {tag.casefold() for tag in TAG_PATTERN.findall(text)}
+
+
+def frontmatter_metadata(text):
+    """Tags e pares (campo, valor) declarados no frontmatter do início da nota"""
+    frontmatter = read_frontmatter(text)
+    tags = {normalize_tag(tag) for key in ('tags', 'tag') for tag in frontmatter.get(key, ())}
+    fields = {(key, value.casefold()) for key, values in frontmatter.items()
+              if key not in RESERVED_FIELDS for value in values}
+    tags.discard('')
+    return tags, fields
+
+
+def parse_date(value, now=None):
+    """Converte '2024-05-01' ou relativo ('7d', '2w', '3m', '1y') em timestamp; None se inválido"""
+    relative = RELATIVE_DATE_PATTERN.match(value)
+    if relative:
+        days = int(relative.group(1)) * RELATIVE_DAYS[relative.group(2)]
+        return (now or time.time()) - days * 86400
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def has_relative_date(text):
+    """Indica se a pergunta tem filtro de data relativa (`after:7d`), que muda com o relógio"""
+    return any(FILTER_NAMES.get(match.group(2).lower()) in ('after', 'before')
+               and RELATIVE_DATE_PATTERN.match(match.group(3).strip('"'))
+               for match in FILTER_PATTERN.finditer(text))
+
+
+class MetadataIndex:
+    """Tags, campos do frontmatter, pasta e data de cada nota, para filtrar antes de pontuar
+
+    Cada tag e cada par campo/valor aponta para o conjunto das notas que o têm;
+    caminhos e datas ficam em listas ordenadas, consultadas por busca binária
+    (prefixo de pasta, intervalo de datas). Os filtros são interseções desses
+    conjuntos, sem tocar no conteúdo das notas.
+    """
+
+    VERSION = 2
+
+    def __init__(self):
+        self.note_tags = {}          # caminho -> tags da nota (para remoção)
+        self.note_fields = {}        # caminho -> (campo, valor) da nota
+        self.mtimes = {}             # caminho -> data de modificação
+        self.content_starts = {}     # caminho -> primeiro trecho depois do frontmatter (só se não for o 0)
+        self.tags = {}               # tag -> {caminhos}
+        self.fields = {}             # (campo, valor) -> {caminhos}
+        self.field_counts = {}       # campo -> quantidade de valores distintos
+        self.sorted_tags = []        # para 'tag:projeto' incluir 'projeto/x'
+        self.by_path = []            # (caminho normalizado, caminho), ordenado
+        self.by_mtime = []           # (mtime, caminho), ordenado
+        self.stamp = None            # identifica a versão salva, conferida com o banco
+
+    def __len__(self):
+        return len(self.note_tags)
+
+    def set_note(self, path, mtime, tags=(), fields=(), content_start=0):
+        """Registra (ou substitui) os metadados de uma nota
+
+        `content_start` é o primeiro trecho com conteúdo: 1 quando o trecho 0 é só o frontmatter.
+        """
+        self.remove_note(path)
+        if content_start:
+            self.content_starts[path] = content_start
+        self.note_tags[path] = tuple(tags)
+        for tag in tags:
+            if tag not in self.tags:
+                self.tags[tag] = set()
+                bisect.insort(self.sorted_tags, tag)
+            self.tags[tag].add(path)
+        self.note_fields[path] = tuple(fields)
+        for field in fields:
+            if field not in self.fields:
+                self.fields[field] = set()
+                self.field_counts[field[0]] = self.field_counts.get(field[0], 0) + 1
+            self.fields[field].add(path)
+
+        bisect.insort(self.by_path, (normalize_folder(path), path))
+        self.touch(path, mtime)
+
+    def touch(self, path, mtime):
+        """Atualiza a data de modificação de uma nota"""
+        previous = self.mtimes.pop(path, None)
+        if previous is not None:
+            del self.by_mtime[bisect.bisect_left(self.by_mtime, (previous, path))]
+        if mtime is not None:
+            self.mtimes[path] = mtime
+            bisect.insort(self.by_mtime, (mtime, path))
+
+    def remove_note(self, path):
+        self.content_starts.pop(path, None)
+        tags = self.note_tags.pop(path, None)
+        if tags is None:
+            return
+        for tag in tags:
+            self.tags[tag].discard(path)
+            if not self.tags[tag]:
+                del self.tags[tag]
+                del self.sorted_tags[bisect.bisect_left(self.sorted_tags, tag)]
+        for field in self.note_fields.pop(path):
+            self.fields[field].discard(path)
+            if not self.fields[field]:
+                del self.fields[field]
+                self.field_counts[field[0]] -= 1
+                if not self.field_counts[field[0]]:
+                    del self.field_counts[field[0]]
+        del self.by_path[bisect.bisect_left(self.by_path, (normalize_folder(path), path))]
+        self.touch(path, None)
+
+    def parse_query(self, text):
+        """Separa os filtros do texto da pergunta; retorna (texto restante, [(tipo, valor, negado)])
+
+        Entende `tag:`, `path:`/`pasta:`, `after:`/`depois:`, `before:`/`antes:` e
+        `campo:valor` para campos que existem no frontmatter das notas. Um `-` antes
+        exclui as notas que casam. O resto do texto fica como está.
+        """
+        filters = []
+
+        def take(match):
+            negated, name, value = match.group(1) == '-', match.group(2).lower(), match.group(3).strip('"')
+            kind = FILTER_NAMES.get(name)
+            if kind in ('after', 'before'):
+                value = parse_date(value)
+                if value is None:
+                    return match.group(0)
+            elif kind is None:
+                if name not in self.field_counts:
+                    return match.group(0)
+                kind, value = 'field', (name, value.casefold())
+            filters.append((kind, value, negated))
+            return ''
+
+        remaining = FILTER_PATTERN.sub(take, text)
+        return ' '.join(remaining.split()), filters
+
+    def matching(self, kind, value):
+        """Conjunto das notas que casam com um filtro"""
+        if kind == 'tag':
+            tag = normalize_tag(value)
+            matched = self.tags.get(tag, set())
+            # Tags aninhadas: 'projeto' também casa com 'projeto/x'
+            start = bisect.bisect_left(self.sorted_tags, tag + '/')
+            for nested in self.sorted_tags[start:]:
+                if not nested.startswith(tag + '/'):
+                    break
+                matched = matched | self.tags[nested]
+            return matched
+        if kind == 'field':
+            return self.fields.get(value, set())
+        if kind == 'path':
+            # Pasta inteira: 'path:Projetos' casa com tudo dentro de Projetos/ (e não com
+            # 'Projetos Antigos/'), ou com a própria nota se for o caminho de uma
+            prefix = normalize_folder(value)
+            start = bisect.bisect_left(self.by_path, (prefix + '/',))
+            stop = bisect.bisect_left(self.by_path, (prefix + '/\uffff',))
+            matched = {path for _, path in self.by_path[start:stop]}
+            exact = bisect.bisect_left(self.by_path, (prefix,))
+            while exact < len(self.by_path) and self.by_path[exact][0] == prefix:
+                matched.add(self.by_path[exact][1])
+                exact += 1
+            return matched
+        if kind == 'after':
+            start = bisect.bisect_left(self.by_mtime, (value,))
+            return {path for _, path in self.by_mtime[start:]}
+        if kind == 'before':
+            stop = bisect.bisect_left(self.by_mtime, (value,))
+            return {path for _, path in self.by_mtime[:stop]}
+        raise ValueError(f"Filtro desconhecido: {kind}")
+
+    def select(self, filters):
+        """Caminhos das notas que passam em todos os filtros, intersectando do menor conjunto ao maior"""
+        included = sorted((self.matching(kind, value) for kind, value, negated in filters if not negated), key=len)
+        excluded = [self.matching(kind, value) for kind, value, negated in filters if negated]
+
+        selected = set(included[0]) if included else set(self.note_tags)
+        for matched in included[1:]:
+            if not selected:
+                break
+            selected &= matched
+        for matched in excluded:
+            selected -= matched
+        return selected
+
+    def first_passage(self, path):
+        """Primeiro trecho da nota que não é só frontmatter (o que representa a nota no contexto)"""
+        return self.content_starts.get(path, 0)
+
+    def recent_first(self, paths):
+        """Ordena caminhos da nota modificada mais recentemente para a mais antiga"""
+        return sorted(paths, key=lambda path: self.mtimes.get(path, 0), reverse=True)
+
+    def save(self, path):
+        """Grava o índice em disco de forma atômica e retorna o novo carimbo de versão"""
+        self.stamp = os.urandom(8).hex()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.VERSION, self.__dict__), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return self.stamp
+
+    @classmethod
+    def load(cls, path):
+        """Carrega um índice salvo; retorna None se o arquivo for de outra versão"""
+        with open(path, 'rb') as f:
+            version, state = pickle.load(f)
+        if version != cls.VERSION:
+            return None
+        index = cls()
+        index.__dict__.update(state)
+        return index
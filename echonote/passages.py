@@ -0,0 +1,124 @@
+"""Divisão das notas em trechos e montagem do contexto enviado à IA"""
+import re
+from collections import namedtuple
+
+Passage = namedtuple('Passage', ['ordinal', 'heading', 'start', 'end', 'text'])
+
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+PASSAGE_MAX_CHARS = 1500
+# Quebras de linha reconhecidas por str.splitlines
+LINE_BREAKS = frozenset('\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029')
+
+
+def passage_key(path, ordinal):
+    """Identificador estável de um trecho: caminho da nota + posição do trecho"""
+    return f"{path}#{ordinal}"
+
+
+def split_passages(content, max_chars=PASSAGE_MAX_CHARS):
+    """Divide a nota em trechos contíguos, quebrando em cabeçalhos e em parágrafos longos"""
+    return list(stream_passages([content], max_chars))
+
+
+def line_pieces(chunks, max_chars=PASSAGE_MAX_CHARS):
+    """Linhas do texto, com as gigantes (ex.: JSON colado) em pedaços de até `max_chars`
+
+    O texto chega em blocos de tamanho qualquer; só a linha incompleta do fim de
+    cada bloco fica guardada, e nunca com mais de `max_chars` caracteres.
+    """
+    carry = ''
+    for chunk in chunks:
+        lines = (carry + chunk).splitlines(keepends=True)
+        carry = ''
+        # '\r' no fim pode ser a metade de um '\r\n' que chega no próximo bloco
+        if lines and (lines[-1][-1] == '\r' or lines[-1][-1] not in LINE_BREAKS):
+            carry = lines.pop()
+        for line in lines:
+            for i in range(0, len(line), max_chars):
+                yield line[i:i + max_chars]
+        if len(carry) > max_chars:
+            ready = (len(carry) - 1) // max_chars * max_chars
+            for i in range(0, ready, max_chars):
+                yield carry[i:i + max_chars]
+            carry = carry[ready:]
+    for i in range(0, len(carry), max_chars):
+        yield carry[i:i + max_chars]
+
+
+def stream_passages(chunks, max_chars=PASSAGE_MAX_CHARS):
+    """Gera os trechos de um texto que chega em blocos (ex.: lido do disco aos poucos)
+
+    Os trechos são os mesmos de split_passages sobre o texto inteiro; na memória
+    fica só o trecho em formação.
+    """
+    ordinal = 0
+    headings = []
+    heading = ''
+    start = pos = 0
+    paragraph_break = 0
+    break_pieces = 0  # quantos pedaços pendentes vão até paragraph_break
+    pending = []      # pedaços desde `start`
+    in_fence = False
+    
+    for piece in line_pieces(chunks, max_chars):
+        stripped = piece.strip()
+        if stripped.startswith('```'):
+            in_fence = not in_fence
+        
+        match = None if in_fence else HEADING_PATTERN.match(piece)
+        end = None
+        if match:
+            end = pos
+        elif pos + len(piece) - start > max_chars:
+            end = paragraph_break if paragraph_break > start else pos
+        if end is not None and end > start:
+            taken = len(pending) if end == pos else break_pieces
+            yield Passage(ordinal, heading, start, end, ''.join(pending[:taken]))
+            ordinal += 1
+            del pending[:taken]
+            start = end
+        
+        if match:
+            level = len(match.group(1))
+            headings = [h for h in headings if h[0] < level] + [(level, match.group(2))]
+            heading = ' › '.join(text for _, text in headings)
+        
+        pending.append(piece)
+        pos += len(piece)
+        if not stripped:
+            paragraph_break = pos
+            break_pieces = len(pending)
+    
+    if pos > start:
+        yield Passage(ordinal, heading, start, pos, ''.join(pending))
+
+
+def estimate_tokens(text):
+    """Estimativa rápida de tokens (~4 caracteres por token)"""
+    return len(text) // 4 + 1
+
+
+def pack_context(passages, token_budget):
+    """Preenche o orçamento de tokens com os trechos na ordem de relevância; retorna (contexto, trechos usados)"""
+    context = "Base de conhecimento das suas anotações:\n\n"
+    remaining = token_budget - estimate_tokens(context)
+    used = []
+    
+    for passage in passages:
+        title = passage['título']
+        if passage['cabeçalho']:
+            title += f" › {passage['cabeçalho']}"
+        block = (f"=== {title} ===\n"
+                 f"Arquivo: {passage['caminho']} (caracteres {passage['início']}-{passage['fim']})\n"
+                 f"{passage['texto'].strip()}\n\n")
+        
+        # Trechos que não cabem são pulados; um menor mais abaixo ainda pode caber
+        cost = estimate_tokens(block)
+        if cost > remaining:
+            continue
+        
+        context += block
+        remaining -= cost
+        used.append(passage)
+    
+    return context, used
@@ -0,0 +1,107 @@
+"""Varredura do cofre do Obsidian com poda de diretórios e leitura em paralelo"""
+import os
+import fnmatch
+import queue
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+VaultFile = namedtuple('VaultFile', ['relative_path', 'full_path', 'size', 'mtime'])
+
+
+class VaultScanner:
+    """Percorre o cofre podando diretórios ignorados e lê arquivos em paralelo"""
+
+    IGNORED_DIRS = ('.obsidian', '.trash', '.git')
+
+    def __init__(self, root, ignore_patterns=(), workers=None, queue_size=256):
+        self.root = str(root)
+        self.ignore_patterns = [pattern.strip() for pattern in ignore_patterns if pattern.strip()]
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.queue_size = queue_size
+
+    def is_ignored(self, name, relative_path):
+        """Indica se um arquivo ou diretório deve ser ignorado"""
+        if name in self.IGNORED_DIRS:
+            return True
+        return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern)
+                   for pattern in self.ignore_patterns)
+
+    def walk(self):
+        """Gera um VaultFile para cada .md, sem descer em diretórios ignorados"""
+        pending = [('', self.root)]
+        while pending:
+            relative_dir, directory = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        relative_path = f"{relative_dir}{entry.name}"
+                        if self.is_ignored(entry.name, relative_path):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append((relative_path + '/', entry.path))
+                        elif entry.name.endswith('.md') and entry.is_file():
+                            stat = entry.stat()
+                            yield VaultFile(str(Path(relative_path)), entry.path,
+                                            stat.st_size, stat.st_mtime)
+            except OSError as e:
+                print(f"Erro ao listar diretório {directory}: {e}")
+
+    def read_files(self, files, parse, progress=None):
+        """Processa arquivos com `parse` em um pool de threads; gera (arquivo, resultado, erro)
+
+        Se quem consome abandona o gerador (erro ou cancelamento no meio do
+        escaneamento), as threads param em vez de ficarem presas nas filas cheias.
+        """
+        total = len(files)
+        if not total:
+            return
+        
+        tasks = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue(maxsize=self.queue_size)
+        workers = min(self.workers, total)
+        stop = threading.Event()
+        
+        def put(target, item):
+            """Enfileira sem travar para sempre; retorna False se a leitura foi abandonada"""
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def feed():
+            for vault_file in files:
+                if not put(tasks, vault_file):
+                    return
+            for _ in range(workers):
+                put(tasks, None)
+        
+        def work():
+            while not stop.is_set():
+                try:
+                    vault_file = tasks.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if vault_file is None:
+                    return
+                try:
+                    result = (vault_file, parse(vault_file), None)
+                except Exception as e:
+                    result = (vault_file, None, e)
+                if not put(results, result):
+                    return
+        
+        threading.Thread(target=feed, daemon=True).start()
+        for _ in range(workers):
+            threading.Thread(target=work, daemon=True).start()
+        
+        try:
+            for done in range(1, total + 1):
+                yield results.get()
+                if progress:
+                    progress(done, total)
+        finally:
+            stop.set()
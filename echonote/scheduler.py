@@ -0,0 +1,210 @@
+"""Fila de perguntas com prioridades, cancelamento, deduplicação (single-flight) e entrega em ordem"""
+import heapq
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .gemini import CancelToken, RequestCancelled
+from .tracing import Trace
+
+HIGH, NORMAL, LOW = 0, 1, 2
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'na fila', 'executando', 'concluída', 'erro', 'cancelada'
+
+
+def question_key(question):
+    """Chave de deduplicação: a mesma pergunta, ignorando espaços e maiúsculas"""
+    return ' '.join(question.split()).casefold()
+
+
+class Ticket:
+    """Uma pergunta enviada ao agendador e o que aconteceu com ela"""
+
+    def __init__(self, number, question, priority, scope=None):
+        self.number = number
+        self.question = question
+        self.priority = priority
+        self.scope = scope       # cofres consultados (None: todos)
+        self.key = (question_key(question), scope)
+        self.state = QUEUED
+        self.cancel_token = CancelToken()
+        self.trace = Trace('pergunta')  # começa no envio: inclui a espera na fila
+        self.duplicates = 0      # envios repetidos atendidos por este mesmo ticket
+        self.buffer = []         # pedaços gerados antes de chegar a vez de entregar
+        self.result = None
+        self.error = None
+        self.finished = False
+
+    def __repr__(self):
+        return f"Ticket(#{self.number}, {self.state}, {self.question[:30]!r})"
+
+
+class RequestScheduler:
+    """Executa perguntas num pool de threads ao lado do loop da interface
+
+    - Até `max_workers` perguntas ao mesmo tempo; as demais esperam numa fila
+      ordenada por prioridade e, dentro da mesma prioridade, por chegada.
+    - Uma pergunta idêntica a outra ainda na fila ou em execução não gera nova
+      chamada: o envio repetido se junta ao ticket existente (single-flight).
+    - Pedaços em streaming, respostas, erros e cancelamentos chegam aos ganchos
+      na ordem em que as perguntas foram enviadas; o que termina antes da vez
+      fica guardado no ticket.
+
+    Os ganchos são chamados por `post`, que a interface troca por uma fila lida
+    na thread do Tk. `post` é chamado com a trava do agendador (os eventos nunca
+    trocam de ordem no caminho) e por isso não pode bloquear.
+    """
+
+    def __init__(self, handler, max_workers=2):
+        self.handler = handler   # handler(ticket, on_chunk) -> resultado
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pergunta')
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.counter = itertools.count(1)
+        self.queue = []          # heap de (prioridade, número, ticket)
+        self.in_flight = {}      # (chave da pergunta, scope) -> ticket na fila ou em execução
+        self.undelivered = deque()  # tickets em ordem de envio ainda não entregues
+        self.running = 0
+
+        # Ganchos para quem mostra as respostas (ex.: o chat da interface)
+        self.post = lambda function, *args: function(*args)
+        self.on_chunk = lambda ticket, chunk: None
+        self.on_result = lambda ticket, result: None
+        self.on_error = lambda ticket, error: None
+        self.on_cancelled = lambda ticket: None
+        self.on_queue_changed = lambda tickets: None
+
+    def submit(self, question, priority=NORMAL, scope=None):
+        """Enfileira uma pergunta; retorna (ticket, repetida)
+
+        `scope` (hashable, ex.: frozenset de cofres) acompanha o ticket até o handler.
+        Se a mesma pergunta, com o mesmo `scope`, já está na fila ou em execução,
+        retorna o ticket existente (com prioridade elevada, se a nova for maior) e `True`.
+        """
+        with self.lock:
+            key = (question_key(question), scope)
+            ticket = self.in_flight.get(key)
+            if ticket is not None:
+                ticket.duplicates += 1
+                if priority < ticket.priority and ticket.state == QUEUED:
+                    ticket.priority = priority
+                    self.queue = [(ticket.priority if entry is ticket else p, n, entry)
+                                  for p, n, entry in self.queue]
+                    heapq.heapify(self.queue)
+                self.notify_queue()
+                return ticket, True
+
+            ticket = Ticket(next(self.counter), question, priority, scope)
+            self.in_flight[key] = ticket
+            self.undelivered.append(ticket)
+            heapq.heappush(self.queue, (priority, ticket.number, ticket))
+            self.dispatch()
+            self.notify_queue()
+            return ticket, False
+
+    def dispatch(self):
+        """Inicia os tickets da fila enquanto houver vagas (chamado com a trava)"""
+        while self.queue and self.running < self.max_workers:
+            _, _, ticket = heapq.heappop(self.queue)
+            if ticket.state != QUEUED:
+                continue
+            ticket.state = RUNNING
+            ticket.trace.add('fila', ticket.trace.since_start())
+            self.running += 1
+            self.executor.submit(self.run, ticket)
+
+    def run(self, ticket):
+        """Executa um ticket numa thread do pool"""
+        try:
+            result = self.handler(ticket, lambda chunk: self.chunk(ticket, chunk))
+        except RequestCancelled:
+            self.finish(ticket, CANCELLED)
+        except Exception as e:
+            self.finish(ticket, FAILED, error=e)
+        else:
+            self.finish(ticket, DONE, result=result)
+
+    def chunk(self, ticket, chunk):
+        with self.lock:
+            if self.undelivered and self.undelivered[0] is ticket:
+                self.post(self.on_chunk, ticket, chunk)
+            else:
+                ticket.buffer.append(chunk)
+
+    def finish(self, ticket, state, result=None, error=None):
+        with self.lock:
+            if ticket.state == RUNNING:
+                self.running -= 1
+            ticket.state, ticket.result, ticket.error = state, result, error
+            ticket.finished = True
+            if self.in_flight.get(ticket.key) is ticket:
+                del self.in_flight[ticket.key]
+            self.deliver()
+            self.dispatch()
+            self.notify_queue()
+            if not self.undelivered:
+                self.idle.notify_all()
+
+    def deliver(self):
+        """Entrega, em ordem de envio, tudo o que já pode ser entregue (chamado com a trava)"""
+        while self.undelivered:
+            ticket = self.undelivered[0]
+            # O ticket da vez recebe de uma vez os pedaços guardados enquanto esperava
+            for chunk in ticket.buffer:
+                self.post(self.on_chunk, ticket, chunk)
+            ticket.buffer = []
+            if not ticket.finished:
+                return
+            self.undelivered.popleft()
+            if ticket.state == DONE:
+                self.post(self.on_result, ticket, ticket.result)
+            elif ticket.state == FAILED:
+                self.post(self.on_error, ticket, ticket.error)
+            else:
+                self.post(self.on_cancelled, ticket)
+
+    def cancel(self, ticket):
+        """Cancela um ticket: tira da fila se ainda não começou, ou interrompe a execução"""
+        with self.lock:
+            if ticket.state == QUEUED:
+                self.finish_queued(ticket)
+                return
+        if ticket.state == RUNNING:
+            ticket.cancel_token.cancel()
+
+    def finish_queued(self, ticket):
+        """Marca um ticket que não chegou a executar como cancelado (chamado com a trava)"""
+        ticket.state = CANCELLED
+        ticket.finished = True
+        self.in_flight.pop(ticket.key, None)
+        self.deliver()
+        self.notify_queue()
+        if not self.undelivered:
+            self.idle.notify_all()
+
+    def cancel_all(self):
+        """Cancela tudo o que está na fila ou em execução"""
+        with self.lock:
+            tickets = [ticket for ticket in self.undelivered if not ticket.finished]
+        for ticket in tickets:
+            self.cancel(ticket)
+        return len(tickets)
+
+    def snapshot(self):
+        """Tickets ainda não entregues, em ordem de envio"""
+        with self.lock:
+            return list(self.undelivered)
+
+    def notify_queue(self):
+        self.post(self.on_queue_changed, list(self.undelivered))
+
+    def join(self, timeout=None):
+        """Espera até que todos os tickets enviados tenham sido entregues"""
+        with self.idle:
+            return self.idle.wait_for(lambda: not self.undelivered, timeout)
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
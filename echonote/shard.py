@@ -0,0 +1,730 @@
+"""Um cofre indexado: banco de notas, índices de busca, escaneamento incremental e carga em etapas"""
+import os
+import csv
+import hashlib
+import threading
+from pathlib import Path
+
+from .dedup import DuplicateIndex
+from .index import BM25Index, reciprocal_rank_fusion
+from .ingest import SkippedFile, read_chunks, read_note
+from .links import LinkGraph, expand_with_neighbors, extract_links, frontmatter_only, note_aliases
+from .metadata import MetadataIndex, frontmatter_metadata, text_tags
+from .passages import passage_key, split_passages, stream_passages
+from .scanner import VaultScanner
+from .store import NoteRecord, NoteStore, batched
+from .tracing import Trace, current_trace, span
+from .vectors import NUMPY_AVAILABLE, VectorIndex
+
+# Separa o nome do cofre do caminho da nota ('Pesquisa:Artigos/x.md'); o Obsidian não aceita ':' em nomes
+VAULT_SEPARATOR = ':'
+
+
+def describe_read_error(error):
+    """Motivo mostrado no relatório de arquivos que ficaram de fora do escaneamento"""
+    if isinstance(error, SkippedFile):
+        return str(error)
+    if isinstance(error, UnicodeDecodeError):
+        return f"codificação inválida: {error.reason}"
+    return f"erro de leitura: {error}"
+
+
+class VaultShard:
+    """Um cofre com seu próprio banco, índices e arquivos em `data_dir`, escaneado e carregado à parte
+
+    Dentro do cofre, notas e trechos usam o caminho relativo à raiz dele, como
+    sempre. Para fora (respostas, citações, cache), o caminho de um cofre com
+    nome ganha o prefixo `nome:`; o cofre principal (nome '') fica sem prefixo.
+    """
+
+    # Notas pequenas lidas são indexadas e gravadas em lotes de até tantas notas ou bytes
+    INGEST_BATCH_NOTES = 200
+    INGEST_BATCH_BYTES = 8 * 1024 * 1024
+    VECTOR_BATCH = 2000
+
+    def __init__(self, engine, name, data_dir):
+        self.engine = engine
+        self.name = name
+        self.data_dir = data_dir
+        self.csv_file = os.path.join(data_dir, "obsidian_notes.csv")
+        self.db_file = os.path.join(data_dir, "obsidian_notes.db")
+        self.index_file = os.path.join(data_dir, "obsidian_index.pkl")
+        self.vector_file = os.path.join(data_dir, "obsidian_vectors")
+        self.links_file = os.path.join(data_dir, "obsidian_links.pkl")
+        self.metadata_file = os.path.join(data_dir, "obsidian_metadata.pkl")
+        self.duplicates_file = os.path.join(data_dir, "obsidian_duplicates.pkl")
+
+        self.note_store = NoteStore(self.db_file)
+        self.response_cache = engine.response_cache
+        self.metrics = engine.metrics
+        self.search_index = BM25Index()
+        self.vector_index = None
+        self.link_graph = LinkGraph()
+        self.metadata_index = MetadataIndex()
+        self.duplicate_index = DuplicateIndex()
+        self.index_lock = threading.Lock()
+        self.generation = 0                # muda a cada alteração dos índices: resultados guardados deixam de valer
+        self.load_lock = threading.Lock()  # carga e escaneamento não se sobrepõem
+        self.warm = threading.Event()      # índices completos em memória
+        self.notes_data = []
+        self.notes_by_path = {}
+
+        # O andamento vai para os ganchos do motor, lidos na hora (a interface os troca depois)
+        self.on_status = lambda message: engine.on_status(message)
+        self.on_progress = lambda percent: engine.on_progress(percent)
+
+    def __repr__(self):
+        return f"VaultShard({self.name or 'principal'!r}, {self.data_dir!r})"
+
+    @property
+    def config(self):
+        return self.engine.config
+
+    @property
+    def root(self):
+        """Diretório do cofre, conforme a configuração atual"""
+        if not self.name:
+            return self.config['obsidian_path']
+        for vault in self.config['vaults']:
+            if vault['nome'] == self.name:
+                return vault['caminho']
+        raise Exception(f"Cofre não configurado: {self.name}")
+
+    def qualify(self, path):
+        """Caminho (ou chave de trecho) como visto fora do cofre"""
+        return f"{self.name}{VAULT_SEPARATOR}{path}" if self.name else path
+
+    # Carregamento e escaneamento
+
+    def has_saved_notes(self):
+        """Indica se há notas no banco (ou um CSV antigo a migrar)"""
+        return bool(self.note_store.count()) or os.path.exists(self.csv_file)
+
+    def load(self, on_ready=None):
+        """Carrega os metadados das notas do banco e abre os índices de busca
+
+        Primeiro vêm as notas, o índice de metadados e o grafo de links, que abrem em
+        poucas dezenas de milissegundos; a partir daí (`on_ready(notes)`) as perguntas
+        já são respondidas, pelo FTS5 do banco. O índice BM25, o de duplicatas e o
+        vetorial, os mais pesados, passam a valer assim que terminam de carregar. Quem
+        precisa da carga completa pode esperar por `warm`.
+        """
+        self.warm.clear()
+        trace = Trace('carregamento')
+        if self.name:
+            trace.set('cofre', self.name)
+        with self.load_lock, trace.activate():
+            try:
+                notes = self.load_in_stages(trace, on_ready)
+            finally:
+                self.warm.set()
+
+        trace.set('notas', len(notes))
+        self.metrics.record(trace.finish())
+        return notes
+
+    def load_in_stages(self, trace, on_ready):
+        """Etapas de `load`, da mais leve à mais pesada"""
+        if not self.note_store.count() and os.path.exists(self.csv_file):
+            with span('migração'):
+                self.migrate_csv_to_store()
+
+        with span('notas'):
+            notes = self.note_store.load_notes()
+        with span('metadados'):
+            metadata_index = self.load_metadata_index(notes)
+        with span('links'):
+            link_graph = self.load_link_graph(notes)
+        with self.index_lock:
+            # Até o índice BM25 carregar, o índice vazio faz a busca cair no FTS5
+            self.set_notes(notes, BM25Index())
+            self.metadata_index = metadata_index
+            self.link_graph = link_graph
+            self.duplicate_index = DuplicateIndex()
+            self.vector_index = None
+            self.generation += 1
+        trace.set('interativo_ms', round(trace.since_start(), 1))
+        if on_ready is not None:
+            on_ready(notes)
+
+        with span('índice'):
+            index = self.load_search_index()
+        with self.index_lock:
+            self.search_index = index
+            self.generation += 1
+        with span('duplicatas'):
+            duplicate_index = self.load_duplicate_index()
+        with self.index_lock:
+            self.duplicate_index = duplicate_index
+            self.generation += 1
+        with span('vetores'):
+            vector_index = self.load_vector_index()
+        with self.index_lock:
+            self.vector_index = vector_index
+            self.generation += 1
+        return notes
+
+    def migrate_csv_to_store(self):
+        """Importa o obsidian_notes.csv de versões anteriores para o banco SQLite"""
+        upserts = []
+        with open(self.csv_file, 'r', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                content = row['conteúdo']
+                raw = content.encode('utf-8')
+                passages = split_passages(content)
+                note = NoteRecord(row['caminho'], row['título'], len(raw), None, len(passages))
+                upserts.append((note, hashlib.sha1(raw).hexdigest(), passages))
+        self.note_store.apply_changes(upserts)
+
+    def scan(self, obsidian_path=None):
+        """Escaneia as notas Markdown, relendo apenas arquivos novos ou modificados
+
+        Retorna um resumo {'total', 'novas', 'alteradas', 'removidas', 'ignorados', 'tempos_ms',
+        'mudanças', 'arquivos_ignorados', 'codificações'}, onde 'mudanças' traz as notas gravadas
+        ou com metadados atualizados ('notas') e os caminhos removidos ('removidas'), para quem
+        mostra a lista aplicar só a diferença. 'arquivos_ignorados' dá o motivo de cada arquivo
+        deixado de fora (grande demais, binário, ilegível) e 'codificações' as notas lidas com
+        uma codificação alternativa (ex.: cp1252).
+        """
+        obsidian_path = Path(obsidian_path or self.root)
+
+        if not obsidian_path.exists():
+            raise Exception(f"Diretório não encontrado: {obsidian_path}")
+
+        trace = Trace('escaneamento')
+        if self.name:
+            trace.set('cofre', self.name)
+        # Um escaneamento durante a carga esperaria por ela: os índices em memória precisam estar completos
+        with self.load_lock, trace.activate():
+            summary, changes, report = self.scan_changes(obsidian_path)
+
+        trace.values.update(summary)
+        self.metrics.record(trace.finish())
+        summary['tempos_ms'] = trace.timings()
+        summary['mudanças'] = changes
+        summary.update(report)
+        return summary
+
+    def scan_changes(self, obsidian_path):
+        """Aplica ao banco e aos índices as mudanças encontradas no cofre; retorna (resumo, mudanças, relatório)
+
+        As notas lidas vão para os índices e para o banco em lotes, à medida que
+        chegam, e as maiores passam do disco ao banco em blocos: a memória usada
+        não cresce com o tamanho do cofre nem com o da maior nota.
+        """
+
+        # O manifesto só vale para o mesmo diretório e para notas já carregadas
+        manifest = self.load_manifest(obsidian_path)
+        known_notes = self.notes_by_path
+
+        notes = []
+        updated_notes = []
+        touched_notes = []
+        skipped = {}     # caminho -> motivo de o arquivo ter ficado de fora
+        fallbacks = {}   # caminho -> codificação alternativa com que foi lido
+
+        scanner = VaultScanner(obsidian_path, self.config['ignore_patterns'])
+        to_read = []
+
+        # Percorrer o cofre usando apenas os metadados do diretório
+        with span('varredura'):
+            for vault_file in scanner.walk():
+                entry = manifest.get(vault_file.relative_path)
+                known_note = known_notes.get(vault_file.relative_path)
+
+                # Arquivo intocado: reaproveitar a nota sem reler o conteúdo
+                if (entry and known_note
+                        and entry['size'] == vault_file.size
+                        and entry['mtime'] == vault_file.mtime):
+                    notes.append(known_note)
+                else:
+                    to_read.append(vault_file)
+
+        # Ler e processar os arquivos novos ou modificados em paralelo
+        last_percent = -1
+
+        def report_progress(done, total):
+            nonlocal last_percent
+            percent = done * 100 // total
+            if percent != last_percent:
+                last_percent = percent
+                self.on_progress(percent)
+                self.on_status(f"Lendo notas... {percent}% ({done}/{total})")
+
+        if to_read:
+            self.on_progress(0)
+
+        pending = []
+        pending_bytes = 0
+        invalidated = False
+
+        def flush():
+            nonlocal pending_bytes, invalidated
+            if not invalidated:
+                self.invalidate_saved_indexes()
+                invalidated = True
+            with span('indexação'):
+                self.ingest_notes(pending, known_notes)
+            pending.clear()
+            pending_bytes = 0
+
+        encodings = self.config['note_encodings']
+        results = scanner.read_files(to_read, self.read_note_file, report_progress)
+        while True:
+            with span('leitura'):
+                item = next(results, None)
+            if item is None:
+                break
+            vault_file, result, error = item
+            relative_path = vault_file.relative_path
+            if error:
+                skipped[relative_path] = describe_read_error(error)
+                continue
+
+            note, content_hash, passages, encoding = result
+            if encoding in encodings[1:]:
+                fallbacks[relative_path] = encoding
+            entry = manifest.get(relative_path)
+            known_note = known_notes.get(relative_path)
+
+            # Apenas a data mudou: atualizar metadados sem reindexar
+            if entry and known_note and entry['hash'] == content_hash:
+                known_note.size, known_note.mtime = note.size, note.mtime
+                notes.append(known_note)
+                touched_notes.append(known_note)
+                continue
+
+            if isinstance(passages, list):
+                notes.append(note)
+                updated_notes.append(note)
+                pending.append((note, content_hash, passages))
+                pending_bytes += note.size
+                if len(pending) >= self.INGEST_BATCH_NOTES or pending_bytes >= self.INGEST_BATCH_BYTES:
+                    flush()
+                continue
+
+            # Nota grande: sozinha, com os trechos lidos do disco enquanto são indexados e gravados
+            if pending:
+                flush()
+            pending.append((note, content_hash, passages))
+            try:
+                flush()
+            except (OSError, UnicodeDecodeError) as e:
+                pending.clear()
+                skipped[relative_path] = describe_read_error(e)
+                self.discard_note(note)
+                continue
+            notes.append(note)
+            updated_notes.append(note)
+        if pending:
+            flush()
+
+        seen_paths = {note.path for note in notes}
+        removed_paths = [path for path in known_notes if path not in seen_paths]
+
+        if removed_paths and not invalidated:
+            self.invalidate_saved_indexes()
+        if updated_notes or removed_paths:
+            self.on_status("Indexando notas...")
+            with self.index_lock, span('indexação'):
+                for path in removed_paths:
+                    self.remove_note_passages(known_notes[path])
+                    self.link_graph.remove_note(path)
+                    self.metadata_index.remove_note(path)
+                self.link_graph.compile()
+        if touched_notes:
+            with self.index_lock:
+                for note in touched_notes:
+                    self.metadata_index.touch(note.path, note.mtime)
+                self.generation += 1
+
+        # Gravar as mudanças no banco em transações por lote
+        self.on_status("Salvando notas...")
+        with span('gravação'):
+            self.note_store.apply_changes(touched=touched_notes, deletes=removed_paths)
+            self.note_store.set_meta('root', str(obsidian_path))
+            self.response_cache.invalidate_notes(
+                [self.qualify(path) for path in removed_paths + [note.path for note in updated_notes]]
+            )
+            if updated_notes or removed_paths:
+                with self.index_lock:
+                    self.save_search_index(self.search_index)
+                    self.save_duplicate_index(self.duplicate_index)
+                    self.save_link_graph(self.link_graph)
+            if updated_notes or removed_paths or touched_notes:
+                with self.index_lock:
+                    self.save_metadata_index(self.metadata_index)
+        if updated_notes or removed_paths:
+            with span('vetores'):
+                self.update_vector_index(updated_notes, [known_notes[path] for path in removed_paths],
+                                         known_notes)
+
+        with self.index_lock:
+            self.set_notes(notes, self.search_index)
+            if updated_notes or removed_paths:
+                self.generation += 1
+
+        added = sum(1 for note in updated_notes if note.path not in known_notes)
+        summary = {
+            'total': len(notes),
+            'novas': added,
+            'alteradas': len(updated_notes) - added,
+            'removidas': len(removed_paths),
+            'ignorados': len(skipped)
+        }
+        changes = {
+            'notas': updated_notes + touched_notes,
+            'removidas': removed_paths
+        }
+        report = {'arquivos_ignorados': skipped, 'codificações': fallbacks}
+        return summary, changes, report
+
+    def read_note_file(self, vault_file):
+        """Lê um arquivo do cofre; retorna (nota, hash do conteúdo, trechos, codificação)
+
+        Nas notas grandes os trechos vêm num gerador, que relê o arquivo em blocos
+        quando é consumido.
+        """
+        max_megabytes = self.config['max_note_size_mb']
+        content_hash, encoding, text = read_note(vault_file.full_path, vault_file.size,
+                                                 self.config['note_encodings'],
+                                                 max_megabytes * 1024 * 1024 if max_megabytes else None)
+        if text is None:
+            passages = stream_passages(read_chunks(vault_file.full_path, encoding))
+        else:
+            passages = split_passages(text)
+        note = NoteRecord(vault_file.relative_path, Path(vault_file.relative_path).stem,
+                          vault_file.size, vault_file.mtime, len(passages) if text is not None else 0)
+        return note, content_hash, passages, encoding
+
+    def ingest_notes(self, batch, known_notes):
+        """Indexa e grava no banco um lote de notas novas ou alteradas
+
+        Trechos em lista (notas pequenas) vão ao banco numa transação só; os de uma
+        nota grande chegam de um gerador e são indexados à medida que o banco os grava.
+        """
+        with self.index_lock:
+            for note, _, _ in batch:
+                if note.path in known_notes:
+                    self.remove_note_passages(known_notes[note.path])
+
+        if len(batch) == 1 and not isinstance(batch[0][2], list):
+            note, content_hash, passages = batch[0]
+            self.note_store.write_streamed_note(note, content_hash, self.index_passages(note, passages))
+        else:
+            self.note_store.apply_changes([(note, content_hash, list(self.index_passages(note, passages)))
+                                           for note, content_hash, passages in batch])
+
+    def index_passages(self, note, passages):
+        """Passa os trechos de uma nota pelos índices (BM25, duplicatas, links e metadados) à medida que são consumidos"""
+        targets = {}
+        aliases = []
+        tags, fields = set(), set()
+        starts_with_frontmatter = False
+        note.passages = 0
+        for passage in passages:
+            key = passage_key(note.path, passage.ordinal)
+            with self.index_lock:
+                self.search_index.add(key, f"{note.title} {passage.heading}", passage.text)
+                self.duplicate_index.add(key, passage.text)
+                self.generation += 1
+            note.passages += 1
+            targets.update(dict.fromkeys(extract_links(passage.text)))
+            tags |= text_tags(passage.text)
+            if passage.ordinal == 0:
+                aliases = note_aliases(passage.text)
+                frontmatter_tags, fields = frontmatter_metadata(passage.text)
+                tags |= frontmatter_tags
+                starts_with_frontmatter = frontmatter_only(passage.text)
+            yield passage
+
+        content_start = 1 if starts_with_frontmatter and note.passages > 1 else 0
+        with self.index_lock:
+            self.link_graph.set_note(note.path, list(targets), aliases)
+            self.metadata_index.set_note(note.path, note.mtime, sorted(tags), sorted(fields), content_start)
+            self.generation += 1
+
+    def discard_note(self, note):
+        """Desfaz a gravação interrompida de uma nota (ex.: arquivo apagado no meio da leitura)"""
+        with self.index_lock:
+            self.remove_note_passages(note)
+            self.link_graph.remove_note(note.path)
+            self.metadata_index.remove_note(note.path)
+        self.note_store.apply_changes(deletes=[note.path])
+
+    def invalidate_saved_indexes(self):
+        """Desvalida os índices salvos antes de mudar o banco; se o escaneamento for interrompido, são reconstruídos"""
+        for key in ('index_stamp', 'links_stamp', 'metadata_stamp', 'duplicates_stamp', 'vector_stamp'):
+            self.note_store.set_meta(key, '')
+
+    def remove_note_passages(self, note):
+        """Remove dos índices de busca e de duplicatas todos os trechos de uma nota"""
+        self.generation += 1
+        for ordinal in range(note.passages):
+            key = passage_key(note.path, ordinal)
+            self.search_index.remove(key)
+            self.duplicate_index.remove(key)
+
+    def load_manifest(self, obsidian_path):
+        """Carrega o manifesto (tamanho, data e hash de cada arquivo) do último escaneamento"""
+        if self.note_store.get_meta('root') != str(obsidian_path):
+            return {}
+        return self.note_store.manifest()
+
+    def set_notes(self, notes, index):
+        """Substitui as notas carregadas e o índice de busca correspondente"""
+        self.notes_by_path = {note.path: note for note in notes}
+        self.notes_data = notes
+        self.search_index = index
+
+    # Índices
+
+    def build_search_index(self):
+        """Constrói o índice invertido a partir dos trechos salvos no banco"""
+        index = BM25Index()
+        for key, title, heading, text in self.note_store.iter_passages():
+            index.add(key, f"{title} {heading}", text)
+        return index
+
+    def save_search_index(self, index):
+        """Salva o índice e registra no banco o carimbo que o valida"""
+        self.note_store.set_meta('index_stamp', index.save(self.index_file))
+
+    def load_search_index(self):
+        """Carrega o índice salvo ou reconstrói se estiver ausente ou desatualizado"""
+        index = None
+        if os.path.exists(self.index_file):
+            try:
+                index = BM25Index.load(self.index_file)
+            except Exception as e:
+                print(f"Erro ao carregar índice: {e}")
+
+        if index is None or index.stamp != self.note_store.get_meta('index_stamp'):
+            index = self.build_search_index()
+            self.save_search_index(index)
+
+        return index
+
+    def build_link_graph(self, notes):
+        """Reconstrói o grafo de links a partir dos trechos salvos no banco"""
+        targets = {note.path: [] for note in notes}
+        aliases = {}
+        for key, title, heading, text in self.note_store.iter_passages():
+            path, _, ordinal = key.rpartition('#')
+            targets.setdefault(path, []).extend(extract_links(text))
+            if ordinal == '0':
+                aliases[path] = note_aliases(text)
+
+        graph = LinkGraph()
+        for path, linked in targets.items():
+            graph.set_note(path, dict.fromkeys(linked), aliases.get(path, ()))
+        graph.compile()
+        return graph
+
+    def save_link_graph(self, graph):
+        """Salva o grafo de links e registra no banco o carimbo que o valida"""
+        self.note_store.set_meta('links_stamp', graph.save(self.links_file))
+
+    def load_link_graph(self, notes):
+        """Carrega o grafo de links salvo ou reconstrói se estiver ausente ou desatualizado"""
+        graph = None
+        if os.path.exists(self.links_file):
+            try:
+                graph = LinkGraph.load(self.links_file)
+            except Exception as e:
+                print(f"Erro ao carregar grafo de links: {e}")
+
+        if graph is None or graph.stamp != self.note_store.get_meta('links_stamp'):
+            graph = self.build_link_graph(notes)
+            self.save_link_graph(graph)
+
+        return graph
+
+    def build_metadata_index(self, notes):
+        """Reconstrói o índice de metadados a partir dos trechos salvos no banco"""
+        metadata = {note.path: (set(), set()) for note in notes}
+        frontmatter_notes = set()  # notas cujo trecho 0 é só o frontmatter
+        for key, title, heading, text in self.note_store.iter_passages():
+            path, _, ordinal = key.rpartition('#')
+            tags, fields = metadata.setdefault(path, (set(), set()))
+            tags |= text_tags(text)
+            if ordinal == '0':
+                frontmatter_tags, frontmatter_fields = frontmatter_metadata(text)
+                tags |= frontmatter_tags
+                fields |= frontmatter_fields
+                if frontmatter_only(text):
+                    frontmatter_notes.add(path)
+
+        index = MetadataIndex()
+        records = {note.path: note for note in notes}
+        for path, (tags, fields) in metadata.items():
+            note = records.get(path)
+            content_start = 1 if path in frontmatter_notes and note is not None and note.passages > 1 else 0
+            index.set_note(path, note.mtime if note else None, sorted(tags), sorted(fields), content_start)
+        return index
+
+    def save_metadata_index(self, index):
+        """Salva o índice de metadados e registra no banco o carimbo que o valida"""
+        self.note_store.set_meta('metadata_stamp', index.save(self.metadata_file))
+
+    def load_metadata_index(self, notes):
+        """Carrega o índice de metadados salvo ou reconstrói se estiver ausente ou desatualizado"""
+        index = None
+        if os.path.exists(self.metadata_file):
+            try:
+                index = MetadataIndex.load(self.metadata_file)
+            except Exception as e:
+                print(f"Erro ao carregar índice de metadados: {e}")
+
+        if index is None or index.stamp != self.note_store.get_meta('metadata_stamp'):
+            index = self.build_metadata_index(notes)
+            self.save_metadata_index(index)
+
+        return index
+
+    def build_duplicate_index(self):
+        """Calcula as assinaturas MinHash de todos os trechos salvos no banco"""
+        index = DuplicateIndex()
+        for key, title, heading, text in self.note_store.iter_passages():
+            index.add(key, text)
+        return index
+
+    def save_duplicate_index(self, index):
+        """Salva o índice de duplicatas e registra no banco o carimbo que o valida"""
+        self.note_store.set_meta('duplicates_stamp', index.save(self.duplicates_file))
+
+    def load_duplicate_index(self):
+        """Carrega o índice de duplicatas salvo ou reconstrói se estiver ausente ou desatualizado"""
+        index = None
+        if os.path.exists(self.duplicates_file):
+            try:
+                index = DuplicateIndex.load(self.duplicates_file)
+            except Exception as e:
+                print(f"Erro ao carregar índice de duplicatas: {e}")
+
+        if index is None or index.stamp != self.note_store.get_meta('duplicates_stamp'):
+            index = self.build_duplicate_index()
+            self.save_duplicate_index(index)
+
+        return index
+
+    def duplicate_signatures(self, keys):
+        """Assinaturas MinHash dos trechos pedidos que têm uma"""
+        with self.index_lock:
+            signatures = {key: self.duplicate_index.signature(key) for key in keys}
+        return {key: signature for key, signature in signatures.items() if signature is not None}
+
+    def vector_search_enabled(self):
+        """A busca vetorial depende do NumPy e pode ser desligada na configuração"""
+        return NUMPY_AVAILABLE and self.config['semantic_search']
+
+    def build_vector_index(self):
+        """Constrói o índice vetorial (TF-IDF/LSA) a partir dos trechos salvos no banco"""
+        passages = ((key, f"{title} {heading}\n{text}")
+                    for key, title, heading, text in self.note_store.iter_passages())
+        return VectorIndex.build(passages, self.config['vector_dimensions'])
+
+    def save_vector_index(self, index):
+        """Salva o índice vetorial e registra no banco o carimbo que o valida"""
+        self.note_store.set_meta('vector_stamp', index.save(self.vector_file))
+
+    def load_vector_index(self):
+        """Abre o índice vetorial salvo (matriz via mmap) ou reconstrói se estiver desatualizado"""
+        if not self.vector_search_enabled():
+            return None
+
+        index = None
+        if os.path.exists(f"{self.vector_file}.npz"):
+            try:
+                index = VectorIndex.load(self.vector_file)
+            except Exception as e:
+                print(f"Erro ao carregar índice vetorial: {e}")
+
+        if (index is None or index.stamp != self.note_store.get_meta('vector_stamp')
+                or index.requested_dimensions != self.config['vector_dimensions']):
+            index = self.build_vector_index()
+            self.save_vector_index(index)
+
+        return index
+
+    def update_vector_index(self, updated_notes, removed_notes, known_notes):
+        """Projeta trechos novos no índice vetorial existente ou o reconstrói se mudou demais
+
+        Os trechos das notas alteradas são lidos de volta do banco em lotes.
+        """
+        if not self.vector_search_enabled():
+            return
+
+        self.on_status("Atualizando índice vetorial...")
+        index = self.vector_index
+        if index is None:
+            index = self.load_vector_index()
+        else:
+            previous = removed_notes + [known_notes[note.path] for note in updated_notes
+                                        if note.path in known_notes]
+            with self.index_lock:
+                for note in previous:
+                    for ordinal in range(note.passages):
+                        index.remove(passage_key(note.path, ordinal))
+                self.generation += 1
+            passages = ((key, f"{title} {heading}\n{text}") for key, title, heading, text
+                        in self.note_store.iter_passages([note.path for note in updated_notes]))
+            for batch in batched(passages, self.VECTOR_BATCH):
+                with self.index_lock:
+                    index.add(batch)
+                    self.generation += 1
+
+            if index.needs_rebuild():
+                index = self.build_vector_index()
+            with self.index_lock:
+                self.save_vector_index(index)
+
+        with self.index_lock:
+            self.vector_index = index
+            self.generation += 1
+
+    # Busca
+
+    def find_relevant_passages(self, query, limit=5):
+        """Encontra os trechos mais relevantes combinando BM25 e, se disponível, o índice vetorial
+
+        Filtros na consulta (`tag:`, `path:`, `after:`...) restringem as notas antes de
+        qualquer pontuação de conteúdo.
+        """
+        with self.index_lock:
+            text, filters = self.metadata_index.parse_query(query)
+            paths = keys = None
+            if filters:
+                paths = self.metadata_index.select(filters)
+                keys = {passage_key(path, ordinal) for path in paths if path in self.notes_by_path
+                        for ordinal in range(self.notes_by_path[path].passages)}
+                trace = current_trace()
+                if trace is not None:
+                    trace.set('notas_filtradas', len(paths))
+                if not keys:
+                    return []
+
+            results = self.search_index.search(text, limit, keys)
+            vector_index = self.vector_index if self.vector_search_enabled() else None
+            vector_results = vector_index.search(text, limit, keys) if vector_index else []
+
+        # Sem índice em memória (ainda não carregado): buscar direto no FTS5
+        if not results and not len(self.search_index):
+            results = self.note_store.search(text, limit, paths)
+
+        if vector_results:
+            results = reciprocal_rank_fusion([results, vector_results], limit)
+
+        # Vizinhos no grafo de links das melhores notas sobem (ou entram) no ranking
+        if self.config['link_boost']:
+            with self.index_lock:
+                results = expand_with_neighbors(results, self.link_graph, limit, allowed=paths,
+                                                first_passage=self.metadata_index.first_passage)
+
+        # Só filtros, ou nada casou com o texto: as notas filtradas mais recentes, pelo
+        # primeiro trecho de conteúdo (não pelo frontmatter)
+        if not results and paths:
+            with self.index_lock:
+                recent = self.metadata_index.recent_first(paths)[:limit]
+                results = [(passage_key(path, self.metadata_index.first_passage(path)), 0.0) for path in recent]
+        return results
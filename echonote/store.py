@@ -0,0 +1,300 @@
+"""Armazenamento das notas em SQLite com busca textual FTS5"""
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from itertools import islice
+
+from .index import tokenize
+from .passages import passage_key
+
+
+class NoteStore:
+    """Armazena as notas em SQLite; o conteúdo fica dividido em trechos numa tabela FTS5"""
+
+    SCHEMA_VERSION = 3
+    BATCH_SIZE = 500
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_schema()
+
+    def create_schema(self):
+        """Cria as tabelas, recriando-as se o esquema salvo for de outra versão"""
+        with self.lock, self.conn:
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != self.SCHEMA_VERSION:
+                self.conn.executescript("""
+                    DROP TABLE IF EXISTS notes;
+                    DROP TABLE IF EXISTS notes_fts;
+                    DROP TABLE IF EXISTS passages;
+                    DROP TABLE IF EXISTS passages_fts;
+                    DROP TABLE IF EXISTS meta;
+                """)
+            self.conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS notes (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL UNIQUE,
+                    title TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL,
+                    hash TEXT,
+                    passages INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS passages (
+                    id INTEGER PRIMARY KEY,
+                    note_id INTEGER NOT NULL,
+                    ordinal INTEGER NOT NULL,
+                    heading TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    end INTEGER NOT NULL,
+                    UNIQUE (note_id, ordinal)
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5(
+                    title, heading, content, tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                PRAGMA user_version = {self.SCHEMA_VERSION};
+            """)
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def load_notes(self):
+        """Retorna os metadados de todas as notas (NoteRecord), sem o conteúdo"""
+        with self.lock:
+            rows = self.conn.execute("SELECT path, title, size, mtime, passages FROM notes ORDER BY path")
+            return [NoteRecord(*row) for row in rows]
+
+    def manifest(self):
+        """Retorna {caminho: {size, mtime, hash}} para o escaneamento incremental"""
+        with self.lock:
+            rows = self.conn.execute("SELECT path, size, mtime, hash FROM notes").fetchall()
+        return {path: {'size': size, 'mtime': mtime, 'hash': content_hash}
+                for path, size, mtime, content_hash in rows}
+
+    def get_hashes(self, paths):
+        """Retorna {caminho: hash do conteúdo} das notas pedidas"""
+        hashes = {}
+        with self.lock:
+            for batch in batched(list(set(paths)), self.BATCH_SIZE):
+                placeholders = ','.join('?' * len(batch))
+                hashes.update(self.conn.execute(
+                    f"SELECT path, hash FROM notes WHERE path IN ({placeholders})", batch
+                ))
+        return hashes
+
+    def get_content(self, path, max_chars=None):
+        """Carrega o conteúdo de uma nota sob demanda: completo, ou só os primeiros `max_chars` caracteres"""
+        parts = []
+        size = 0
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT passages_fts.content FROM notes "
+                "JOIN passages ON passages.note_id = notes.id "
+                "JOIN passages_fts ON passages_fts.rowid = passages.id "
+                "WHERE notes.path = ? ORDER BY passages.ordinal", (path,)
+            )
+            # Os trechos vêm em ordem: numa nota enorme, para de ler assim que tem o suficiente
+            for (text,) in rows:
+                parts.append(text)
+                size += len(text)
+                if max_chars is not None and size >= max_chars:
+                    break
+        content = ''.join(parts)
+        return content if max_chars is None else content[:max_chars]
+
+    def get_passages(self, keys):
+        """Carrega trechos pelo identificador; retorna {chave: dict com caminho, título, cabeçalho e texto}"""
+        passages = {}
+        with self.lock:
+            for key in keys:
+                path, _, ordinal = key.rpartition('#')
+                row = self.conn.execute(
+                    "SELECT notes.title, passages.heading, passages.start, passages.end, "
+                    "passages_fts.content FROM notes "
+                    "JOIN passages ON passages.note_id = notes.id "
+                    "JOIN passages_fts ON passages_fts.rowid = passages.id "
+                    "WHERE notes.path = ? AND passages.ordinal = ?", (path, int(ordinal))
+                ).fetchone()
+                if row:
+                    title, heading, start, end, text = row
+                    passages[key] = {'caminho': path, 'ordem': int(ordinal), 'título': title,
+                                     'cabeçalho': heading, 'início': start, 'fim': end, 'texto': text}
+        return passages
+
+    def iter_passages(self, paths=None):
+        """Gera (chave, título, cabeçalho, texto) dos trechos, sem carregar tudo na memória
+
+        Com `paths`, só os trechos dessas notas.
+        """
+        restriction, params = '', ()
+        if paths is not None:
+            restriction = " WHERE notes.path IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(list(paths)),)
+        # Conexão própria de leitura: o WAL permite ler enquanto outras threads usam self.conn
+        conn = sqlite3.connect(self.path)
+        try:
+            rows = conn.execute(
+                "SELECT notes.path, passages.ordinal, notes.title, passages.heading, "
+                "passages_fts.content FROM notes "
+                "JOIN passages ON passages.note_id = notes.id "
+                "JOIN passages_fts ON passages_fts.rowid = passages.id" + restriction, params
+            )
+            for path, ordinal, title, heading, text in rows:
+                yield passage_key(path, ordinal), title, heading, text
+        finally:
+            conn.close()
+
+    def search(self, query, limit=10, paths=None):
+        """Busca trechos com FTS5/BM25; retorna lista de (chave do trecho, pontuação)
+
+        Com `paths`, só os trechos dessas notas entram no resultado.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        match = ' OR '.join(f'"{term}"' for term in terms)
+        restriction, params = '', (match, limit)
+        if paths is not None:
+            restriction = "AND notes.path IN (SELECT value FROM json_each(?)) "
+            params = (match, json.dumps(list(paths)), limit)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT notes.path, passages.ordinal, -bm25(passages_fts, 3.0, 3.0, 1.0) AS score "
+                "FROM passages_fts "
+                "JOIN passages ON passages.id = passages_fts.rowid "
+                "JOIN notes ON notes.id = passages.note_id "
+                f"WHERE passages_fts MATCH ? {restriction}ORDER BY score DESC LIMIT ?", params
+            ).fetchall()
+        return [(passage_key(path, ordinal), score) for path, ordinal, score in rows]
+
+    def apply_changes(self, upserts=(), touched=(), deletes=()):
+        """Grava notas novas/alteradas (com seus trechos), metadados e remoções em transações por lote"""
+        with self.lock:
+            for batch in batched(list(deletes), self.BATCH_SIZE):
+                with self.conn:
+                    for path in batch:
+                        self.delete_note(path)
+            
+            for batch in batched(upserts, self.BATCH_SIZE):
+                with self.conn:
+                    for note, content_hash, passages in batch:
+                        self.delete_note(note.path)
+                        note_id = self.insert_note(note, note.mtime, content_hash, len(passages))
+                        self.insert_passages(note_id, note.title, passages)
+            
+            for batch in batched(list(touched), self.BATCH_SIZE):
+                with self.conn:
+                    self.conn.executemany(
+                        "UPDATE notes SET size = ?, mtime = ? WHERE path = ?",
+                        [(note.size, note.mtime, note.path) for note in batch]
+                    )
+
+    def write_streamed_note(self, note, content_hash, passages):
+        """Grava uma nota cujos trechos chegam aos poucos, em transações por lote; retorna quantos trechos gravou
+
+        Data e hash só são gravados no fim: se a gravação for interrompida, o
+        manifesto não reconhece a nota e o próximo escaneamento a relê.
+        """
+        with self.lock, self.conn:
+            self.delete_note(note.path)
+            note_id = self.insert_note(note, None, None, 0)
+        count = 0
+        for batch in batched(passages, self.BATCH_SIZE):
+            with self.lock, self.conn:
+                self.insert_passages(note_id, note.title, batch)
+            count += len(batch)
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE notes SET mtime = ?, hash = ?, passages = ? WHERE id = ?",
+                              (note.mtime, content_hash, count, note_id))
+        return count
+
+    def insert_note(self, note, mtime, content_hash, passages):
+        return self.conn.execute(
+            "INSERT INTO notes (path, title, size, mtime, hash, passages) VALUES (?, ?, ?, ?, ?, ?)",
+            (note.path, note.title, note.size, mtime, content_hash, passages)
+        ).lastrowid
+
+    def insert_passages(self, note_id, title, passages):
+        for passage in passages:
+            passage_id = self.conn.execute(
+                "INSERT INTO passages (note_id, ordinal, heading, start, end) VALUES (?, ?, ?, ?, ?)",
+                (note_id, passage.ordinal, passage.heading, passage.start, passage.end)
+            ).lastrowid
+            self.conn.execute(
+                "INSERT INTO passages_fts (rowid, title, heading, content) VALUES (?, ?, ?, ?)",
+                (passage_id, title, passage.heading, passage.text)
+            )
+
+    def delete_note(self, path):
+        row = self.conn.execute("SELECT id FROM notes WHERE path = ?", (path,)).fetchone()
+        if row:
+            self.conn.execute(
+                "DELETE FROM passages_fts WHERE rowid IN (SELECT id FROM passages WHERE note_id = ?)", row
+            )
+            self.conn.execute("DELETE FROM passages WHERE note_id = ?", row)
+            self.conn.execute("DELETE FROM notes WHERE id = ?", row)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def batched(items, size):
+    """Divide uma sequência (ou um gerador, consumido aos poucos) em lotes de até `size` itens"""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def format_file_size(size_bytes):
+    """Formata o tamanho do arquivo em formato legível"""
+    if size_bytes < 1024:
+        return f"{size_bytes} B"
+    elif size_bytes < 1024**2:
+        return f"{size_bytes/1024:.1f} KB"
+    else:
+        return f"{size_bytes/(1024**2):.1f} MB"
+
+
+def format_timestamp(mtime):
+    """Formata a data de modificação para exibição ('' se desconhecida)"""
+    return datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M") if mtime else ''
+
+
+class NoteRecord:
+    """Metadados de uma nota mantidos em memória; o conteúdo fica no banco
+
+    Com `__slots__` cada nota ocupa poucos bytes além das próprias strings, e os
+    textos de exibição (tamanho, data) são formatados só quando a linha aparece.
+    """
+
+    __slots__ = ('path', 'title', 'size', 'mtime', 'passages')
+
+    def __init__(self, path, title, size, mtime, passages=0):
+        self.path = path
+        self.title = title
+        self.size = size
+        self.mtime = mtime
+        self.passages = passages
+
+    def __repr__(self):
+        return f"NoteRecord({self.path!r}, {self.size} B, {self.passages} trechos)"
@@ -0,0 +1,110 @@
+"""Resumos das notas feitos pela IA, guardados pelo hash do conteúdo, e as perguntas amplas respondidas sobre eles"""
+import re
+import sqlite3
+import threading
+import time
+
+from .passages import estimate_tokens
+from .store import batched
+
+# Perguntas sobre muitas notas de uma vez: "resuma...", "visão geral", "tudo o que anotei sobre..."
+BROAD_PATTERN = re.compile(
+    r"\b(resum[aeio]\w*|sintetiz\w*|vis[aã]o geral|panorama|tudo (o )?que|todas as (minhas )?(notas|anota[cç][oõ]es)"
+    r"|principais (temas|ideias|pontos|assuntos))\b",
+    re.IGNORECASE
+)
+
+
+def is_broad_question(question):
+    """Indica se a pergunta pede uma visão de muitas notas (respondida sobre os resumos)"""
+    return BROAD_PATTERN.search(question) is not None
+
+
+def split_for_summary(text, max_chars):
+    """Divide o texto em partes de até `max_chars` caracteres, de preferência em quebras de linha"""
+    parts = []
+    while len(text) > max_chars:
+        cut = text.rfind('\n', max_chars // 2, max_chars)
+        if cut == -1:
+            cut = max_chars
+        parts.append(text[:cut])
+        text = text[cut:]
+    if text.strip():
+        parts.append(text)
+    return parts
+
+
+def summary_block(path, title, summary):
+    """Bloco de um resumo no contexto enviado à IA"""
+    return f"=== {title} (resumo) ===\nArquivo: {path}\n{summary.strip()}\n\n"
+
+
+def group_blocks(blocks, token_budget):
+    """Junta os blocos em grupos que cabem no orçamento de tokens, na ordem recebida"""
+    groups = [[]]
+    remaining = token_budget
+    for block in blocks:
+        cost = estimate_tokens(block)
+        if cost > remaining and groups[-1]:
+            groups.append([])
+            remaining = token_budget
+        groups[-1].append(block)
+        remaining -= cost
+    return [group for group in groups if group]
+
+
+class SummaryCache:
+    """Resumos das notas em disco (SQLite), pelo hash do conteúdo: nota que não muda nunca é resumida de novo
+
+    A `version` (modelo e versão do prompt de resumo) faz parte da chave; renomear
+    ou mover uma nota não perde o resumo, e notas idênticas dividem o mesmo.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    hash TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (hash, version)
+                )
+            """)
+
+    def get_many(self, hashes, version):
+        """Retorna {hash: resumo} dos hashes que já têm resumo nesta versão"""
+        summaries = {}
+        with self.lock:
+            for batch in batched(list(set(hashes)), self.BATCH_SIZE):
+                placeholders = ','.join('?' * len(batch))
+                summaries.update(self.conn.execute(
+                    f"SELECT hash, summary FROM summaries WHERE version = ? AND hash IN ({placeholders})",
+                    (version, *batch)
+                ))
+        return summaries
+
+    def put(self, content_hash, version, summary):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries (hash, version, summary, created) VALUES (?, ?, ?, ?)",
+                (content_hash, version, summary, time.time())
+            )
+
+    def prune(self, live_hashes, version):
+        """Descarta resumos de outras versões e de conteúdos que não existem mais; retorna quantos"""
+        live_hashes = set(live_hashes)
+        with self.lock, self.conn:
+            stale = [(content_hash, stored_version) for content_hash, stored_version
+                     in self.conn.execute("SELECT hash, version FROM summaries")
+                     if stored_version != version or content_hash not in live_hashes]
+            self.conn.executemany("DELETE FROM summaries WHERE hash = ? AND version = ?", stale)
+        return len(stale)
+
+    def count(self, version):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM summaries WHERE version = ?", (version,)).fetchone()[0]
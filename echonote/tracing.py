@@ -0,0 +1,215 @@
+"""Medição por etapas (spans) e registro das métricas em JSONL"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+_local = threading.local()
+
+
+class Trace:
+    """Tempos das etapas de uma operação (uma pergunta, um escaneamento) e valores associados"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.values = {}
+
+    @contextmanager
+    def span(self, name):
+        """Mede o bloco e soma o tempo à etapa `name` (em ms)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name, milliseconds):
+        self.spans[name] = self.spans.get(name, 0.0) + milliseconds
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def since_start(self):
+        """Milissegundos desde o início da operação"""
+        return (time.perf_counter() - self.started) * 1000
+
+    def finish(self):
+        """Registra a etapa 'total' com o tempo decorrido desde o início"""
+        self.spans['total'] = self.since_start()
+        return self
+
+    @contextmanager
+    def activate(self):
+        """Torna este trace o ativo na thread atual, para `span()` e o cliente HTTP"""
+        previous = getattr(_local, 'trace', None)
+        _local.trace = self
+        try:
+            yield self
+        finally:
+            _local.trace = previous
+
+    def timings(self):
+        """Tempos de cada etapa em ms, arredondados"""
+        return {name: round(milliseconds, 1) for name, milliseconds in self.spans.items()}
+
+
+def current_trace():
+    """Trace ativo na thread atual, ou None"""
+    return getattr(_local, 'trace', None)
+
+
+def span(name):
+    """Mede o bloco no trace ativo; sem trace ativo não faz nada"""
+    trace = current_trace()
+    return trace.span(name) if trace is not None else nullcontext()
+
+
+def format_duration(milliseconds):
+    """Formata uma duração curta: '850 ms', '1.2 s'"""
+    if milliseconds >= 1000:
+        return f"{milliseconds / 1000:.1f} s"
+    return f"{milliseconds:.0f} ms"
+
+
+# Etapas mostradas no resumo, na ordem em que acontecem
+SPAN_LABELS = (
+    ('fila', 'fila'),
+    ('varredura', 'varredura'),
+    ('leitura', 'leitura'),
+    ('indexação', 'indexação'),
+    ('gravação', 'gravação'),
+    ('vetores', 'vetores'),
+    ('busca', 'busca'),
+    ('contexto', 'contexto'),
+    ('api_total', 'API'),
+    ('renderização', 'renderização'),
+)
+API_DETAILS = (
+    ('api_conexão', 'conexão'),
+    ('api_primeiro_byte', '1º byte'),
+    ('api_primeiro_texto', '1º texto'),
+)
+
+
+def describe_timings(timings):
+    """Resumo de uma linha: 'busca 12 ms · contexto 3 ms · API 1.1 s (conexão 40 ms, 1º byte 300 ms)'"""
+    parts = []
+    for name, label in SPAN_LABELS:
+        if name not in timings:
+            continue
+        text = f"{label} {format_duration(timings[name])}"
+        if name == 'api_total':
+            details = [f"{detail} {format_duration(timings[key])}" for key, detail in API_DETAILS if key in timings]
+            if details:
+                text += f" ({', '.join(details)})"
+        parts.append(text)
+    return ' · '.join(parts)
+
+
+def percentile(values, fraction):
+    """Percentil com interpolação linear sobre uma lista já ordenada"""
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class MetricsLog:
+    """Arquivo JSONL com uma linha por operação e agregados de uma janela móvel
+
+    Cada linha traz os tempos por etapa, tokens e, para a janela das últimas
+    operações do mesmo tipo, p50/p95 de cada etapa e as taxas de acerto dos caches.
+    O arquivo é podado para as `max_records` linhas mais recentes.
+    """
+
+    def __init__(self, path, window=200, max_records=5000):
+        self.path = path
+        self.window = window
+        self.max_records = max_records
+        self.lock = threading.Lock()
+        self.recent = defaultdict(lambda: deque(maxlen=window))
+        self.line_count = 0
+        self.load_recent()
+
+    def load_recent(self):
+        """Recupera a janela móvel a partir das últimas linhas do arquivo"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self.line_count += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.recent[record.get('tipo')].append(record)
+        except OSError as e:
+            print(f"Erro ao ler métricas: {e}")
+
+    def record(self, trace):
+        """Acrescenta a operação ao arquivo e retorna o registro gravado"""
+        record = {
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'tipo': trace.kind,
+            'etapas_ms': {name: round(value, 1) for name, value in trace.spans.items()},
+            **trace.values
+        }
+
+        with self.lock:
+            recent = self.recent[trace.kind]
+            recent.append(record)
+            record['janela'] = self.aggregate(recent)
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                self.line_count += 1
+                if self.line_count > self.max_records * 1.2:
+                    self.prune()
+            except OSError as e:
+                print(f"Erro ao gravar métricas: {e}")
+        return record
+
+    @staticmethod
+    def aggregate(records):
+        """p50/p95 de cada etapa e taxas de acerto dos caches (respostas e buscas) na janela"""
+        durations = defaultdict(list)
+        for record in records:
+            for name, value in record['etapas_ms'].items():
+                durations[name].append(value)
+
+        summary = {'n': len(records), 'p50_ms': {}, 'p95_ms': {}}
+        for name, values in durations.items():
+            values.sort()
+            summary['p50_ms'][name] = round(percentile(values, 0.5), 1)
+            summary['p95_ms'][name] = round(percentile(values, 0.95), 1)
+
+        cached = [record['em_cache'] for record in records if 'em_cache' in record]
+        if cached:
+            summary['taxa_cache'] = round(sum(cached) / len(cached), 3)
+        cached = [record['busca_em_cache'] for record in records if 'busca_em_cache' in record]
+        if cached:
+            summary['taxa_cache_busca'] = round(sum(cached) / len(cached), 3)
+        return summary
+
+    def prune(self):
+        """Mantém só as linhas mais recentes, reescrevendo o arquivo de uma vez"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            lines = deque(f, maxlen=self.max_records)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        os.replace(temporary, self.path)
+        self.line_count = len(lines)
+
+    def summary(self, kind):
+        """Agregados atuais da janela de um tipo de operação"""
+        with self.lock:
+            return self.aggregate(self.recent[kind])
@@ -0,0 +1,57 @@
+"""Sessão HTTP do cliente da API, com o tempo de abertura das conexões somado ao trace
+
+Fica separado de gemini.py para que o `requests` (e o urllib3) só seja importado na
+primeira chamada à API, e não na abertura do programa.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .tracing import span
+
+# Falhas de rede que valem uma nova tentativa
+NETWORK_ERRORS = (requests.ConnectionError, requests.Timeout)
+# Falhas ao ler uma resposta já começada (conexão cortada no meio do streaming)
+READ_ERRORS = (requests.RequestException,)
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        with span('api_conexão'):
+            super().connect()
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # Inclui o handshake TLS
+        with span('api_conexão'):
+            super().connect()
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TracingAdapter(HTTPAdapter):
+    """Adaptador que soma ao trace ativo o tempo gasto abrindo conexões novas"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool
+        }
+
+
+def new_session(pool_maxsize):
+    """Sessão com conexões keep-alive e o adaptador que mede as conexões novas"""
+    session = requests.Session()
+    adapter = TracingAdapter(pool_connections=2, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -0,0 +1,324 @@
+"""Índice vetorial local (TF-IDF esparso ou LSA) para busca semântica sem rede"""
+import os
+import json
+from array import array
+from collections import Counter
+from importlib.util import find_spec
+
+from .index import tokenize
+
+# O NumPy só é importado quando um índice vetorial é aberto ou construído (ver load_numpy);
+# sem ele a busca vetorial fica desativada
+NUMPY_AVAILABLE = find_spec('numpy') is not None
+np = None
+
+
+def load_numpy():
+    """Importa o NumPy na primeira vez que é preciso; retorna o módulo (ou None se não instalado)"""
+    global np
+    if np is None and NUMPY_AVAILABLE:
+        import numpy
+        np = numpy
+    return np
+
+
+class VectorIndex:
+    """Índice vetorial local: TF-IDF esparso, opcionalmente reduzido por SVD truncada (LSA)"""
+
+    VERSION = 1
+    MAX_TERMS = 100000
+    OVERSAMPLING = 10
+    POWER_ITERATIONS = 1
+    BLOCK_NNZ = 1 << 14  # blocos pequenos cabem no cache da CPU e limitam a memória temporária
+    REBUILD_RATIO = 0.25
+    # No modo LSA quase todo trecho tem alguma similaridade com a consulta (até ruído de
+    # arredondamento); abaixo disso não é parecido e não entra na fusão com o BM25
+    MIN_SIMILARITY = 0.1
+
+    def __init__(self):
+        load_numpy()
+        self.keys = []             # linha -> chave do trecho
+        self.key_to_row = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.vocabulary = {}       # termo -> coluna
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.components = None     # k × termos (modo LSA)
+        self.matrix = None         # linhas × k, float32 e normalizado (modo LSA)
+        self.indptr = self.indices = self.data = self.row_ids = None  # CSR (modo esparso)
+        self.changes = 0           # trechos incluídos/removidos desde a última construção
+        self.requested_dimensions = None  # `dimensions` da construção (a SVD é pulada em coleções pequenas)
+        self.stamp = None
+
+    def __len__(self):
+        return len(self.key_to_row)
+
+    @property
+    def dimensions(self):
+        return 0 if self.components is None else self.components.shape[0]
+
+    def needs_rebuild(self):
+        """Indica se acumulou mudanças demais para continuar apenas projetando novos trechos"""
+        return self.changes > self.REBUILD_RATIO * max(len(self.keys), 1)
+
+    @classmethod
+    def build(cls, passages, dimensions=128, seed=0):
+        """Constrói o índice a partir de (chave, texto); `dimensions` 0 mantém só o TF-IDF esparso"""
+        index = cls()
+        index.requested_dimensions = dimensions
+        term_ids = {}
+        indptr = array('q', [0])
+        indices = array('i')
+        counts = array('f')
+        
+        # Passagem única: contagens por trecho com ids provisórios de termo
+        for key, text in passages:
+            for term, freq in Counter(tokenize(text)).items():
+                indices.append(term_ids.setdefault(term, len(term_ids)))
+                counts.append(freq)
+            indptr.append(len(indices))
+            index.key_to_row[key] = len(index.keys)
+            index.keys.append(key)
+        
+        doc_count = len(index.keys)
+        index.alive = np.ones(doc_count, dtype=bool)
+        if not doc_count or not term_ids:
+            index.indptr = np.zeros(doc_count + 1, dtype=np.int64)
+            index.indices = np.zeros(0, dtype=np.int32)
+            index.data = np.zeros(0, dtype=np.float32)
+            index.row_ids = np.zeros(0, dtype=np.int32)
+            return index
+        
+        indptr = np.frombuffer(indptr, dtype=np.int64)
+        indices = np.frombuffer(indices, dtype=np.int32)
+        counts = np.frombuffer(counts, dtype=np.float32)
+        row_ids = np.repeat(np.arange(doc_count, dtype=np.int32), np.diff(indptr))
+        
+        # Vocabulário: descarta termos únicos (em coleções não triviais) e limita aos mais frequentes
+        df = np.bincount(indices, minlength=len(term_ids))
+        keep = df >= (2 if doc_count >= 50 else 1)
+        if keep.sum() > cls.MAX_TERMS:
+            keep[np.argsort(-df, kind='stable')[cls.MAX_TERMS:]] = False
+        remap = np.full(len(term_ids), -1, dtype=np.int32)
+        remap[keep] = np.arange(keep.sum(), dtype=np.int32)
+        index.vocabulary = {term: int(remap[i]) for term, i in term_ids.items() if keep[i]}
+        
+        mask = remap[indices] >= 0
+        indices = remap[indices][mask]
+        counts = counts[mask]
+        row_ids = row_ids[mask]
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(row_ids, minlength=doc_count))))
+        
+        # Pesos TF-IDF sublineares, com linhas normalizadas (L2)
+        index.idf = (np.log((1 + doc_count) / (1 + df[keep])) + 1).astype(np.float32)
+        data = ((1 + np.log(counts)) * index.idf[indices]).astype(np.float32)
+        norms = np.sqrt(np.bincount(row_ids, weights=data * data, minlength=doc_count))
+        data /= np.maximum(norms, 1e-12)[row_ids].astype(np.float32)
+        
+        k = min(dimensions, doc_count - 1, len(index.vocabulary) - 1)
+        if k < 2:
+            index.indptr, index.indices, index.data, index.row_ids = indptr, indices, data, row_ids
+            return index
+        
+        index.reduce(indptr, indices, data, row_ids, k, seed)
+        return index
+
+    def reduce(self, indptr, indices, data, row_ids, k, seed):
+        """SVD truncada aleatorizada (Halko et al.) da matriz TF-IDF esparsa"""
+        term_count = len(self.vocabulary)
+        rng = np.random.default_rng(seed)
+        
+        # Transposta em CSR para calcular Aᵀ·B com a mesma rotina
+        order = np.argsort(indices, kind='stable')
+        t_indptr = np.concatenate(([0], np.cumsum(np.bincount(indices, minlength=term_count))))
+        t_indices, t_data = row_ids[order], data[order]
+        
+        width = k + self.OVERSAMPLING
+        basis = rng.standard_normal((term_count, width)).astype(np.float32)
+        sample = self.sparse_dot(indptr, indices, data, basis)
+        for _ in range(self.POWER_ITERATIONS):
+            q, _ = np.linalg.qr(sample)
+            z, _ = np.linalg.qr(self.sparse_dot(t_indptr, t_indices, t_data, q))
+            sample = self.sparse_dot(indptr, indices, data, z)
+        q, _ = np.linalg.qr(sample)
+        
+        small = self.sparse_dot(t_indptr, t_indices, t_data, q).T
+        u, sigma, vt = np.linalg.svd(small, full_matrices=False)
+        
+        self.components = np.ascontiguousarray(vt[:k], dtype=np.float32)
+        matrix = (q @ u[:, :k]) * sigma[:k]
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self.matrix = matrix.astype(np.float32)
+
+    @classmethod
+    def sparse_dot(cls, indptr, indices, data, dense):
+        """Produto CSR × matriz densa em blocos, sem materializar nnz × colunas de uma vez"""
+        rows = len(indptr) - 1
+        out = np.zeros((rows, dense.shape[1]), dtype=np.float32)
+        non_empty = np.flatnonzero(np.diff(indptr))
+        start = 0
+        while start < len(non_empty):
+            first = indptr[non_empty[start]]
+            stop = int(np.searchsorted(indptr[non_empty], first + cls.BLOCK_NNZ, side='left'))
+            stop = max(stop, start + 1)
+            block_rows = non_empty[start:stop]
+            last = indptr[block_rows[-1] + 1]
+            products = data[first:last, None] * dense[indices[first:last]]
+            out[block_rows] = np.add.reduceat(products, indptr[block_rows] - first, axis=0)
+            start = stop
+        return out
+
+    def vectorize(self, text):
+        """TF-IDF normalizado de um texto no vocabulário do índice; retorna (colunas, pesos)"""
+        counts = Counter(term for term in tokenize(text) if term in self.vocabulary)
+        if not counts:
+            return None, None
+        columns = np.fromiter((self.vocabulary[term] for term in counts), dtype=np.int32, count=len(counts))
+        weights = (1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts))))
+        weights *= self.idf[columns]
+        weights /= np.linalg.norm(weights)
+        return columns, weights.astype(np.float32)
+
+    def project(self, columns, weights):
+        """Projeta um vetor TF-IDF no espaço LSA (normalizado)"""
+        vector = self.components[:, columns] @ weights
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, items):
+        """Inclui ou substitui trechos projetando-os no espaço existente (fold-in)"""
+        rows = []
+        for key, text in items:
+            self.remove(key)
+            columns, weights = self.vectorize(text)
+            self.key_to_row[key] = len(self.keys) + len(rows)
+            rows.append((columns, weights))
+        if not rows:
+            return
+        
+        self.keys.extend(key for key, _ in items)
+        self.alive = np.concatenate((self.alive, np.ones(len(rows), dtype=bool)))
+        self.changes += len(rows)
+        
+        if self.components is not None:
+            new_rows = np.zeros((len(rows), self.dimensions), dtype=np.float32)
+            for i, (columns, weights) in enumerate(rows):
+                if columns is not None:
+                    new_rows[i] = self.project(columns, weights)
+            self.matrix = np.concatenate((self.matrix, new_rows))
+        else:
+            empty = np.zeros(0, dtype=np.int32)
+            first_row = len(self.indptr) - 1
+            new_indices = [columns if columns is not None else empty for columns, _ in rows]
+            new_data = [weights if weights is not None else empty.astype(np.float32) for _, weights in rows]
+            lengths = [len(columns) for columns in new_indices]
+            self.indices = np.concatenate([self.indices] + new_indices)
+            self.data = np.concatenate([self.data] + new_data)
+            self.row_ids = np.concatenate((self.row_ids, np.repeat(
+                np.arange(first_row, first_row + len(rows), dtype=np.int32), lengths)))
+            self.indptr = np.concatenate((self.indptr, self.indptr[-1] + np.cumsum(lengths)))
+
+    def remove(self, key):
+        row = self.key_to_row.pop(key, None)
+        if row is not None:
+            self.alive[row] = False
+            self.changes += 1
+
+    def search(self, query, limit=10, keys=None):
+        """Retorna as `limit` chaves mais próximas da consulta como lista de (chave, similaridade)
+
+        Com `keys`, só as linhas desses trechos são lidas e pontuadas. No modo LSA, só
+        entram trechos com similaridade a partir de MIN_SIMILARITY.
+        """
+        if not self.key_to_row:
+            return []
+        columns, weights = self.vectorize(query)
+        if columns is None:
+            return []
+        
+        rows = None
+        if keys is not None:
+            rows = np.array(sorted(self.key_to_row[key] for key in keys if key in self.key_to_row), dtype=np.int64)
+            if not len(rows):
+                return []
+        
+        if self.components is not None:
+            matrix = self.matrix if rows is None else self.matrix[rows]
+            scores = np.asarray(matrix @ self.project(columns, weights))
+        else:
+            dense_query = np.zeros(len(self.vocabulary), dtype=np.float32)
+            dense_query[columns] = weights
+            if rows is None:
+                scores = np.bincount(self.row_ids, weights=self.data * dense_query[self.indices],
+                                     minlength=len(self.keys))
+            else:
+                # Posições dos valores não nulos de cada linha pedida, concatenadas
+                starts, lengths = self.indptr[rows], np.diff(self.indptr)[rows]
+                offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+                owners = np.repeat(np.arange(len(rows)), lengths)
+                scores = np.bincount(owners, weights=self.data[offsets] * dense_query[self.indices[offsets]],
+                                     minlength=len(rows))
+        
+        scores = np.where(self.alive if rows is None else self.alive[rows], scores, -np.inf)
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        top_rows = top if rows is None else rows[top]
+        minimum = self.MIN_SIMILARITY if self.components is not None else 0.0
+        return [(self.keys[row], float(scores[position])) for position, row in zip(top, top_rows)
+                if scores[position] > minimum]
+
+    def save(self, path):
+        """Grava o índice: metadados em `path`.npz e a matriz LSA em `path`.npy (lida via mmap)"""
+        self.stamp = os.urandom(8).hex()
+        alive_keys = [key if self.alive[row] else None for row, key in enumerate(self.keys)]
+        arrays = {
+            'meta': np.array(json.dumps({
+                'version': self.VERSION,
+                'stamp': self.stamp,
+                'changes': self.changes,
+                'requested_dimensions': self.requested_dimensions,
+                'keys': alive_keys,
+                'vocabulary': sorted(self.vocabulary, key=self.vocabulary.get),
+            })),
+            'idf': self.idf,
+        }
+        if self.components is not None:
+            arrays['components'] = self.components
+            tmp_matrix = f"{path}.tmp.npy"
+            np.save(tmp_matrix, np.asarray(self.matrix))
+            self.matrix = None  # libera o mmap antigo antes de substituir o arquivo
+            os.replace(tmp_matrix, f"{path}.npy")
+            self.matrix = np.load(f"{path}.npy", mmap_mode='r')
+        else:
+            arrays.update(indptr=self.indptr, indices=self.indices, data=self.data, row_ids=self.row_ids)
+        
+        tmp_meta = f"{path}.tmp.npz"
+        np.savez(tmp_meta, **arrays)
+        os.replace(tmp_meta, f"{path}.npz")
+        return self.stamp
+
+    @classmethod
+    def load(cls, path):
+        """Carrega um índice salvo; retorna None se o arquivo for de outra versão"""
+        load_numpy()
+        with np.load(f"{path}.npz") as arrays:
+            meta = json.loads(str(arrays['meta']))
+            if meta['version'] != cls.VERSION:
+                return None
+            index = cls()
+            index.idf = arrays['idf']
+            if 'components' in arrays:
+                index.components = arrays['components']
+                index.matrix = np.load(f"{path}.npy", mmap_mode='r')
+            else:
+                index.indptr, index.indices = arrays['indptr'], arrays['indices']
+                index.data, index.row_ids = arrays['data'], arrays['row_ids']
+        
+        index.stamp = meta['stamp']
+        index.changes = meta['changes']
+        index.requested_dimensions = meta.get('requested_dimensions')
+        index.keys = meta['keys']
+        index.alive = np.array([key is not None for key in index.keys], dtype=bool)
+        index.key_to_row = {key: row for row, key in enumerate(index.keys) if key is not None}
+        index.vocabulary = {term: column for column, term in enumerate(meta['vocabulary'])}
+        return index